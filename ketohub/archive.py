@@ -0,0 +1,156 @@
+"""Single-file snapshot archives with a random-access index.
+
+A snapshot archive is an ordinary tar file (so standard tools can still
+unpack it) plus an index file alongside it. Every line of the index is
+`<member name>\t<data offset>\t<size>`, which lets ArchiveReader fetch any
+recipe with a single slice of a memory-mapped archive instead of scanning or
+unpacking the tar.
+"""
+
+import io
+import json
+import mmap
+import os
+import tarfile
+import threading
+import time
+
+ARCHIVE_FILENAME = 'snapshot.tar'
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def _index_path(archive_path):
+    return archive_path + '.idx'
+
+
+def _padded_size(size):
+    blocks, remainder = divmod(size, tarfile.BLOCKSIZE)
+    if remainder:
+        blocks += 1
+    return blocks * tarfile.BLOCKSIZE
+
+
+def get_writer(archive_path, root):
+    """Returns the process-wide writer for archive_path, opening it if needed.
+
+    Spiders that run in the same process share one writer per archive, so
+    each caller must call release() on the writer once it's done with it.
+
+    Args:
+        archive_path: Path to the tar archive to append to.
+        root: Snapshot root that member names are relative to.
+
+    Returns:
+        An ArchiveWriter.
+    """
+    with _writers_lock:
+        writer = _writers.get(archive_path)
+        if writer is None:
+            writer = ArchiveWriter(archive_path, root)
+            _writers[archive_path] = writer
+        writer._references += 1
+        return writer
+
+
+class ArchiveWriter(object):
+    """Appends files to a snapshot archive and records them in its index."""
+
+    def __init__(self, archive_path, root):
+        self._archive_path = archive_path
+        self._root = root
+        self._lock = threading.Lock()
+        self._references = 0
+        directory = os.path.dirname(archive_path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._tar = tarfile.open(archive_path, 'a')
+        self._index = open(_index_path(archive_path), 'a')
+
+    def write_file(self, filepath, content):
+        """Appends content to the archive under filepath's snapshot path."""
+        if not isinstance(content, bytes):
+            content = content.encode('utf8')
+        name = os.path.relpath(filepath, self._root).replace(os.sep, '/')
+        tarinfo = tarfile.TarInfo(name)
+        tarinfo.size = len(content)
+        tarinfo.mtime = time.time()
+        with self._lock:
+            self._tar.addfile(tarinfo, io.BytesIO(content))
+            data_offset = self._tar.offset - _padded_size(len(content))
+            # Flush the archive before the index so the index never points at
+            # data that hasn't reached the file yet.
+            self._tar.fileobj.flush()
+            self._index.write('%s\t%d\t%d\n' %
+                              (name, data_offset, len(content)))
+            self._index.flush()
+
+    def link_file(self, source_path, filepath):
+        """Copies a file saved by a previous crawl into the archive."""
+        with open(source_path, 'rb') as f:
+            self.write_file(filepath, f.read())
+
+    def release(self):
+        """Closes the archive once the last user has released it."""
+        with _writers_lock:
+            self._references -= 1
+            if self._references > 0:
+                return
+            _writers.pop(self._archive_path, None)
+        with self._lock:
+            self._tar.close()
+            self._index.close()
+
+
+class ArchiveReader(object):
+    """Reads individual recipes from a snapshot archive without unpacking it."""
+
+    def __init__(self, archive_path):
+        self._entries = {}
+        with open(_index_path(archive_path)) as index:
+            for line in index:
+                name, offset, size = line.rstrip('\n').split('\t')
+                # Later entries win, matching tar semantics for repeated names.
+                self._entries[name] = (int(offset), int(size))
+        self._file = open(archive_path, 'rb')
+        if self._entries:
+            self._data = mmap.mmap(self._file.fileno(),
+                                   0,
+                                   access=mmap.ACCESS_READ)
+        else:
+            self._data = b''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def __contains__(self, key):
+        return key + '/index.html' in self._entries
+
+    def keys(self):
+        """Returns the keys of all recipes whose HTML is in the archive."""
+        suffix = '/index.html'
+        return [
+            name[:-len(suffix)]
+            for name in self._entries
+            if name.endswith(suffix)
+        ]
+
+    def read(self, name):
+        """Returns the content of the archive member with the given name."""
+        offset, size = self._entries[name]
+        return self._data[offset:offset + size]
+
+    def read_recipe_html(self, key):
+        return self.read(key + '/index.html')
+
+    def read_metadata(self, key):
+        return json.loads(self.read(key + '/metadata.json').decode('utf8'))
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
@@ -0,0 +1,117 @@
+"""Pauses crawling while the process uses too much memory.
+
+Scrapy's MemoryUsage extension can only stop a crawl that passes its memory
+limit. MemoryBackpressure instead pauses the engine, so no new requests are
+scheduled, while the process's resident set size is above
+MEMORY_BACKPRESSURE_LIMIT_MB. Requests already in flight still finish and
+their items are saved, which frees their memory, and the crawl resumes once
+RSS drops below MEMORY_BACKPRESSURE_RESUME_RATIO of the limit.
+
+Python doesn't always hand freed memory back to the operating system, so if
+nothing is left in flight and RSS is still over the limit, waiting won't help
+and the crawl is resumed anyway.
+"""
+
+import gc
+import logging
+import os
+
+from scrapy import exceptions
+from scrapy import signals
+from twisted.internet import task
+
+logger = logging.getLogger(__name__)
+
+_STATM_PATH = '/proc/self/statm'
+
+
+def current_rss_bytes():
+    """Returns the resident set size of this process, or None if unknown."""
+    try:
+        with open(_STATM_PATH) as f:
+            resident_pages = int(f.read().split()[1])
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE')
+
+
+class MemoryBackpressure(object):
+    """Extension that pauses the engine while RSS is over a ceiling."""
+
+    def __init__(self, crawler, rss_fn=current_rss_bytes):
+        settings = crawler.settings
+        limit_mb = settings.getint('MEMORY_BACKPRESSURE_LIMIT_MB')
+        if not limit_mb:
+            raise exceptions.NotConfigured()
+        if rss_fn() is None:
+            logger.warning('Memory backpressure is disabled because this '
+                           'platform doesn\'t report the process\'s RSS')
+            raise exceptions.NotConfigured()
+        self._crawler = crawler
+        self._stats = crawler.stats
+        self._rss_fn = rss_fn
+        self._limit_bytes = limit_mb * 1024 * 1024
+        self._resume_bytes = self._limit_bytes * settings.getfloat(
+            'MEMORY_BACKPRESSURE_RESUME_RATIO')
+        self._check_interval = settings.getfloat(
+            'MEMORY_BACKPRESSURE_CHECK_INTERVAL')
+        self._check_task = None
+        self._paused = False
+        crawler.signals.connect(self._spider_opened,
+                                signal=signals.spider_opened)
+        crawler.signals.connect(self._spider_closed,
+                                signal=signals.spider_closed)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def _spider_opened(self, spider):
+        self._check_task = task.LoopingCall(self._check, spider)
+        self._check_task.start(self._check_interval, now=False)
+
+    def _spider_closed(self, spider):
+        if self._check_task and self._check_task.running:
+            self._check_task.stop()
+
+    def _check(self, spider):
+        rss = self._rss_fn()
+        self._stats.max_value('memory_backpressure/max_rss', rss, spider=spider)
+        engine = self._crawler.engine
+        if not self._paused:
+            if rss > self._limit_bytes:
+                self._pause(engine, rss, spider)
+            return
+        if rss < self._resume_bytes:
+            logger.info('RSS down to %.0f MB, resuming crawl',
+                        rss / 1024.0 / 1024.0,
+                        extra={'spider': spider})
+            self._resume(engine)
+        elif self._is_drained(engine):
+            logger.warning(
+                'RSS still at %.0f MB with nothing in flight, resuming crawl',
+                rss / 1024.0 / 1024.0,
+                extra={'spider': spider})
+            self._stats.inc_value('memory_backpressure/forced_resumes',
+                                  spider=spider)
+            self._resume(engine)
+
+    def _pause(self, engine, rss, spider):
+        logger.info('RSS at %.0f MB is over the %.0f MB limit, pausing crawl',
+                    rss / 1024.0 / 1024.0,
+                    self._limit_bytes / 1024.0 / 1024.0,
+                    extra={'spider': spider})
+        self._stats.inc_value('memory_backpressure/pauses', spider=spider)
+        self._paused = True
+        engine.pause()
+        gc.collect()
+
+    def _resume(self, engine):
+        self._paused = False
+        engine.unpause()
+        if engine.slot:
+            # Don't wait for the engine's next heartbeat to schedule requests.
+            engine.slot.nextcall.schedule()
+
+    def _is_drained(self, engine):
+        return (not engine.downloader.active and engine.scraper.slot.is_idle())
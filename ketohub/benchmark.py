@@ -0,0 +1,448 @@
+"""Offline crawl benchmarks against recorded fixture pages.
+
+Fixtures are recorded once from the live sites:
+
+    python -m ketohub.benchmark record --fixtures-dir fixtures/
+
+Each spider can then be benchmarked offline, with politeness delays disabled,
+against a local HTTP server that serves the recorded pages:
+
+    python -m ketohub.benchmark run --fixtures-dir fixtures/ \\
+        --output results.json --baseline baseline.json
+
+Every spider runs in its own process so that peak RSS is measured per spider.
+When a baseline is given, the run fails if any spider regressed by more than
+--tolerance.
+
+The recipe-keys command times recipe_key.from_url against the original
+regex-per-step implementation on synthetic URLs, once with every URL unique
+and once with every URL looked up four times, as a crawl does:
+
+    python -m ketohub.benchmark recipe-keys --count 1000000
+"""
+
+import argparse
+import json
+import os
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from http import server as http_server
+
+from scrapy import crawler
+from scrapy.core.downloader.handlers import http11
+from scrapy.utils import project
+
+from ketohub import recipe_key
+from ketohub import runner
+
+# Metrics where a higher value is an improvement.
+_HIGHER_IS_BETTER = ('pages_per_sec', 'bytes_written_per_sec')
+# Metrics where a lower value is an improvement.
+_LOWER_IS_BETTER = ('peak_rss_bytes', 'callback_latency_p95_ms')
+# Below HttpCompressionMiddleware (590), so that responses are recorded after
+# they are decompressed. The fixture server sends no Content-Encoding.
+_RECORDER_PRIORITY = 580
+
+
+def _fixture_path(fixtures_dir, url):
+    return os.path.join(fixtures_dir, recipe_key.from_url(url))
+
+
+class FixtureRecorderMiddleware(object):
+    """Downloader middleware that records successful responses as fixtures."""
+
+    def __init__(self, fixtures_dir):
+        self._fixtures_dir = fixtures_dir
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings.get('BENCHMARK_FIXTURES_DIR'))
+
+    def process_response(self, request, response, spider):
+        if response.status == 200:
+            with open(_fixture_path(self._fixtures_dir, response.url),
+                      'wb') as f:
+                f.write(response.body)
+        return response
+
+
+class _FixtureRequestHandler(http_server.BaseHTTPRequestHandler):
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        fixture_path = os.path.join(self.server.fixtures_dir,
+                                    os.path.basename(self.path))
+        try:
+            with open(fixture_path, 'rb') as f:
+                body = f.read()
+        except IOError:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', _content_type(body))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):
+        pass
+
+
+def _content_type(body):
+    if body.startswith(b'\x1f\x8b'):
+        return 'application/x-gzip'
+    if body.lstrip().startswith(b'<?xml'):
+        return 'application/xml'
+    return 'text/html; charset=utf-8'
+
+
+class FixtureServer(object):
+    """Local HTTP server that serves recorded fixture pages by recipe key."""
+
+    def __init__(self, fixtures_dir):
+        self._server = http_server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                                       _FixtureRequestHandler)
+        self._server.fixtures_dir = fixtures_dir
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return 'http://%s:%d' % (host, port)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class FixtureDownloadHandler(object):
+    """Download handler that fetches every request from the fixture server.
+
+    The request is sent over HTTP to BENCHMARK_FIXTURE_SERVER, but the
+    response keeps the original URL so that the spiders' link extractors and
+    domain filters behave exactly as they do against the live sites.
+    """
+
+    lazy = False
+
+    def __init__(self, server_url, http_handler):
+        self._server_url = server_url
+        self._http_handler = http_handler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings.get('BENCHMARK_FIXTURE_SERVER'),
+                   http11.HTTP11DownloadHandler.from_crawler(crawler))
+
+    def download_request(self, request, spider):
+        fixture_request = request.replace(
+            url='%s/%s' % (self._server_url, recipe_key.from_url(request.url)))
+        d = self._http_handler.download_request(fixture_request, spider)
+        d.addCallback(lambda response: response.replace(url=request.url))
+        return d
+
+    def close(self):
+        return self._http_handler.close()
+
+
+def _percentile(values, percentile):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = int(round(percentile / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+def _directory_size(path):
+    total = 0
+    for directory, _, filenames in os.walk(path):
+        for filename in filenames:
+            total += os.path.getsize(os.path.join(directory, filename))
+    return total
+
+
+def _timed_spider_class(spidercls, latencies):
+    """Returns a subclass of spidercls that records recipe callback latency."""
+
+    def parse_recipe(self, response):
+        start = time.time()
+        try:
+            return spidercls.parse_recipe(self, response)
+        finally:
+            latencies.append(time.time() - start)
+
+    return type(spidercls.__name__, (spidercls,),
+                {'parse_recipe': parse_recipe})
+
+
+def _benchmark_settings(server_url, download_root):
+    handler = 'ketohub.benchmark.FixtureDownloadHandler'
+    return {
+        'BENCHMARK_FIXTURE_SERVER': server_url,
+        'DOWNLOAD_HANDLERS': {
+            'http': handler,
+            'https': handler,
+        },
+        'DOWNLOAD_ROOT': download_root,
+        'DOWNLOAD_DELAY': 0,
+        'AUTOTHROTTLE_ENABLED': False,
+        'ADAPTIVE_THROTTLE_ENABLED': False,
+        'CONCURRENT_REQUESTS_PER_DOMAIN': 16,
+        'RETRY_ENABLED': False,
+        'LOG_LEVEL': 'WARNING',
+    }
+
+
+def measure_spider(spider_name, fixtures_dir):
+    """Crawls recorded fixtures with one spider and measures its throughput.
+
+    This starts the Twisted reactor, so it can only be called once per
+    process.
+
+    Args:
+        spider_name: Name of the spider to benchmark.
+        fixtures_dir: Directory of recorded fixture pages.
+
+    Returns:
+        A dictionary of metrics for the run.
+    """
+    server = FixtureServer(fixtures_dir)
+    server.start()
+    download_root = tempfile.mkdtemp()
+    try:
+        settings = project.get_project_settings()
+        settings.setdict(_benchmark_settings(server.url, download_root),
+                         priority='cmdline')
+        process = crawler.CrawlerProcess(settings, install_root_handler=False)
+        latencies = []
+        spider_crawler = process.create_crawler(
+            _timed_spider_class(process.spider_loader.load(spider_name),
+                                latencies))
+        process.crawl(spider_crawler)
+        process.start()
+
+        stats = spider_crawler.stats.get_stats()
+        elapsed = max(stats.get('elapsed_time_seconds', 0), 1e-6)
+        bytes_written = _directory_size(download_root)
+    finally:
+        server.stop()
+        shutil.rmtree(download_root)
+
+    return {
+        'pages':
+            stats.get('response_received_count', 0),
+        'recipes':
+            stats.get('item_scraped_count', 0),
+        'elapsed_sec':
+            elapsed,
+        'pages_per_sec':
+            stats.get('response_received_count', 0) / elapsed,
+        'bytes_written_per_sec':
+            bytes_written / elapsed,
+        # ru_maxrss is reported in kilobytes on Linux.
+        'peak_rss_bytes':
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        'callback_latency_p50_ms':
+            _percentile(latencies, 50) * 1000,
+        'callback_latency_p95_ms':
+            _percentile(latencies, 95) * 1000,
+        'callback_latency_max_ms':
+            max(latencies or [0]) * 1000,
+    }
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Finds metrics that regressed relative to a baseline run.
+
+    Args:
+        results: Metrics of the current run, keyed by spider name.
+        baseline: Metrics of the baseline run, keyed by spider name.
+        tolerance: Fraction by which a metric may get worse before it counts
+            as a regression, e.g. 0.1 for 10%.
+
+    Returns:
+        A list of human-readable descriptions of each regression.
+    """
+    regressions = []
+    for spider_name, metrics in sorted(results.items()):
+        baseline_metrics = baseline.get(spider_name)
+        if not baseline_metrics:
+            continue
+        for metric in _HIGHER_IS_BETTER + _LOWER_IS_BETTER:
+            old = baseline_metrics.get(metric)
+            new = metrics.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / float(old)
+            if metric in _HIGHER_IS_BETTER:
+                change = -change
+            if change > tolerance:
+                regressions.append(
+                    '%s: %s regressed %.1f%% (%.2f -> %.2f)' %
+                    (spider_name, metric, change * 100, old, new))
+    return regressions
+
+
+def _run(args):
+    spider_names = args.spider_names or _list_spiders()
+    results = {}
+    for spider_name in sorted(spider_names):
+        output = subprocess.check_output([
+            sys.executable, '-m', 'ketohub.benchmark', 'measure', '--spider',
+            spider_name, '--fixtures-dir', args.fixtures_dir
+        ])
+        results[spider_name] = json.loads(output.decode('utf8'))
+        print('%s: %.1f pages/sec, %.0f bytes written/sec' %
+              (spider_name, results[spider_name]['pages_per_sec'],
+               results[spider_name]['bytes_written_per_sec']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        if regressions:
+            return 1
+    return 0
+
+
+def _legacy_recipe_key(url):
+    """The original recipe_key.from_url, kept as the microbenchmark baseline."""
+    url = re.sub(r'^https?://', '', url)
+    url = re.sub(r'^www\.', '', url)
+    url = re.sub(r'/$', '', url)
+    url = url.lower()
+    url = re.sub(r'[^a-z0-9/]', '-', url)
+    return re.sub(r'/', '_', url)
+
+
+def _synthetic_urls(count, repeats=1):
+    """Returns count synthetic recipe URLs, each repeated repeats times."""
+    urls = []
+    for i in range(count // repeats):
+        url = 'https://www.site%d.com/recipes/Keto_Recipe-%d/' % (i % 16, i)
+        urls.extend([url] * repeats)
+    return urls
+
+
+def _time_recipe_key_fn(key_fn, urls):
+    recipe_key.canonical_url.cache_clear()
+    recipe_key.from_url.cache_clear()
+    start = time.time()
+    for url in urls:
+        key_fn(url)
+    return time.time() - start
+
+
+def _print_recipe_key_timings(label, urls):
+    legacy_sec = _time_recipe_key_fn(_legacy_recipe_key, urls)
+    current_sec = _time_recipe_key_fn(recipe_key.from_url, urls)
+    print('%s:' % label)
+    print('  legacy:  %.2f sec (%.0f URLs/sec)' %
+          (legacy_sec, len(urls) / legacy_sec))
+    print('  current: %.2f sec (%.0f URLs/sec)' %
+          (current_sec, len(urls) / current_sec))
+    print('  speedup: %.1fx' % (legacy_sec / current_sec))
+
+
+def _recipe_keys(args):
+    _print_recipe_key_timings('unique URLs', _synthetic_urls(args.count))
+    # A crawl looks up the key of a URL several times (dupe filter,
+    # middlewares, callback), which the cache answers after the first time.
+    _print_recipe_key_timings('each URL 4 times',
+                              _synthetic_urls(args.count, repeats=4))
+    return 0
+
+
+def _list_spiders():
+    return crawler.CrawlerRunner(
+        project.get_project_settings()).spider_loader.list()
+
+
+def _measure(args):
+    print(json.dumps(measure_spider(args.spider_names[0], args.fixtures_dir)))
+    return 0
+
+
+def _record_settings(fixtures_dir, max_pages, download_root):
+    settings = project.get_project_settings()
+    middlewares = settings.getdict('DOWNLOADER_MIDDLEWARES')
+    middlewares[
+        'ketohub.benchmark.FixtureRecorderMiddleware'] = _RECORDER_PRIORITY
+    settings.set('DOWNLOADER_MIDDLEWARES', middlewares, priority='cmdline')
+    settings.set('BENCHMARK_FIXTURES_DIR', fixtures_dir, priority='cmdline')
+    settings.set('CLOSESPIDER_PAGECOUNT', max_pages, priority='cmdline')
+    settings.set('DOWNLOAD_ROOT', download_root, priority='cmdline')
+    return settings
+
+
+def _record(args):
+    if not os.path.isdir(args.fixtures_dir):
+        os.makedirs(args.fixtures_dir)
+    download_root = tempfile.mkdtemp()
+    settings = _record_settings(args.fixtures_dir, args.max_pages,
+                                download_root)
+    try:
+        runner.crawl(settings, args.spider_names)
+    finally:
+        shutil.rmtree(download_root)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='ketohub-benchmark',
+        description='Benchmark the spiders against recorded fixture pages.')
+    parser.add_argument('command',
+                        choices=('record', 'run', 'measure', 'recipe-keys'))
+    parser.add_argument('--fixtures-dir',
+                        help='Directory of recorded fixture pages')
+    parser.add_argument(
+        '--spider',
+        action='append',
+        dest='spider_names',
+        help='Spider to benchmark (repeatable, defaults to all)')
+    parser.add_argument('--max-pages',
+                        type=int,
+                        default=200,
+                        help='Pages to record per spider')
+    parser.add_argument('--output', help='File in which to save the results')
+    parser.add_argument('--baseline',
+                        help='Results of an earlier run to compare against')
+    parser.add_argument('--tolerance',
+                        type=float,
+                        default=0.1,
+                        help='Allowed regression before failing (fraction)')
+    parser.add_argument('--count',
+                        type=int,
+                        default=1000000,
+                        help='URLs to convert in the recipe-keys benchmark')
+    args = parser.parse_args()
+    if args.command != 'recipe-keys' and not args.fixtures_dir:
+        parser.error('--fixtures-dir is required for %s' % args.command)
+    commands = {
+        'record': _record,
+        'run': _run,
+        'measure': _measure,
+        'recipe-keys': _recipe_keys,
+    }
+    sys.exit(commands[args.command](args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Fixed-size dupe filter for long crawls.
+
+Scrapy's default dupe filter keeps the hex fingerprint of every request it has
+seen in a Python set, which costs on the order of 100 bytes per request and
+grows for as long as the crawl runs. BloomDupeFilter keeps a Bloom filter of
+the same fingerprints instead, whose size is fixed up front by
+DUPEFILTER_CAPACITY and DUPEFILTER_ERROR_RATE: a million requests at a 1 in
+100,000 false positive rate take under 3 MB.
+
+A false positive drops a request that was never fetched, so the error rate
+should stay low enough that at most a handful of pages per crawl are missed.
+With JOBDIR set, the filter is saved to JOBDIR/requests.bloom when the spider
+closes and loaded again when the crawl resumes.
+"""
+
+import logging
+import math
+import os
+
+from scrapy import dupefilters
+from scrapy.utils import job
+
+logger = logging.getLogger(__name__)
+
+_BLOOM_FILENAME = 'requests.bloom'
+# Written by Scrapy's default dupe filter, from which a resumed crawl is
+# seeded the first time it runs with BloomDupeFilter.
+_SEEN_FILENAME = 'requests.seen'
+
+
+class BloomFilter(object):
+    """Set membership in fixed memory, with a bounded false positive rate.
+
+    Items must be byte strings of at least 16 bytes with uniformly
+    distributed bits, such as SHA-1 digests, which are used directly as the
+    filter's hashes.
+    """
+
+    def __init__(self, capacity, error_rate):
+        bit_count = -capacity * math.log(error_rate) / math.log(2)**2
+        self._bit_count = max(8, int(math.ceil(bit_count / 8)) * 8)
+        self._hash_count = max(1,
+                               int(round(math.log(2) * bit_count / capacity)))
+        self._bits = bytearray(self._bit_count // 8)
+
+    @property
+    def size_bytes(self):
+        return len(self._bits)
+
+    def add(self, item):
+        """Adds item and returns whether it may have been added before."""
+        seen = True
+        for position in self._positions(item):
+            byte, mask = position >> 3, 1 << (position & 7)
+            if not self._bits[byte] & mask:
+                seen = False
+                self._bits[byte] |= mask
+        return seen
+
+    def __contains__(self, item):
+        for position in self._positions(item):
+            if not self._bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self._bits)
+
+    def load(self, path):
+        """Loads bits saved by a filter of the same size.
+
+        Returns:
+            Whether the file matched this filter's size and was loaded.
+        """
+        with open(path, 'rb') as f:
+            bits = f.read()
+        if len(bits) != len(self._bits):
+            return False
+        self._bits = bytearray(bits)
+        return True
+
+    def _positions(self, item):
+        # Double hashing: k positions from two independent 64-bit hashes.
+        first = int.from_bytes(item[:8], 'little')
+        second = int.from_bytes(item[8:16], 'little') | 1
+        for i in range(self._hash_count):
+            yield (first + i * second) % self._bit_count
+
+
+class BloomDupeFilter(dupefilters.BaseDupeFilter):
+    """Dupe filter that remembers request fingerprints in a Bloom filter."""
+
+    def __init__(self,
+                 fingerprinter,
+                 capacity,
+                 error_rate,
+                 path=None,
+                 debug=False):
+        self._fingerprinter = fingerprinter
+        self._filter = BloomFilter(capacity, error_rate)
+        self._path = path
+        self._debug = debug
+        self._log_duplicates = True
+        if path:
+            self._load(path)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(crawler.request_fingerprinter,
+                   capacity=settings.getint('DUPEFILTER_CAPACITY'),
+                   error_rate=settings.getfloat('DUPEFILTER_ERROR_RATE'),
+                   path=job.job_dir(settings),
+                   debug=settings.getbool('DUPEFILTER_DEBUG'))
+
+    def request_seen(self, request):
+        return self._filter.add(self._fingerprinter.fingerprint(request))
+
+    def close(self, reason):
+        if self._path:
+            self._filter.save(os.path.join(self._path, _BLOOM_FILENAME))
+
+    def log(self, request, spider):
+        if self._debug or self._log_duplicates:
+            logger.debug('Filtered duplicate request: %s',
+                         request,
+                         extra={'spider': spider})
+            self._log_duplicates = self._debug
+        spider.crawler.stats.inc_value('dupefilter/filtered', spider=spider)
+
+    def _load(self, path):
+        bloom_path = os.path.join(path, _BLOOM_FILENAME)
+        seen_path = os.path.join(path, _SEEN_FILENAME)
+        if os.path.exists(bloom_path):
+            if not self._filter.load(bloom_path):
+                logger.warning(
+                    'Ignoring %s, which was saved with a different '
+                    'DUPEFILTER_CAPACITY or DUPEFILTER_ERROR_RATE', bloom_path)
+        elif os.path.exists(seen_path):
+            with open(seen_path) as f:
+                for line in f:
+                    self._filter.add(bytes.fromhex(line.strip()))
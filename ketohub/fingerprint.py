@@ -0,0 +1,54 @@
+import hashlib
+
+from scrapy.downloadermiddlewares import redirect
+from scrapy.utils import request as request_utils
+
+from ketohub import metrics
+from ketohub import recipe_key
+
+
+class RecipeKeyRequestFingerprinter(object):
+    """Fingerprints GET requests by the recipe key of their URL.
+
+    Requests that map to the same recipe key (e.g. http:// and https://
+    variants of a page) share a fingerprint, so the dupe filter, and the
+    requests.seen file it keeps in JOBDIR, match what ContentSaver stores.
+    """
+
+    def __init__(self, crawler=None):
+        self._default_fingerprinter = request_utils.RequestFingerprinter(
+            crawler)
+        self._stats = crawler.stats if crawler else None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def fingerprint(self, request):
+        if request.method != 'GET' or request.body:
+            return self._default_fingerprinter.fingerprint(request)
+        if self._stats is None:
+            key = recipe_key.from_url(request.url)
+        else:
+            with metrics.timed(self._stats, 'recipe_key'):
+                key = recipe_key.from_url(request.url)
+        return hashlib.sha1(key.encode('utf8')).digest()
+
+
+class SameRecipeRedirectMiddleware(redirect.RedirectMiddleware):
+    """Follows redirects to another URL of the same recipe.
+
+    A redirect between URLs with the same recipe key (e.g. /kiev to /kiev/,
+    http:// to https:// or example.com to www.example.com) has the same
+    fingerprint as the request it came from, so the dupe filter would drop it
+    as already seen and the page would never be downloaded. Such redirects
+    bypass the dupe filter; the redirect limit still stops loops.
+    """
+
+    def _redirect(self, redirected, request, spider, reason):
+        redirected = super(SameRecipeRedirectMiddleware,
+                           self)._redirect(redirected, request, spider, reason)
+        if (recipe_key.from_url(redirected.url) == recipe_key.from_url(
+                request.url)):
+            redirected.dont_filter = True
+        return redirected
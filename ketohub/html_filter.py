@@ -0,0 +1,106 @@
+"""Reduces recipe pages to the parts that describe the recipe.
+
+Most of a recipe page's bytes are inline scripts, ad markup and embedded
+images. reduce_html streams the page through an incremental parser and keeps
+only the title, the schema.org JSON-LD blocks and the outermost article (or
+main) element, with scripts, styles, frames and data: URIs removed from it.
+Everything else is discarded as soon as it has been parsed, so memory use
+stays bounded by the size of the kept content.
+"""
+
+import copy
+
+from lxml import etree
+
+_CHUNK_SIZE = 64 * 1024
+_CONTENT_TAGS = ('article', 'main')
+# Elements removed from the kept content.
+_STRIPPED_TAGS = ('script', 'style', 'noscript', 'iframe', 'svg', 'form')
+
+
+def _is_json_ld(element):
+    if element.tag != 'script':
+        return False
+    script_type = element.get('type') or ''
+    return script_type.strip().lower() == 'application/ld+json'
+
+
+def _clean_content(element):
+    element = copy.deepcopy(element)
+    etree.strip_elements(element, *_STRIPPED_TAGS, with_tail=False)
+    for child in element.iter():
+        for attribute in ('src', 'srcset', 'href'):
+            if (child.get(attribute) or '').lstrip().startswith('data:'):
+                del child.attrib[attribute]
+    return element
+
+
+def _parse_events(html):
+    # Pages are always UTF-8 by now (see ketohub.spiders), whatever charset
+    # their markup still declares, so don't let the parser guess.
+    parser = etree.HTMLPullParser(events=('start', 'end'), encoding='utf-8')
+    view = memoryview(html)
+    for offset in range(0, len(html), _CHUNK_SIZE):
+        parser.feed(view[offset:offset + _CHUNK_SIZE].tobytes())
+        for event in parser.read_events():
+            yield event
+    try:
+        parser.close()
+    except etree.ParseError:
+        # Raised for pages with no elements at all.
+        return
+    for event in parser.read_events():
+        yield event
+
+
+def reduce_html(html):
+    """Returns a reduced copy of an HTML page.
+
+    Args:
+        html: The page as UTF-8 bytes.
+
+    Returns:
+        The reduced page as UTF-8 bytes, or html unchanged if neither JSON-LD
+        nor an article or main element was found in it.
+    """
+    title = None
+    json_ld = []
+    content = []
+    content_depth = 0
+    for event, element in _parse_events(html):
+        if not isinstance(element.tag, str):
+            continue
+        if element.tag in _CONTENT_TAGS:
+            if event == 'start':
+                content_depth += 1
+                continue
+            content_depth -= 1
+            if not content_depth:
+                content.append(_clean_content(element))
+        if event != 'end':
+            continue
+        if _is_json_ld(element):
+            json_ld.append(element.text or '')
+        elif element.tag == 'title' and title is None:
+            title = element.text
+        if not content_depth:
+            # Nothing outside the kept content is needed once parsed.
+            element.clear(keep_tail=False)
+
+    if not json_ld and not content:
+        return html
+
+    root = etree.Element('html')
+    head = etree.SubElement(root, 'head')
+    etree.SubElement(head, 'meta', charset='utf-8')
+    if title:
+        etree.SubElement(head, 'title').text = title
+    for text in json_ld:
+        script = etree.SubElement(head, 'script', type='application/ld+json')
+        script.text = text
+    body = etree.SubElement(root, 'body')
+    body.extend(content)
+    return etree.tostring(root,
+                          method='html',
+                          encoding='utf-8',
+                          doctype='<!DOCTYPE html>')
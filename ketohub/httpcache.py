@@ -0,0 +1,144 @@
+"""Compressed on-disk HTTP cache keyed by recipe key.
+
+CanonicalCacheStorage is a storage backend for Scrapy's HttpCacheMiddleware.
+It keeps one gzipped file per page under HTTPCACHE_DIR/<spider>/, named by
+the recipe key of the page's URL, so http/https, www and tracking-parameter
+variants of a URL share one cache entry. Entries older than
+HTTPCACHE_EXPIRATION_SECS are ignored, and once a spider's cache grows past
+HTTPCACHE_MAX_BYTES, the least recently used entries are evicted.
+
+With HTTPCACHE_IGNORE_MISSING, the crawl replays the cache without touching
+the network, which makes it quick to try out changes to a site's rules.
+"""
+
+import collections
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+from scrapy import http
+from scrapy import responsetypes
+from scrapy.utils import project
+
+from ketohub import persist
+from ketohub import recipe_key
+
+logger = logging.getLogger(__name__)
+
+_CACHE_SUFFIX = '.gz'
+# Longer recipe keys are replaced by their hash to stay within filename
+# limits.
+_MAX_KEY_LENGTH = 200
+
+
+def _cache_filename(url):
+    key = recipe_key.from_url(url)
+    if len(key) > _MAX_KEY_LENGTH:
+        key = hashlib.sha1(key.encode('utf8')).hexdigest()
+    return key + _CACHE_SUFFIX
+
+
+def _decode_headers(headers):
+    decoded = {}
+    for name, values in headers.items():
+        decoded[name.decode('latin-1')] = [
+            value.decode('latin-1') for value in values
+        ]
+    return decoded
+
+
+class CanonicalCacheStorage(object):
+    """HTTP cache storage with one compressed file per recipe key."""
+
+    def __init__(self, settings):
+        self._cache_root = project.data_path(settings['HTTPCACHE_DIR'])
+        self._expiration_secs = settings.getint('HTTPCACHE_EXPIRATION_SECS')
+        self._max_bytes = settings.getint('HTTPCACHE_MAX_BYTES')
+        self._cache_dir = None
+        # Sizes of the cached files, least recently used first.
+        self._entries = collections.OrderedDict()
+        self._total_bytes = 0
+
+    def open_spider(self, spider):
+        self._cache_dir = os.path.join(self._cache_root, spider.name)
+        persist._ensure_directory_exists(self._cache_dir)
+        entries = []
+        for entry in os.scandir(self._cache_dir):
+            if entry.name.endswith(_CACHE_SUFFIX):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, filename, size in sorted(entries):
+            self._entries[filename] = size
+            self._total_bytes += size
+        logger.debug('Using HTTP cache in %s (%d entries)',
+                     self._cache_dir,
+                     len(self._entries),
+                     extra={'spider': spider})
+
+    def close_spider(self, spider):
+        pass
+
+    def retrieve_response(self, spider, request):
+        """Returns the cached response for request, or None if not cached."""
+        filename = _cache_filename(request.url)
+        if filename not in self._entries:
+            return None
+        path = os.path.join(self._cache_dir, filename)
+        try:
+            with gzip.open(path, 'rb') as f:
+                metadata = json.loads(f.readline().decode('utf8'))
+                body = f.read()
+        except (IOError, OSError, ValueError):
+            return None
+        if (self._expiration_secs > 0 and
+                time.time() - metadata['timestamp'] > self._expiration_secs):
+            return None
+
+        # Mark the entry as recently used, on disk too so that the order
+        # survives to the next run.
+        self._entries.move_to_end(filename)
+        os.utime(path)
+        headers = http.Headers(metadata['headers'])
+        response_cls = responsetypes.responsetypes.from_args(
+            headers=headers, url=metadata['url'], body=body)
+        return response_cls(url=metadata['url'],
+                            status=metadata['status'],
+                            headers=headers,
+                            body=body)
+
+    def store_response(self, spider, request, response):
+        """Saves response in the cache, evicting old entries if it's full."""
+        metadata = {
+            'url': response.url,
+            'status': response.status,
+            'headers': _decode_headers(response.headers),
+            'timestamp': time.time(),
+        }
+        filename = _cache_filename(request.url)
+        path = os.path.join(self._cache_dir, filename)
+        fd, temp_path = tempfile.mkstemp(dir=self._cache_dir)
+        with os.fdopen(fd, 'wb') as raw_file:
+            with gzip.GzipFile(fileobj=raw_file, mode='wb') as f:
+                f.write(json.dumps(metadata).encode('utf8') + b'\n')
+                f.write(response.body)
+        os.rename(temp_path, path)
+
+        self._total_bytes -= self._entries.pop(filename, 0)
+        self._entries[filename] = os.path.getsize(path)
+        self._total_bytes += self._entries[filename]
+        self._evict()
+
+    def _evict(self):
+        if not self._max_bytes:
+            return
+        while self._total_bytes > self._max_bytes and len(self._entries) > 1:
+            filename, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(os.path.join(self._cache_dir, filename))
+            except OSError:
+                pass
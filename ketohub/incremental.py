@@ -0,0 +1,171 @@
+"""Incremental re-crawls that revalidate recipes from a previous snapshot."""
+
+import json
+import os
+
+from scrapy import exceptions
+from scrapy import http
+
+from ketohub import manifest
+from ketohub import persist
+from ketohub import recipe_extract
+from ketohub import recipe_key
+
+
+def _read_file(filepath):
+    with open(filepath, 'rb') as f:
+        return f.read()
+
+
+class PreviousSnapshot(object):
+    """Read-only view of the recipes saved by an earlier crawl."""
+
+    def __init__(self, root, read_file_fn=_read_file):
+        self._root = root
+        self._read_file_fn = read_file_fn
+        self._keys = None
+        self._manifest = None
+        self._dataset = None
+
+    def _index(self):
+        if self._keys is None:
+            try:
+                self._keys = frozenset(os.listdir(self._root))
+            except OSError:
+                self._keys = frozenset()
+        return self._keys
+
+    def metadata(self, key):
+        """Returns the saved metadata for key or None if it was not saved."""
+        if key not in self._index():
+            return None
+        try:
+            with open(os.path.join(self._root, key, 'metadata.json')) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def html_path(self, key):
+        return os.path.join(self._root, key, 'index.html')
+
+    def read_html(self, key):
+        return self._read_file_fn(self.html_path(key))
+
+    def content_entry(self, key):
+        """Returns the (sha256, size) manifest entry of key's saved HTML.
+
+        Snapshots saved before manifests existed have no entry for key, in
+        which case the saved HTML is hashed instead.
+        """
+        if self._manifest is None:
+            self._manifest = manifest.read_manifest(self._root)
+        entry = self._manifest.get(key)
+        if entry is None:
+            try:
+                entry = manifest.content_entry(self.read_html(key))
+            except (IOError, OSError):
+                return None
+        return entry
+
+    def recipe(self, key):
+        """Returns the dataset row saved for key, or None if there is none."""
+        if self._dataset is None:
+            self._dataset = recipe_extract.read_dataset(self._root)
+        return self._dataset.get(key)
+
+
+# Previous snapshots opened by this process, shared by all of its crawlers so
+# that the snapshot is only indexed once per run.
+_previous_snapshots = {}
+
+
+def get_previous_snapshot(settings):
+    """Returns the snapshot at PREVIOUS_DOWNLOAD_ROOT, opening it on first use.
+
+    Args:
+        settings: Scrapy settings of the crawl.
+
+    Returns:
+        A PreviousSnapshot, or None if PREVIOUS_DOWNLOAD_ROOT is not set.
+    """
+    previous_root = settings.get('PREVIOUS_DOWNLOAD_ROOT')
+    if not previous_root:
+        return None
+    storage_backend = settings.get('STORAGE_BACKEND')
+    blob_root = settings.get('BLOB_ROOT')
+    cache_key = (previous_root, storage_backend, blob_root)
+    previous_snapshot = _previous_snapshots.get(cache_key)
+    if previous_snapshot is None:
+        if storage_backend == 'content-addressed':
+            read_file_fn = persist.BlobStore(blob_root).read_file
+        else:
+            read_file_fn = _read_file
+        previous_snapshot = PreviousSnapshot(previous_root, read_file_fn)
+        _previous_snapshots[cache_key] = previous_snapshot
+    return previous_snapshot
+
+
+class ConditionalRequestMiddleware(object):
+    """Downloader middleware that sends conditional requests for saved recipes.
+
+    When a recipe is present in the snapshot at PREVIOUS_DOWNLOAD_ROOT, the
+    request carries the ETag / Last-Modified validators saved with it. A 304
+    response is replaced with the previously saved page and flagged so that
+    CallbackHandler links the old file instead of writing a new copy.
+    """
+
+    def __init__(self, previous_snapshot, stats):
+        self._previous_snapshot = previous_snapshot
+        self._stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        previous_snapshot = get_previous_snapshot(crawler.settings)
+        if not previous_snapshot:
+            raise exceptions.NotConfigured()
+        return cls(previous_snapshot, crawler.stats)
+
+    def process_request(self, request, spider):
+        metadata = self._previous_snapshot.metadata(
+            recipe_key.from_url(request.url))
+        if not metadata:
+            return None
+        if metadata.get('etag'):
+            request.headers.setdefault('If-None-Match', metadata['etag'])
+        if metadata.get('last_modified'):
+            request.headers.setdefault('If-Modified-Since',
+                                       metadata['last_modified'])
+        return None
+
+    def process_response(self, request, response, spider):
+        if response.status != 304:
+            return response
+        key = recipe_key.from_url(request.url)
+        metadata = self._previous_snapshot.metadata(key)
+        if not metadata:
+            return response
+        try:
+            body = self._previous_snapshot.read_html(key)
+        except IOError:
+            return response
+
+        # Servers may omit the validators from a 304, so carry the old ones
+        # forward for the next run.
+        headers = response.headers.copy()
+        if metadata.get('etag'):
+            headers.setdefault('ETag', metadata['etag'])
+        if metadata.get('last_modified'):
+            headers.setdefault('Last-Modified', metadata['last_modified'])
+
+        self._stats.inc_value('incremental/unchanged', spider=spider)
+        request.meta['previous_html_path'] = self._previous_snapshot.html_path(
+            key)
+        # Saves fingerprinting the page again (see NearDuplicatePipeline).
+        request.meta['previous_simhash'] = metadata.get('simhash')
+        return http.HtmlResponse(url=response.url,
+                                 status=200,
+                                 headers=headers,
+                                 body=body,
+                                 encoding='utf-8',
+                                 request=request,
+                                 flags=response.flags + ['unchanged'])
@@ -0,0 +1,74 @@
+"""Content manifests of snapshots.
+
+While a spider saves recipes, it records each recipe's key, the SHA-256 hash
+of its saved HTML and the HTML's size in DOWNLOAD_ROOT/manifest-<spider>.tsv,
+one tab-separated line per recipe. Near-duplicates, which have no HTML of
+their own, are recorded with a duplicate_of:<key> marker in place of the hash
+and a size of 0. A snapshot's manifest is the union of its spiders' manifest
+files, which is enough to tell what changed between two snapshots without
+reading any HTML (see ketohub.snapshot_diff).
+"""
+
+import glob
+import hashlib
+import os
+
+from ketohub import persist
+
+_MANIFEST_PATTERN = 'manifest-*.tsv'
+
+
+def manifest_path(snapshot_root, spider_name):
+    return os.path.join(snapshot_root, 'manifest-%s.tsv' % spider_name)
+
+
+def content_entry(content):
+    """Returns the (sha256, size) manifest entry of saved content."""
+    if not isinstance(content, bytes):
+        content = content.encode('utf8')
+    return hashlib.sha256(content).hexdigest(), len(content)
+
+
+def duplicate_entry(original_key):
+    """Returns the manifest entry of a near-duplicate of original_key."""
+    return 'duplicate_of:%s' % original_key, 0
+
+
+def read_manifest(snapshot_root):
+    """Reads the manifest of a snapshot.
+
+    Args:
+        snapshot_root: Directory of the snapshot.
+
+    Returns:
+        A dictionary mapping each recipe key to its (sha256, size) entry.
+    """
+    entries = {}
+    for path in sorted(glob.glob(os.path.join(snapshot_root,
+                                              _MANIFEST_PATTERN))):
+        with open(path) as f:
+            for line in f:
+                key, sha256, size = line.rstrip('\n').split('\t')
+                # Later lines win, so a resumed crawl can re-record a recipe.
+                entries[key] = (sha256, int(size))
+    return entries
+
+
+class ManifestWriter(object):
+    """Appends entries to a spider's manifest file."""
+
+    def __init__(self, path):
+        self._path = path
+        self._file = None
+
+    def add(self, key, entry):
+        if self._file is None:
+            persist._ensure_directory_exists(os.path.dirname(self._path))
+            self._file = open(self._path, 'a')
+        sha256, size = entry
+        self._file.write('%s\t%s\t%d\n' % (key, sha256, size))
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,168 @@
+"""Per-spider crawl metrics.
+
+The hot paths of a crawl time themselves with timed() and record_timing(),
+which add to the timing/<stage>/seconds and timing/<stage>/calls stats. The
+CrawlMetrics extension adds page, byte and item counts per crawl rule and, when
+the spider closes, writes a summary of all of them into DOWNLOAD_ROOT as
+metrics-<spider>.json and, in Prometheus text format, metrics-<spider>.prom.
+
+With METRICS_PROFILE set, recipe callbacks also run under cProfile and the
+profile is saved as profile-<spider>.pstats.
+"""
+
+import contextlib
+import cProfile
+import json
+import os
+import time
+
+from scrapy import exceptions
+from scrapy import signals
+
+from ketohub import persist
+from ketohub import shared_queue
+
+# Stats copied into the summary as they are, keyed by their metric name.
+_COUNTERS = {
+    'pages': 'response_received_count',
+    'response_bytes': 'downloader/response_bytes',
+    'items': 'item_scraped_count',
+    'filtered_requests': 'dupefilter/filtered',
+    'near_duplicates': 'near_duplicate/duplicates',
+    'unchanged_pages': 'incremental/unchanged',
+    'backoffs': 'throttle/backoffs',
+}
+
+
+def record_timing(stats, stage, seconds):
+    """Adds one call of a stage that took the given seconds to the stats."""
+    stats.inc_value('timing/%s/seconds' % stage, seconds)
+    stats.inc_value('timing/%s/calls' % stage)
+
+
+@contextlib.contextmanager
+def timed(stats, stage, profiler=None):
+    """Times the enclosed block as one call of stage.
+
+    Args:
+        stats: Stats collector of the crawl.
+        stage: Name of the stage being timed.
+        profiler: Optional cProfile.Profile to enable for the block.
+    """
+    if profiler:
+        profiler.enable()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(stats, stage, time.perf_counter() - start)
+        if profiler:
+            profiler.disable()
+
+
+def _rule_label(request):
+    rule = request.meta.get('rule')
+    if rule is not None:
+        return 'rule-%d' % rule
+    if request.callback:
+        return getattr(request.callback, '__name__', 'callback')
+    return 'start'
+
+
+def _summarize(stats, elapsed):
+    summary = {'elapsed_seconds': elapsed, 'stages': {}, 'rules': {}}
+    for name, stat in _COUNTERS.items():
+        summary[name] = stats.get(stat, 0)
+    for stat, value in stats.items():
+        parts = stat.split('/')
+        if len(parts) != 3 or parts[0] not in ('timing', 'rules'):
+            continue
+        group = 'stages' if parts[0] == 'timing' else 'rules'
+        summary[group].setdefault(parts[1], {})[parts[2]] = value
+    return summary
+
+
+def _prometheus_text(spider_name, summary):
+    lines = []
+
+    def add(metric, value, **labels):
+        labels['spider'] = spider_name
+        label_text = ','.join(
+            '%s="%s"' % (name, labels[name]) for name in sorted(labels))
+        lines.append('ketohub_%s{%s} %s' % (metric, label_text, value))
+
+    add('elapsed_seconds', summary['elapsed_seconds'])
+    for name in sorted(_COUNTERS):
+        add('%s_total' % name, summary[name])
+    for stage, values in sorted(summary['stages'].items()):
+        add('stage_seconds_total', values.get('seconds', 0), stage=stage)
+        add('stage_calls_total', values.get('calls', 0), stage=stage)
+    for rule, values in sorted(summary['rules'].items()):
+        for name, value in sorted(values.items()):
+            add('rule_%s_total' % name, value, rule=rule)
+    return '\n'.join(lines) + '\n'
+
+
+class CrawlMetrics(object):
+    """Extension that writes a summary of each spider's metrics at close."""
+
+    def __init__(self, stats, output_dir, profile, output_suffix=''):
+        self._stats = stats
+        self._output_dir = output_dir
+        self._profile = profile
+        self._output_suffix = output_suffix
+        self._started = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('METRICS_ENABLED'):
+            raise exceptions.NotConfigured()
+        extension = cls(crawler.stats, settings.get('DOWNLOAD_ROOT'),
+                        settings.getbool('METRICS_PROFILE'),
+                        shared_queue.output_suffix(settings))
+        crawler.signals.connect(extension.spider_opened,
+                                signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed,
+                                signal=signals.spider_closed)
+        crawler.signals.connect(extension.response_received,
+                                signal=signals.response_received)
+        crawler.signals.connect(extension.item_scraped,
+                                signal=signals.item_scraped)
+        return extension
+
+    def spider_opened(self, spider):
+        self._started = time.time()
+        if self._profile:
+            spider.callback_profiler = cProfile.Profile()
+
+    def response_received(self, response, request, spider):
+        latency = request.meta.get('download_latency')
+        if latency is not None:
+            record_timing(self._stats, 'download', latency)
+        label = _rule_label(request)
+        self._stats.inc_value('rules/%s/pages' % label)
+        self._stats.inc_value('rules/%s/bytes' % label, len(response.body))
+
+    def item_scraped(self, item, response, spider):
+        request = getattr(response, 'request', None)
+        if request is not None:
+            self._stats.inc_value('rules/%s/items' % _rule_label(request))
+
+    def spider_closed(self, spider, reason):
+        if not self._output_dir:
+            return
+        persist._ensure_directory_exists(self._output_dir)
+        summary = _summarize(self._stats.get_stats(),
+                             time.time() - self._started)
+        output_name = spider.name + self._output_suffix
+        path_prefix = os.path.join(self._output_dir, 'metrics-' + output_name)
+        with open(path_prefix + '.json', 'w') as f:
+            json.dump(summary, f, indent=4, sort_keys=True)
+        with open(path_prefix + '.prom', 'w') as f:
+            f.write(_prometheus_text(spider.name, summary))
+        profiler = getattr(spider, 'callback_profiler', None)
+        if profiler:
+            profiler.dump_stats(
+                os.path.join(self._output_dir,
+                             'profile-%s.pstats' % output_name))
@@ -0,0 +1,108 @@
+"""Near-duplicate detection for recipe pages.
+
+Many sites publish the same recipe under several URLs (category pages, AMP
+and print views). Each page's main content is reduced to a 64-bit SimHash of
+its word shingles; two pages whose fingerprints differ in at most a few bits
+are near-duplicates. NearDuplicateIndex finds them with locality-sensitive
+hashing: the fingerprint is split into bands, and only pages that share a
+whole band are compared.
+"""
+
+import hashlib
+import re
+
+import lxml.html
+from lxml import etree
+
+_FINGERPRINT_BITS = 64
+_SHINGLE_SIZE = 4
+# Elements that hold navigation and boilerplate rather than the recipe.
+_BOILERPLATE_TAGS = ('script', 'style', 'noscript', 'nav', 'header', 'footer',
+                     'aside', 'form', 'iframe')
+_WORD_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def _main_content(html):
+    try:
+        document = lxml.html.document_fromstring(html)
+    except (etree.ParserError, ValueError):
+        return ''
+    etree.strip_elements(document, *_BOILERPLATE_TAGS, with_tail=False)
+    for xpath in ('//article', '//main', '//body'):
+        elements = document.xpath(xpath)
+        if elements:
+            return ' '.join(element.text_content() for element in elements)
+    return document.text_content()
+
+
+def _hash(shingle):
+    digest = hashlib.blake2b(shingle.encode('utf8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def simhash(html):
+    """Returns the 64-bit SimHash of the main content of an HTML page.
+
+    Args:
+        html: The page as bytes.
+
+    Returns:
+        The fingerprint as an int, or None if the page has no text.
+    """
+    words = _WORD_PATTERN.findall(_main_content(html).lower())
+    if not words:
+        return None
+    shingle_count = max(1, len(words) - _SHINGLE_SIZE + 1)
+    shingles = set(
+        ' '.join(words[i:i + _SHINGLE_SIZE]) for i in range(shingle_count))
+    weights = [0] * _FINGERPRINT_BITS
+    for shingle in shingles:
+        shingle_hash = _hash(shingle)
+        for bit in range(_FINGERPRINT_BITS):
+            if shingle_hash >> bit & 1:
+                weights[bit] += 1
+            else:
+                weights[bit] -= 1
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+class NearDuplicateIndex(object):
+    """In-memory LSH index of SimHash fingerprints.
+
+    The fingerprint is split into max_distance + 1 bands. By the pigeonhole
+    principle, two fingerprints within max_distance bits of each other agree
+    exactly on at least one band, so looking up each band finds every
+    candidate.
+    """
+
+    def __init__(self, max_distance=3):
+        self._max_distance = max_distance
+        self._band_count = max_distance + 1
+        self._band_bits = -(-_FINGERPRINT_BITS // self._band_count)
+        self._buckets = [{} for _ in range(self._band_count)]
+
+    def _bands(self, fingerprint):
+        mask = (1 << self._band_bits) - 1
+        return [(fingerprint >> (band * self._band_bits)) & mask
+                for band in range(self._band_count)]
+
+    def find(self, fingerprint):
+        """Returns the key of an indexed near-duplicate, or None."""
+        for buckets, band in zip(self._buckets, self._bands(fingerprint)):
+            for key, candidate in buckets.get(band, ()):
+                if hamming_distance(fingerprint,
+                                    candidate) <= self._max_distance:
+                    return key
+        return None
+
+    def add(self, key, fingerprint):
+        for buckets, band in zip(self._buckets, self._bands(fingerprint)):
+            buckets.setdefault(band, []).append((key, fingerprint))
@@ -0,0 +1,130 @@
+"""Saves snapshots directly to an S3-compatible object store.
+
+ObjectStoreWriter plugs into persist.ContentSaver in place of local file
+writes, so recipes are uploaded to the bucket as they are crawled instead of
+being written to disk and copied up afterwards. A file that would have been
+saved at DOWNLOAD_ROOT/<path> is stored under the key
+<prefix>/<snapshot>/<path>, where <snapshot> is the name of the DOWNLOAD_ROOT
+directory (the runner's timestamp by default).
+
+Uploads run on PersistPipeline's writer threads and share one client, whose
+connection pool is sized to match them. Large files are sent as parallel
+multipart uploads, and uploads that fail are retried with exponential
+backoff.
+"""
+
+import io
+import logging
+import mimetypes
+import os
+import posixpath
+import time
+
+try:
+    import boto3
+    from boto3.s3 import transfer
+    from botocore import config as botocore_config
+    from botocore import exceptions as botocore_exceptions
+    _RETRYABLE_ERRORS = (IOError, botocore_exceptions.BotoCoreError,
+                         botocore_exceptions.ClientError)
+except ImportError:
+    boto3 = None
+    _RETRYABLE_ERRORS = (IOError,)
+
+logger = logging.getLogger(__name__)
+
+# Files at least this large are uploaded in parallel parts.
+_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+_MULTIPART_CONCURRENCY = 4
+
+
+def available():
+    """Returns whether the object store client library is installed."""
+    return boto3 is not None
+
+
+def create_client(endpoint_url=None, max_connections=10):
+    """Creates a thread-safe S3 client.
+
+    Args:
+        endpoint_url: URL of an S3-compatible service such as MinIO, or None
+            for AWS S3.
+        max_connections: Size of the client's connection pool. It should be
+            at least the number of threads uploading through the client.
+
+    Returns:
+        A boto3 S3 client.
+    """
+    config = botocore_config.Config(max_pool_connections=max_connections)
+    return boto3.client('s3', endpoint_url=endpoint_url, config=config)
+
+
+def _content_type(filepath):
+    content_type, _ = mimetypes.guess_type(filepath)
+    if content_type and content_type.startswith('text/'):
+        content_type += '; charset=utf-8'
+    return content_type or 'application/octet-stream'
+
+
+class ObjectStoreWriter(object):
+    """Writes snapshot files to a bucket instead of the local filesystem."""
+
+    def __init__(self,
+                 client,
+                 bucket,
+                 root,
+                 prefix='',
+                 max_retries=3,
+                 retry_delay=1.0,
+                 sleep_fn=time.sleep):
+        self._client = client
+        self._bucket = bucket
+        self._root = root
+        self._key_prefix = posixpath.join(
+            prefix.strip('/'), os.path.basename(os.path.normpath(root)))
+        self._max_retries = max_retries
+        self._retry_delay = retry_delay
+        self._sleep_fn = sleep_fn
+        self._transfer_config = None
+        if boto3 is not None:
+            self._transfer_config = transfer.TransferConfig(
+                multipart_threshold=_MULTIPART_THRESHOLD,
+                max_concurrency=_MULTIPART_CONCURRENCY)
+
+    def object_key(self, filepath):
+        """Returns the key under which the file at filepath is stored."""
+        relative_path = os.path.relpath(filepath, self._root)
+        return posixpath.join(self._key_prefix,
+                              relative_path.replace(os.sep, '/')).lstrip('/')
+
+    def write_file(self, filepath, content):
+        """Uploads content as the object for filepath."""
+        if not isinstance(content, bytes):
+            content = content.encode('utf8')
+        self._upload(filepath, io.BytesIO(content))
+
+    def link_file(self, source_path, filepath):
+        """Uploads a file saved locally by a previous crawl."""
+        with open(source_path, 'rb') as f:
+            self._upload(filepath, f)
+
+    def _upload(self, filepath, f):
+        key = self.object_key(filepath)
+        extra_args = {'ContentType': _content_type(filepath)}
+        for attempt in range(self._max_retries + 1):
+            try:
+                # A failed attempt may have read part of the file already.
+                f.seek(0)
+                self._client.upload_fileobj(f,
+                                            self._bucket,
+                                            key,
+                                            ExtraArgs=extra_args,
+                                            Config=self._transfer_config)
+                return
+            except _RETRYABLE_ERRORS as e:
+                if attempt == self._max_retries:
+                    raise
+                delay = self._retry_delay * 2**attempt
+                logger.warning('Failed to upload %s (%s), retrying in %.1fs',
+                               key, e, delay)
+                self._sleep_fn(delay)
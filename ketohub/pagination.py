@@ -0,0 +1,104 @@
+"""Finds how many listing pages a site has while crawling them.
+
+Sites that list their recipes on numbered pages don't say how many pages
+there are. Paginator discovers the last page by exponential probing (pages 1,
+2, 4, 8, ...) until it hits an empty page, then binary search between the last
+full page and the first empty one. Every page below the last known full page
+is requested as soon as it's known to exist, so the listing is fetched
+concurrently while the search is still narrowing down the end, and at most a
+logarithmic number of requests is spent on empty pages.
+
+Only an empty page ends the listing. A page that fails to download is
+requested again, and if it keeps failing the search gives up on the pages from
+there on, but still looks for the last page below it.
+"""
+
+# How many times a page is requested before the paginator gives up on it.
+_MAX_ATTEMPTS = 3
+
+
+class Paginator(object):
+    """Decides which listing pages to request next.
+
+    Call start() for the first pages to request, then page_done() with the
+    result of every requested page or page_failed() if it couldn't be
+    downloaded, both of which return the pages to request next. Pages are
+    numbered from 1.
+    """
+
+    def __init__(self, max_pages, max_attempts=_MAX_ATTEMPTS):
+        self._max_pages = max_pages
+        self._max_attempts = max_attempts
+        self._requested = set()
+        self._attempts = {}
+        # The first probe that kept failing, or None. No page from there on is
+        # probed again.
+        self._first_failed = None
+        self._filled = 0
+        self._last_full = 0
+        # The first page known to be empty, or None while the end is unknown.
+        self._first_empty = None
+        self._probe = None
+
+    def start(self):
+        return self._next_pages()
+
+    def page_done(self, page, empty):
+        """Records the result of a page and returns the pages to request next.
+
+        Args:
+            page: Number of the page.
+            empty: Whether the page had no new recipes.
+
+        Returns:
+            A list of page numbers to request.
+        """
+        if empty:
+            if self._first_empty is None or page < self._first_empty:
+                self._first_empty = page
+        else:
+            self._last_full = max(self._last_full, page)
+        if page == self._probe:
+            self._probe = None
+        return self._next_pages()
+
+    def page_failed(self, page):
+        """Records that a page couldn't be downloaded.
+
+        Args:
+            page: Number of the page.
+
+        Returns:
+            A list of page numbers to request next: the page itself until it
+            has been attempted max_attempts times, then the pages that are
+            still known to exist.
+        """
+        attempts = self._attempts.get(page, 1) + 1
+        self._attempts[page] = attempts
+        if attempts <= self._max_attempts:
+            return [page]
+        if page == self._probe:
+            self._probe = None
+            if self._first_failed is None or page < self._first_failed:
+                self._first_failed = page
+        return self._next_pages()
+
+    def _end(self):
+        return min(page for page in (self._first_empty, self._first_failed,
+                                     self._max_pages + 1) if page is not None)
+
+    def _next_pages(self):
+        pages = []
+        if self._probe is None and self._end() - self._last_full > 1:
+            if self._first_empty is None and self._first_failed is None:
+                probe = min(max(1, self._last_full * 2), self._max_pages)
+            else:
+                probe = (self._last_full + self._end()) // 2
+            self._probe = probe
+            pages.append(probe)
+        for page in range(self._filled + 1, self._last_full + 1):
+            if page not in self._requested:
+                pages.append(page)
+        self._filled = max(self._filled, self._last_full)
+        self._requested.update(pages)
+        return sorted(pages)
@@ -1,25 +1,87 @@
+import errno
+import gzip
+import hashlib
 import json
 import os
+import shutil
+import tempfile
+import uuid
+
+# Directories this process has already created, so that repeated writes into
+# the same directory don't each pay for a filesystem check.
+_created_directories = set()
 
 
 def _ensure_directory_exists(directory_path):
     """Ensures the directories in directory_path exist."""
-    if not os.path.exists(directory_path):
+    if directory_path in _created_directories:
+        return
+    try:
         os.makedirs(directory_path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    _created_directories.add(directory_path)
+
+
+def _temp_path(filepath):
+    """Returns an unused path in filepath's directory to write to first."""
+    return '%s.%s.tmp' % (filepath, uuid.uuid4().hex)
+
+
+def _replace_file(temp_path, filepath):
+    """Moves a fully written temporary file over filepath.
+
+    filepath may be hard-linked from a previous snapshot, so it is replaced
+    rather than rewritten in place, which would change that snapshot too.
+    """
+    try:
+        os.replace(temp_path, filepath)
+    except OSError:
+        os.remove(temp_path)
+        raise
 
 
 def _write_to_file(filepath, content):
     """writes content to a local file."""
+    if not isinstance(content, bytes):
+        content = content.encode('utf8')
     _ensure_directory_exists(os.path.dirname(filepath))
-    open(filepath, 'wb').write(content)
+    temp_path = _temp_path(filepath)
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(content)
+    except (IOError, OSError):
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    _replace_file(temp_path, filepath)
+
+
+def _link_file(source_path, filepath):
+    """Hard-links an existing local file to filepath, copying if needed."""
+    _ensure_directory_exists(os.path.dirname(filepath))
+    temp_path = _temp_path(filepath)
+    try:
+        os.link(source_path, temp_path)
+    except OSError:
+        # Hard links fail across filesystems, so fall back to a plain copy.
+        shutil.copyfile(source_path, temp_path)
+    _replace_file(temp_path, filepath)
 
 
 class ContentSaver(object):
     """Saves recipe content to disk."""
 
-    def __init__(self, root, write_file_fn=_write_to_file):
+    def __init__(self,
+                 root,
+                 write_file_fn=_write_to_file,
+                 link_file_fn=_link_file,
+                 close_fn=None):
         self._root = root
         self._write_file_fn = write_file_fn
+        self._link_file_fn = link_file_fn
+        self._close_fn = close_fn
 
     def save_metadata(self, key, metadata):
         self._write_file_fn(
@@ -29,5 +91,79 @@ class ContentSaver(object):
     def save_recipe_html(self, key, recipe_html):
         self._write_file_fn(self._output_path(key, 'index.html'), recipe_html)
 
+    def link_recipe_html(self, key, source_path):
+        """Reuses an unchanged recipe page saved by a previous crawl."""
+        self._link_file_fn(source_path, self._output_path(key, 'index.html'))
+
+    def close(self):
+        """Releases the underlying storage once all content is saved."""
+        if self._close_fn:
+            self._close_fn()
+
     def _output_path(self, key, filename):
         return os.path.join(self._root, key, filename)
+
+
+class BlobStore(object):
+    """Stores file content once per unique hash, gzip-compressed.
+
+    Files written through the store are replaced in the snapshot tree by a
+    small manifest (the original path plus a .blob suffix) that names the
+    compressed blob holding their content, so identical pages saved by
+    different snapshots share a single copy on disk.
+    """
+
+    def __init__(self, root, blob_filenames=('index.html',)):
+        self._root = root
+        self._blob_filenames = blob_filenames
+
+    def write_file(self, filepath, content):
+        """Writes content to filepath, storing it as a blob if eligible."""
+        if os.path.basename(filepath) not in self._blob_filenames:
+            _write_to_file(filepath, content)
+            return
+        digest = self._put(content)
+        _write_to_file(
+            _manifest_path(filepath),
+            json.dumps({
+                'sha256': digest,
+                'size': len(content),
+                'compression': 'gzip',
+            }).encode('utf8'))
+
+    def link_file(self, source_path, filepath):
+        """Points filepath at the same blob as a previously saved file."""
+        _link_file(_manifest_path(source_path), _manifest_path(filepath))
+
+    def read_file(self, filepath):
+        """Returns the content saved at filepath."""
+        if os.path.exists(filepath):
+            with open(filepath, 'rb') as f:
+                return f.read()
+        with open(_manifest_path(filepath)) as f:
+            manifest = json.load(f)
+        with gzip.open(self._blob_path(manifest['sha256']), 'rb') as f:
+            return f.read()
+
+    def _put(self, content):
+        digest = hashlib.sha256(content).hexdigest()
+        blob_path = self._blob_path(digest)
+        if os.path.exists(blob_path):
+            return digest
+        blob_dir = os.path.dirname(blob_path)
+        _ensure_directory_exists(blob_dir)
+        # Write to a temporary file and rename it into place so that a reader
+        # never sees a partially written blob.
+        fd, temp_path = tempfile.mkstemp(dir=blob_dir)
+        with os.fdopen(fd, 'wb') as temp_file:
+            with gzip.GzipFile(fileobj=temp_file, mode='wb') as gzip_file:
+                gzip_file.write(content)
+        os.rename(temp_path, blob_path)
+        return digest
+
+    def _blob_path(self, digest):
+        return os.path.join(self._root, digest[:2], digest + '.gz')
+
+
+def _manifest_path(filepath):
+    return filepath + '.blob'
@@ -0,0 +1,370 @@
+import json
+import logging
+import os
+import time
+
+from twisted.internet import defer
+from twisted.internet import threads
+from twisted.python import threadpool
+
+from ketohub import archive
+from ketohub import html_filter
+from ketohub import incremental
+from ketohub import manifest
+from ketohub import metrics
+from ketohub import near_dup
+from ketohub import object_store
+from ketohub import persist
+from ketohub import recipe_extract
+from ketohub import shared_queue
+
+logger = logging.getLogger(__name__)
+
+
+class Error(Exception):
+    """Base Error class."""
+    pass
+
+
+class MissingDownloadDirectory(Error):
+    """Error raised when the download directory is not defined."""
+    pass
+
+
+class MissingBlobDirectory(Error):
+    """Error raised when content-addressed storage has no blob directory."""
+    pass
+
+
+class MissingObjectStoreBucket(Error):
+    """Error raised when object-store storage has no bucket."""
+    pass
+
+
+class MissingObjectStoreLibrary(Error):
+    """Error raised when object-store storage can't import its client."""
+    pass
+
+
+def _get_download_root(settings):
+    download_root = settings.get('DOWNLOAD_ROOT')
+    if not download_root:
+        raise MissingDownloadDirectory(
+            'Make sure you\'re providing a download directory.')
+    return download_root
+
+
+def _get_content_saver(settings):
+    storage_backend = settings.get('STORAGE_BACKEND')
+    if storage_backend == 'archive':
+        download_root = _get_download_root(settings)
+        writer = archive.get_writer(
+            os.path.join(download_root, archive.ARCHIVE_FILENAME),
+            download_root)
+        return persist.ContentSaver(download_root,
+                                    write_file_fn=writer.write_file,
+                                    link_file_fn=writer.link_file,
+                                    close_fn=writer.release)
+    if storage_backend == 'object-store':
+        return _get_object_store_saver(settings)
+    if storage_backend != 'content-addressed':
+        return persist.ContentSaver(_get_download_root(settings))
+
+    blob_root = settings.get('BLOB_ROOT')
+    if not blob_root:
+        raise MissingBlobDirectory(
+            'Make sure you\'re providing a BLOB_ROOT for content-addressed '
+            'storage.')
+    blob_store = persist.BlobStore(blob_root)
+    return persist.ContentSaver(_get_download_root(settings),
+                                write_file_fn=blob_store.write_file,
+                                link_file_fn=blob_store.link_file)
+
+
+def _get_object_store_saver(settings):
+    bucket = settings.get('OBJECT_STORE_BUCKET')
+    if not bucket:
+        raise MissingObjectStoreBucket(
+            'Make sure you\'re providing an OBJECT_STORE_BUCKET for '
+            'object-store storage.')
+    if not object_store.available():
+        raise MissingObjectStoreLibrary(
+            'Object-store storage requires boto3 to be installed.')
+    download_root = _get_download_root(settings)
+    client = object_store.create_client(
+        settings.get('OBJECT_STORE_ENDPOINT_URL'),
+        max_connections=settings.getint('PERSIST_THREADS'))
+    writer = object_store.ObjectStoreWriter(
+        client,
+        bucket,
+        download_root,
+        prefix=settings.get('OBJECT_STORE_PREFIX'),
+        max_retries=settings.getint('OBJECT_STORE_MAX_RETRIES'))
+    return persist.ContentSaver(download_root,
+                                write_file_fn=writer.write_file,
+                                link_file_fn=writer.link_file)
+
+
+def _timed_simhash(html):
+    start = time.perf_counter()
+    fingerprint = near_dup.simhash(html)
+    return time.perf_counter() - start, fingerprint
+
+
+def _timed_previous_simhash(previous_snapshot, key):
+    try:
+        html = previous_snapshot.read_html(key)
+    except IOError:
+        return 0.0, None
+    return _timed_simhash(html)
+
+
+class NearDuplicatePipeline(object):
+    """Replaces pages that duplicate an earlier page in the crawl by pointers.
+
+    A near-duplicate keeps its own metadata.json, with a duplicate_of entry
+    naming the key of the page it duplicates, but its HTML is not saved.
+
+    Every fingerprinted page records its fingerprint as a hex string in the
+    simhash entry of its metadata. Pages that are unchanged since the previous
+    snapshot reuse the fingerprint saved there, or have their previously saved
+    HTML fingerprinted if it has none, so that they are indexed like pages
+    downloaded in full.
+
+    Parsing and fingerprinting a page takes tens of milliseconds, so it runs
+    on a pool of max_threads threads. Only the index lookup runs on the
+    reactor thread.
+    """
+
+    def __init__(self,
+                 max_distance,
+                 stats,
+                 max_threads=1,
+                 previous_snapshot=None):
+        self._index = near_dup.NearDuplicateIndex(max_distance)
+        self._stats = stats
+        self._max_threads = max_threads
+        self._previous_snapshot = previous_snapshot
+        self._pool = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            settings.getint('NEAR_DUPLICATE_MAX_DISTANCE'),
+            crawler.stats,
+            max_threads=settings.getint('NEAR_DUPLICATE_THREADS'),
+            previous_snapshot=incremental.get_previous_snapshot(settings))
+
+    def open_spider(self, spider):
+        self._pool = threadpool.ThreadPool(minthreads=1,
+                                           maxthreads=self._max_threads,
+                                           name='ketohub-near-duplicate')
+        self._pool.start()
+
+    def close_spider(self, spider):
+        self._pool.stop()
+
+    def process_item(self, item, spider):
+        from twisted.internet import reactor
+        metadata = item['metadata']
+        if item.get('html') is not None:
+            d = threads.deferToThreadPool(reactor, self._pool, _timed_simhash,
+                                          item['html'])
+        elif 'duplicate_of' in metadata:
+            # Duplicates carried over from the previous snapshot have no HTML.
+            return item
+        elif metadata.get('simhash'):
+            return self._replace_duplicate((0.0, int(metadata['simhash'], 16)),
+                                           item, spider)
+        elif item.get('previous_html_path') and self._previous_snapshot:
+            d = threads.deferToThreadPool(reactor, self._pool,
+                                          _timed_previous_simhash,
+                                          self._previous_snapshot, item['key'])
+        else:
+            return item
+        d.addCallback(self._replace_duplicate, item, spider)
+        return d
+
+    def _replace_duplicate(self, result, item, spider):
+        # The index and stats aren't thread-safe, so they are only used here,
+        # on the reactor thread.
+        seconds, fingerprint = result
+        if seconds:
+            metrics.record_timing(self._stats, 'near_duplicate', seconds)
+        if fingerprint is None:
+            return item
+        metadata = dict(item['metadata'], simhash='%016x' % fingerprint)
+        original_key = self._index.find(fingerprint)
+        if original_key is None:
+            self._index.add(item['key'], fingerprint)
+            return dict(item, metadata=metadata)
+
+        self._stats.inc_value('near_duplicate/duplicates', spider=spider)
+        metadata['duplicate_of'] = original_key
+        # Without saved HTML, a later incremental crawl must fetch the page in
+        # full rather than revalidate it.
+        metadata.pop('etag', None)
+        metadata.pop('last_modified', None)
+        duplicate = dict(item, metadata=metadata, html=None)
+        # An unchanged page that is now a duplicate isn't linked either.
+        duplicate.pop('previous_html_path', None)
+        return duplicate
+
+
+class RecipeDatasetPipeline(object):
+    """Appends the structured recipe of each item to a JSONL file per spider.
+
+    Every line of DOWNLOAD_ROOT/recipes-<spider>.jsonl is one recipe keyed by
+    its recipe key, so consumers can read a crawl's recipes without parsing
+    its HTML. Near-duplicates and pages without a schema.org Recipe are left
+    out.
+    """
+
+    def __init__(self, download_root, output_suffix=''):
+        self._download_root = download_root
+        self._output_suffix = output_suffix
+        self._file = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(_get_download_root(crawler.settings),
+                   shared_queue.output_suffix(crawler.settings))
+
+    def open_spider(self, spider):
+        persist._ensure_directory_exists(self._download_root)
+        self._file = open(
+            recipe_extract.dataset_path(self._download_root,
+                                        spider.name + self._output_suffix), 'a')
+
+    def close_spider(self, spider):
+        self._file.close()
+
+    def process_item(self, item, spider):
+        recipe = item.get('recipe')
+        if recipe and 'duplicate_of' not in item['metadata']:
+            row = dict(recipe, key=item['key'], url=item['metadata'].get('url'))
+            self._file.write(json.dumps(row, sort_keys=True) + '\n')
+        return item
+
+
+class PersistPipeline(object):
+    """Saves recipe items on a bounded pool of writer threads.
+
+    Writes happen off the reactor thread so that downloads don't wait on disk
+    latency. At most PERSIST_MAX_PENDING writes may be queued at once; beyond
+    that, process_item doesn't return until a write finishes, which makes
+    Scrapy stop feeding the pipeline until the writers catch up.
+
+    If html_filter_fn is set, each page is passed through it on the writer
+    thread before it is saved. If manifest_writer is set, the hash and size of
+    every saved page are recorded with it.
+    """
+
+    def __init__(self,
+                 content_saver,
+                 max_threads,
+                 max_pending,
+                 html_filter_fn=None,
+                 stats=None,
+                 manifest_writer=None,
+                 previous_snapshot=None):
+        self._content_saver = content_saver
+        self._html_filter_fn = html_filter_fn
+        self._stats = stats
+        self._manifest_writer = manifest_writer
+        self._previous_snapshot = previous_snapshot
+        self._max_threads = max_threads
+        self._semaphore = defer.DeferredSemaphore(max_pending)
+        self._pending_writes = set()
+        self._pool = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        content_saver = _get_content_saver(settings)
+        html_filter_fn = None
+        if settings.getbool('REDUCE_HTML'):
+            html_filter_fn = html_filter.reduce_html
+        manifest_name = (crawler.spidercls.name +
+                         shared_queue.output_suffix(settings))
+        manifest_writer = manifest.ManifestWriter(
+            manifest.manifest_path(_get_download_root(settings), manifest_name))
+        return cls(
+            content_saver,
+            max_threads=settings.getint('PERSIST_THREADS'),
+            max_pending=settings.getint('PERSIST_MAX_PENDING'),
+            html_filter_fn=html_filter_fn,
+            stats=crawler.stats,
+            manifest_writer=manifest_writer,
+            previous_snapshot=incremental.get_previous_snapshot(settings))
+
+    def open_spider(self, spider):
+        self._pool = threadpool.ThreadPool(minthreads=1,
+                                           maxthreads=self._max_threads,
+                                           name='ketohub-persist')
+        self._pool.start()
+
+    def close_spider(self, spider):
+        d = defer.DeferredList(list(self._pending_writes))
+        d.addBoth(lambda _: self._content_saver.close())
+        if self._manifest_writer:
+            d.addBoth(lambda _: self._manifest_writer.close())
+        d.addBoth(lambda _: self._pool.stop())
+        return d
+
+    def process_item(self, item, spider):
+        d = self._semaphore.acquire()
+        d.addCallback(self._start_write, item, spider)
+        return d
+
+    def _start_write(self, _, item, spider):
+        from twisted.internet import reactor
+        write = threads.deferToThreadPool(reactor, self._pool, self._save, item)
+        write.addCallback(self._record_write, item)
+        write.addErrback(self._log_failure, item, spider)
+        write.addBoth(self._finish_write, write)
+        self._pending_writes.add(write)
+        return item
+
+    def _finish_write(self, _, write):
+        self._pending_writes.discard(write)
+        self._semaphore.release()
+
+    def _record_write(self, result, item):
+        # Stats and the manifest are only updated here, on the reactor thread,
+        # because neither is thread-safe.
+        seconds, entry = result
+        if self._stats:
+            metrics.record_timing(self._stats, 'persist', seconds)
+        if self._manifest_writer and entry:
+            self._manifest_writer.add(item['key'], entry)
+
+    def _save(self, item):
+        start = time.perf_counter()
+        key = item['key']
+        entry = None
+        self._content_saver.save_metadata(key, item['metadata'])
+        if item.get('previous_html_path'):
+            self._content_saver.link_recipe_html(key,
+                                                 item['previous_html_path'])
+            if self._previous_snapshot:
+                entry = self._previous_snapshot.content_entry(key)
+        elif item['html'] is not None:
+            html = item['html']
+            if self._html_filter_fn:
+                html = self._html_filter_fn(html)
+            self._content_saver.save_recipe_html(key, html)
+            entry = manifest.content_entry(html)
+        elif 'duplicate_of' in item['metadata']:
+            # Record duplicates too, so that a page that becomes a duplicate
+            # shows up as changed rather than removed.
+            entry = manifest.duplicate_entry(item['metadata']['duplicate_of'])
+        return time.perf_counter() - start, entry
+
+    def _log_failure(self, failure, item, spider):
+        logger.error('Failed to save %s',
+                     item['key'],
+                     exc_info=(failure.type, failure.value,
+                               failure.getTracebackObject()),
+                     extra={'spider': spider})
@@ -0,0 +1,154 @@
+"""Extracts structured recipes from schema.org JSON-LD.
+
+A crawl's recipes are saved in DOWNLOAD_ROOT/recipes-<spider>.jsonl, one JSON
+line per recipe. A snapshot's dataset is the union of its spiders' files.
+"""
+
+import glob
+import json
+import os
+import re
+
+_DATASET_PATTERN = 'recipes-*.jsonl'
+_JSON_LD_PATTERN = re.compile(
+    br'<script[^>]*application/ld\+json[^>]*>(.*?)</script>', re.I | re.S)
+
+# Recipe properties copied into the dataset, keyed by their column name.
+_TEXT_PROPERTIES = {
+    'name': 'name',
+    'description': 'description',
+    'prep_time': 'prepTime',
+    'cook_time': 'cookTime',
+    'total_time': 'totalTime',
+}
+
+
+def _is_recipe(node):
+    node_type = node.get('@type')
+    if isinstance(node_type, list):
+        return 'Recipe' in node_type
+    return node_type == 'Recipe'
+
+
+def _find_recipe(node):
+    if isinstance(node, list):
+        for child in node:
+            recipe = _find_recipe(child)
+            if recipe:
+                return recipe
+        return None
+    if not isinstance(node, dict):
+        return None
+    if _is_recipe(node):
+        return node
+    return _find_recipe(node.get('@graph'))
+
+
+def _text(value):
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if value is None or isinstance(value, (dict, list)):
+        return None
+    return str(value).strip()
+
+
+def _image_url(image):
+    if isinstance(image, list):
+        image = image[0] if image else None
+    if isinstance(image, dict):
+        image = image.get('url')
+    return _text(image)
+
+
+def _strings(value):
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        value = [value]
+    return [str(v).strip() for v in value if isinstance(v, (str, int, float))]
+
+
+def _nutrition(nutrition):
+    if not isinstance(nutrition, dict):
+        return {}
+    return {
+        name: _text(value)
+        for name, value in nutrition.items()
+        if not name.startswith('@') and _text(value)
+    }
+
+
+def dataset_path(snapshot_root, spider_name):
+    return os.path.join(snapshot_root, 'recipes-%s.jsonl' % spider_name)
+
+
+def read_dataset(snapshot_root):
+    """Reads the recipes of a snapshot.
+
+    Args:
+        snapshot_root: Directory of the snapshot.
+
+    Returns:
+        A dictionary mapping each recipe key to its row.
+    """
+    rows = {}
+    for path in sorted(glob.glob(os.path.join(snapshot_root,
+                                              _DATASET_PATTERN))):
+        with open(path) as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue
+                if row.get('key'):
+                    rows[row['key']] = row
+    return rows
+
+
+def json_ld_blocks(html, encoding='utf-8'):
+    """Returns the text of each application/ld+json script in a page.
+
+    Args:
+        html: The page as bytes.
+        encoding: Encoding of the page.
+    """
+    # A regular expression over the raw bytes avoids decoding and parsing the
+    # whole page.
+    return [
+        block.decode(encoding, 'replace')
+        for block in _JSON_LD_PATTERN.findall(html)
+    ]
+
+
+def extract_recipe(json_ld_blocks):
+    """Finds a schema.org Recipe in a page's JSON-LD blocks.
+
+    Args:
+        json_ld_blocks: The text of each application/ld+json script on the
+            page.
+
+    Returns:
+        A dictionary with the recipe's name, description, image, ingredients,
+        yield, nutrition and times, or None if the page has no Recipe.
+    """
+    for block in json_ld_blocks:
+        try:
+            # Many sites leave raw newlines in their JSON-LD strings.
+            recipe = _find_recipe(json.loads(block, strict=False))
+        except ValueError:
+            continue
+        if recipe:
+            break
+    else:
+        return None
+
+    row = {
+        column: _text(recipe.get(name))
+        for column, name in _TEXT_PROPERTIES.items()
+    }
+    row['image'] = _image_url(recipe.get('image'))
+    row['ingredients'] = _strings(
+        recipe.get('recipeIngredient', recipe.get('ingredients')))
+    row['recipe_yield'] = _text(recipe.get('recipeYield'))
+    row['nutrition'] = _nutrition(recipe.get('nutrition'))
+    return row
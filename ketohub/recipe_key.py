@@ -1,17 +1,53 @@
+import functools
 import re
 
+# Query parameters that only track where a visitor came from and never change
+# the page's content.
+_TRACKING_PARAM_PATTERN = re.compile(
+    r'^(?:utm_[a-z_]*|fbclid|gclid|mc_[ce]id)$', re.IGNORECASE)
+_KEY_PREFIX_PATTERN = re.compile(r'^(?:https?://)?(?:www\.)?')
+_NON_KEY_CHARS_PATTERN = re.compile(r'[^a-z0-9/]')
 
+_CACHE_SIZE = 1 << 16
+
+
+def _strip_tracking_params(query):
+    params = [
+        param for param in query.split('&')
+        if param and not _TRACKING_PARAM_PATTERN.match(param.split('=', 1)[0])
+    ]
+    return '&'.join(params)
+
+
+@functools.lru_cache(maxsize=_CACHE_SIZE)
+def canonical_url(url):
+    """Returns the canonical form of a URL.
+
+    The scheme and host are lowercased, and the fragment and any tracking
+    parameters (utm_*, fbclid, gclid, ...) are removed. Other query parameters
+    are kept in their original order.
+    """
+    url = url.split('#', 1)[0]
+    url, separator, query = url.partition('?')
+    if separator:
+        query = _strip_tracking_params(query)
+    scheme, separator, rest = url.partition('://')
+    if separator:
+        host, slash, path = rest.partition('/')
+        url = scheme.lower() + '://' + host.lower() + slash + path
+    if query:
+        url += '?' + query
+    return url
+
+
+@functools.lru_cache(maxsize=_CACHE_SIZE)
 def from_url(url):
     """Converts a URL to a recipe key."""
-    # Strip out http:// or https:// prefix.
-    url = re.sub(r'^https?://', '', url)
-    # Strip out www subdomain.
-    url = re.sub(r'^www\.', '', url)
+    # Strip out the http:// or https:// prefix and www subdomain, so every
+    # variant of a page's URL maps to the same key.
+    key = _KEY_PREFIX_PATTERN.sub('', canonical_url(url), count=1)
     # Strip trailing slash
-    url = re.sub(r'/$', '', url)
-    # Convert all characters to lowercase
-    url = url.lower()
-    # Replace all non a-z0-9/ characters with -
-    url = re.sub(r'[^a-z0-9/]', '-', url)
-    # Replace all / characters with _
-    return re.sub(r'/', '_', url)
+    if key.endswith('/'):
+        key = key[:-1]
+    # Replace all non a-z0-9/ characters with - and all / characters with _.
+    return _NON_KEY_CHARS_PATTERN.sub('-', key.lower()).replace('/', '_')
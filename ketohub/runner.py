@@ -0,0 +1,252 @@
+"""Runs all ketohub spiders concurrently in a single process.
+
+Each spider gets its own crawler (and therefore its own downloader slots), so
+per-domain politeness settings such as DOWNLOAD_DELAY still apply to each site,
+but the sites are crawled in parallel on one Twisted reactor instead of one
+`scrapy crawl` invocation after another.
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+from scrapy import crawler
+from scrapy.utils import project
+
+from ketohub import persist
+from ketohub import validate
+
+# File in a --job-dir that records the snapshot the job is saving into.
+_JOB_DOWNLOAD_ROOT_FILENAME = 'download-root'
+
+
+def _timestamp():
+    """Returns a timestamp suitable for naming a snapshot directory."""
+    return time.strftime('%Y-%m-%dT%H%M%S%z')
+
+
+def _read_job_download_root(job_root):
+    """Returns the download root recorded in job_root, or None."""
+    try:
+        with open(os.path.join(job_root, _JOB_DOWNLOAD_ROOT_FILENAME)) as f:
+            return f.read().strip() or None
+    except IOError:
+        return None
+
+
+def _save_job_download_root(job_root, download_root):
+    persist._ensure_directory_exists(job_root)
+    with open(os.path.join(job_root, _JOB_DOWNLOAD_ROOT_FILENAME), 'w') as f:
+        f.write(download_root + '\n')
+
+
+def crawl(settings, spider_names=None, job_root=None, spider_args=None):
+    """Crawls the given spiders concurrently and blocks until all finish.
+
+    Args:
+        settings: Scrapy settings shared by every spider in the run.
+        spider_names: Names of the spiders to run. If empty, runs every spider
+            in the project.
+        job_root: If set, each spider keeps its request queue and seen
+            requests in a JOBDIR under job_root, so an interrupted run resumes
+            where it stopped when started again with the same job_root.
+        spider_args: Dictionary mapping spider names to the keyword
+            arguments of their spiders.
+    """
+    process = crawler.CrawlerProcess(settings)
+    if not spider_names:
+        spider_names = process.spider_loader.list()
+    spider_args = spider_args or {}
+    for spider_name in sorted(spider_names):
+        kwargs = spider_args.get(spider_name, {})
+        if not job_root:
+            process.crawl(spider_name, **kwargs)
+            continue
+        # Scrapy can't share a JOBDIR between spiders, so give each one its
+        # own.
+        spider_settings = settings.copy()
+        spider_settings.set('JOBDIR',
+                            os.path.join(job_root, spider_name),
+                            priority='cmdline')
+        process.crawl(
+            crawler.Crawler(process.spider_loader.load(spider_name),
+                            spider_settings), **kwargs)
+    process.start()
+
+
+def crawl_workers(settings, worker_count, spider_names=None, spider_args=None):
+    """Crawls the given spiders in worker processes sharing one queue.
+
+    Every worker runs all of the given spiders, and SHARED_QUEUE_PATH in
+    settings must be set, so the workers split each spider's requests between
+    them (see ketohub.shared_queue).
+
+    Args:
+        settings: Scrapy settings shared by every worker.
+        worker_count: Number of worker processes to run.
+        spider_names: Names of the spiders to run. If empty, runs every spider
+            in the project.
+        spider_args: Dictionary mapping spider names to the keyword
+            arguments of their spiders.
+
+    Returns:
+        Whether every worker exited successfully.
+    """
+    workers = [
+        multiprocessing.Process(target=crawl,
+                                args=(settings, spider_names, None,
+                                      spider_args),
+                                name='ketohub-worker-%d' % i)
+        for i in range(worker_count)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return all(worker.exitcode == 0 for worker in workers)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='ketohub-runner',
+        description='Crawl all KetoHub sites concurrently.')
+    parser.add_argument(
+        '--download-root',
+        help=('Directory in which to save the snapshot (defaults to a '
+              'timestamped directory under the DOWNLOAD_ROOT setting)'))
+    parser.add_argument(
+        '--previous-download-root',
+        help=('Snapshot from an earlier run. Recipes saved there are '
+              'revalidated with conditional requests and linked into the new '
+              'snapshot when unchanged'))
+    parser.add_argument(
+        '--job-dir',
+        help=('Directory in which to persist crawl state. Rerunning with the '
+              'same directory resumes an interrupted crawl into the same '
+              '--download-root'))
+    parser.add_argument(
+        '--cache',
+        help=('Directory in which to cache responses, so later runs with the '
+              'same directory reuse them instead of fetching pages again'))
+    parser.add_argument(
+        '--replay',
+        action='store_true',
+        help=('Crawl only from the --cache directory, without fetching pages '
+              'that aren\'t in it'))
+    parser.add_argument(
+        '--max-rss-mb',
+        type=int,
+        help=('Pause crawling while the process uses more than this many MB '
+              'of memory'))
+    parser.add_argument(
+        '--recrawl-dir',
+        help=('Directory of recrawl lists written by ketohub.validate. Fetches '
+              'only the listed recipes again, into --download-root'))
+    parser.add_argument(
+        '--shared-queue',
+        help=('SQLite database on a local disk through which to share the '
+              'crawl with other workers on this machine running with the same '
+              '--shared-queue and --download-root'))
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help=('Number of worker processes to split the crawl between '
+              '(defaults to 1)'))
+    parser.add_argument('--spider',
+                        action='append',
+                        dest='spider_names',
+                        help='Spider to run (repeatable, defaults to all)')
+    args = parser.parse_args()
+    if args.replay and not args.cache:
+        parser.error('--replay requires --cache')
+    if args.recrawl_dir and not args.download_root:
+        parser.error('--recrawl-dir requires the --download-root to repair')
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if args.job_dir and (args.shared_queue or args.workers > 1):
+        parser.error('--job-dir can\'t be combined with a shared queue, '
+                     'which already keeps the crawl\'s state')
+
+    job_download_root = None
+    if args.job_dir:
+        job_download_root = _read_job_download_root(args.job_dir)
+    if (job_download_root and args.download_root and
+            os.path.abspath(args.download_root) != job_download_root):
+        parser.error('--job-dir %s resumes the crawl into %s, not %s' %
+                     (args.job_dir, job_download_root, args.download_root))
+
+    settings = project.get_project_settings()
+    if (settings.get('STORAGE_BACKEND') == 'archive' and
+        (args.shared_queue or args.workers > 1)):
+        parser.error('STORAGE_BACKEND=archive can\'t be shared between '
+                     'workers, which would write to the same archive')
+    download_root = args.download_root or job_download_root
+    if not download_root:
+        download_root = os.path.join(settings.get('DOWNLOAD_ROOT'),
+                                     _timestamp(), '')
+    settings.set('DOWNLOAD_ROOT', download_root, priority='cmdline')
+    if args.job_dir and not job_download_root:
+        # A resumed crawl skips the pages it has already seen, so it must
+        # save the rest of them into the same snapshot.
+        _save_job_download_root(args.job_dir, os.path.abspath(download_root))
+    if args.previous_download_root:
+        settings.set('PREVIOUS_DOWNLOAD_ROOT',
+                     args.previous_download_root,
+                     priority='cmdline')
+    if args.cache:
+        settings.set('HTTPCACHE_ENABLED', True, priority='cmdline')
+        settings.set('HTTPCACHE_DIR',
+                     os.path.abspath(args.cache),
+                     priority='cmdline')
+        settings.set('HTTPCACHE_IGNORE_MISSING',
+                     args.replay,
+                     priority='cmdline')
+        if args.replay:
+            # Replay every cached page, however old, since expired entries
+            # would otherwise be treated as missing.
+            settings.set('HTTPCACHE_EXPIRATION_SECS', 0, priority='cmdline')
+    if args.max_rss_mb:
+        settings.set('MEMORY_BACKPRESSURE_LIMIT_MB',
+                     args.max_rss_mb,
+                     priority='cmdline')
+
+    spider_names = args.spider_names
+    spider_args = None
+    if args.recrawl_dir:
+        recrawl_lists = validate.read_recrawl_lists(args.recrawl_dir)
+        spider_args = {
+            spider_name: {
+                'recrawl_urls': path
+            } for spider_name, path in recrawl_lists.items()
+        }
+        spider_names = [
+            spider_name for spider_name in sorted(recrawl_lists)
+            if not args.spider_names or spider_name in args.spider_names
+        ]
+        if not spider_names:
+            print('Nothing to recrawl in %s' % args.recrawl_dir)
+            return
+
+    shared_queue_path = args.shared_queue
+    if args.workers > 1 and not shared_queue_path:
+        shared_queue_path = os.path.join(download_root, 'shared-queue.sqlite')
+    if shared_queue_path:
+        settings.set('SCHEDULER',
+                     'ketohub.shared_queue.SharedQueueScheduler',
+                     priority='cmdline')
+        settings.set('SHARED_QUEUE_PATH',
+                     os.path.abspath(shared_queue_path),
+                     priority='cmdline')
+
+    if args.workers > 1:
+        if not crawl_workers(settings, args.workers, spider_names, spider_args):
+            sys.exit(1)
+        return
+    crawl(settings, spider_names, args.job_dir, spider_args)
+
+
+if __name__ == '__main__':
+    main()
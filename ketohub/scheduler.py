@@ -0,0 +1,64 @@
+"""Scheduler that keeps pending requests on disk.
+
+Scrapy only queues requests on disk when the crawl has a JOBDIR; otherwise
+every pending request stays in memory until it's downloaded, which adds up on
+sites with long listings. With SCHEDULER_SPILL_TO_DISK, SpillingScheduler
+gives crawls without a JOBDIR a temporary disk queue, removed when the spider
+closes. Requests that can't be serialized still fall back to the memory
+queue.
+"""
+
+import logging
+import shutil
+import tempfile
+
+from scrapy.core import scheduler
+from scrapy.utils import job
+from scrapy.utils import misc
+
+logger = logging.getLogger(__name__)
+
+
+class SpillingScheduler(scheduler.Scheduler):
+    """Scheduler that queues requests on disk even without a JOBDIR."""
+
+    def __init__(self, *args, **kwargs):
+        self._spill_dir = kwargs.pop('spill_dir', None)
+        super(SpillingScheduler, self).__init__(*args, **kwargs)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        jobdir = job.job_dir(settings)
+        spill_dir = None
+        if not jobdir and settings.getbool('SCHEDULER_SPILL_TO_DISK'):
+            spill_dir = tempfile.mkdtemp(
+                prefix='ketohub-queue-',
+                dir=settings.get('SCHEDULER_SPILL_ROOT'))
+            jobdir = spill_dir
+        dupefilter_cls = misc.load_object(settings['DUPEFILTER_CLASS'])
+        return cls(
+            dupefilter=misc.create_instance(dupefilter_cls, settings, crawler),
+            jobdir=jobdir,
+            dqclass=misc.load_object(settings['SCHEDULER_DISK_QUEUE']),
+            mqclass=misc.load_object(settings['SCHEDULER_MEMORY_QUEUE']),
+            logunser=settings.getbool('SCHEDULER_DEBUG'),
+            stats=crawler.stats,
+            pqclass=misc.load_object(settings['SCHEDULER_PRIORITY_QUEUE']),
+            crawler=crawler,
+            spill_dir=spill_dir)
+
+    def open(self, spider):
+        if self._spill_dir:
+            logger.info('Queuing pending requests in %s',
+                        self._spill_dir,
+                        extra={'spider': spider})
+        return super(SpillingScheduler, self).open(spider)
+
+    def close(self, reason):
+        result = super(SpillingScheduler, self).close(reason)
+        if self._spill_dir:
+            # Without a JOBDIR, the crawl can't resume, so the queue left
+            # behind is of no use.
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+        return result
@@ -1,14 +1,128 @@
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:65.0) Gecko/20100101 Firefox/65.0"
 BOT_NAME = 'ketohub'
 
-SPIDER_MODULES = ['ketohub.spiders']
-NEWSPIDER_MODULE = 'ketohub.spiders'
+# Spiders are built on demand from the site definitions in ketohub.sites.
+SPIDER_LOADER_CLASS = 'ketohub.spider_loader.SiteSpiderLoader'
 
 ROBOTSTXT_OBEY = False
 
 # Default location for the scraped data
 DOWNLOAD_ROOT = 'download_output/'
 
+# How recipes are stored under DOWNLOAD_ROOT: 'files' writes each page as-is,
+# 'content-addressed' stores each unique page once, gzipped, under BLOB_ROOT and
+# writes small manifests pointing to it into the snapshot, and 'archive'
+# appends every file to a single indexed snapshot.tar. 'object-store' uploads
+# every file to OBJECT_STORE_BUCKET (on S3, or on an S3-compatible service at
+# OBJECT_STORE_ENDPOINT_URL) instead of writing it under DOWNLOAD_ROOT.
+STORAGE_BACKEND = 'files'
+BLOB_ROOT = None
+OBJECT_STORE_BUCKET = None
+OBJECT_STORE_PREFIX = ''
+OBJECT_STORE_ENDPOINT_URL = None
+OBJECT_STORE_MAX_RETRIES = 3
+
+# Snapshot from a previous crawl to revalidate against (incremental mode).
+PREVIOUS_DOWNLOAD_ROOT = None
+
+# Skip sitemap entries last modified before this ISO 8601 date.
+SITEMAP_LASTMOD_SINCE = None
+
+# Delay each site starts at. ketohub.throttle.AdaptiveThrottle then adjusts
+# every domain's delay and concurrency to how well it responds, within the
+# bounds below or those set on the site in ketohub.sites. By default a site is
+# never crawled faster than DOWNLOAD_DELAY allows; only sites with their own
+# bounds may speed up.
 DOWNLOAD_DELAY = 1.0
+ADAPTIVE_THROTTLE_ENABLED = True
+ADAPTIVE_THROTTLE_MIN_DELAY = DOWNLOAD_DELAY
+ADAPTIVE_THROTTLE_MAX_DELAY = 60.0
+ADAPTIVE_THROTTLE_MAX_CONCURRENCY = 1
+# Responses slower than this many seconds make a domain slow down.
+ADAPTIVE_THROTTLE_TARGET_LATENCY = 2.0
+# How often, in seconds, to log each domain's effective rate.
+ADAPTIVE_THROTTLE_REPORT_INTERVAL = 60.0
+
+# Dedupe requests (and persist the seen set when JOBDIR is set) by recipe key.
+REQUEST_FINGERPRINTER_CLASS = (
+    'ketohub.fingerprint.RecipeKeyRequestFingerprinter')
+
+# Remember seen requests in a fixed-size Bloom filter rather than a set that
+# grows with the crawl. A false positive skips a page, so keep the error rate
+# low; raise the capacity for crawls of more than this many requests.
+DUPEFILTER_CLASS = 'ketohub.dupefilter.BloomDupeFilter'
+DUPEFILTER_CAPACITY = 1000000
+DUPEFILTER_ERROR_RATE = 0.00001
+
+# Queue pending requests on disk, in a temporary directory under
+# SCHEDULER_SPILL_ROOT (the system default if None) when JOBDIR isn't set.
+SCHEDULER = 'ketohub.scheduler.SpillingScheduler'
+SCHEDULER_SPILL_TO_DISK = True
+SCHEDULER_SPILL_ROOT = None
+
+# To split a crawl between worker processes on one machine, set SCHEDULER to
+# 'ketohub.shared_queue.SharedQueueScheduler' and give every worker the same
+# SHARED_QUEUE_PATH on a local disk (the runner's --workers and --shared-queue
+# flags do this).
+# Workers lease requests SHARED_QUEUE_BATCH_SIZE at a time, and requests
+# leased by a worker that dies are retried after SHARED_QUEUE_LEASE_SECONDS.
+SHARED_QUEUE_PATH = None
+SHARED_QUEUE_WORKER = None
+SHARED_QUEUE_BATCH_SIZE = 8
+SHARED_QUEUE_LEASE_SECONDS = 600
+
+AUTOTHROTTLE_ENABLED = False
+
+EXTENSIONS = {
+    'ketohub.throttle.AdaptiveThrottle': 500,
+    'ketohub.metrics.CrawlMetrics': 510,
+    'ketohub.backpressure.MemoryBackpressure': 520,
+}
+
+# Pause crawling while the process's RSS is over this many MB (0 disables the
+# limit), until it drops below MEMORY_BACKPRESSURE_RESUME_RATIO of it.
+MEMORY_BACKPRESSURE_LIMIT_MB = 0
+MEMORY_BACKPRESSURE_RESUME_RATIO = 0.9
+MEMORY_BACKPRESSURE_CHECK_INTERVAL = 1.0
+
+# Write per-stage timings and per-rule counts for each spider into
+# DOWNLOAD_ROOT when it closes. With METRICS_PROFILE, also save a cProfile
+# profile of the recipe callbacks.
+METRICS_ENABLED = True
+METRICS_PROFILE = False
+
+DOWNLOADER_MIDDLEWARES = {
+    'ketohub.incremental.ConditionalRequestMiddleware': 560,
+    'scrapy.downloadermiddlewares.redirect.RedirectMiddleware': None,
+    'ketohub.fingerprint.SameRecipeRedirectMiddleware': 600,
+}
+
+# Response cache for development runs, off by default. Enable it with the
+# runner's --cache flag, and add --replay to crawl from the cache offline.
+HTTPCACHE_ENABLED = False
+HTTPCACHE_STORAGE = 'ketohub.httpcache.CanonicalCacheStorage'
+HTTPCACHE_DIR = 'httpcache'
+HTTPCACHE_EXPIRATION_SECS = 7 * 24 * 60 * 60
+HTTPCACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+HTTPCACHE_IGNORE_HTTP_CODES = [304, 429, 500, 502, 503, 504]
+
+ITEM_PIPELINES = {
+    'ketohub.pipelines.NearDuplicatePipeline': 200,
+    'ketohub.pipelines.RecipeDatasetPipeline': 250,
+    'ketohub.pipelines.PersistPipeline': 300,
+}
+
+# Pages whose main content fingerprints differ in at most this many of 64 bits
+# are saved as pointers to the first copy instead of in full.
+NEAR_DUPLICATE_MAX_DISTANCE = 3
+# Pages are fingerprinted on a pool of this many threads, off the reactor.
+NEAR_DUPLICATE_THREADS = 2
+
+# Recipes are written on a pool of PERSIST_THREADS threads. Once
+# PERSIST_MAX_PENDING writes are queued, the crawl waits for them to drain.
+PERSIST_THREADS = 4
+PERSIST_MAX_PENDING = 100
 
-AUTOTHROTTLE_ENABLED = True
+# Save only each page's title, schema.org JSON-LD and article content instead
+# of the full page.
+REDUCE_HTML = False
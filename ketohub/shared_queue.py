@@ -0,0 +1,443 @@
+"""Request queue shared by crawler processes, so they can split one crawl.
+
+Every worker of a distributed crawl runs the same spiders with
+SCHEDULER = 'ketohub.shared_queue.SharedQueueScheduler' and the same
+SHARED_QUEUE_PATH, a SQLite database on a local disk. The database uses
+SQLite's write-ahead log, which doesn't work over network filesystems, so all
+the workers must run on the same machine. Each spider's requests go into the
+database instead of a per-process queue, and the database doubles as the
+crawl's seen-set: a request whose fingerprint (see ketohub.fingerprint) was
+already queued by any worker is dropped, so every page is fetched once no
+matter which worker found it.
+
+Requests with the 'discovery' meta key set, such as the sitemaps and listing
+pages through which a spider finds its recipes, depend on state kept by the
+spider that made them. For each spider, one worker claims discovery in the
+database and keeps those requests in its own queue; the other workers drop
+theirs and only take the requests the discoverer shares. The discoverer holds
+its claim on a lease, so if it dies before it's done, another worker takes
+discovery over and starts it again from the spider's start requests.
+
+Workers take requests in small batches and hold a lease on them until they
+are downloaded and their responses have been handled, including queueing the
+requests they lead to. If a worker dies, its leases expire after
+SHARED_QUEUE_LEASE_SECONDS and other workers pick its requests up. A worker
+stops once no requests for its spider are pending or leased by anyone.
+
+Files written once per spider (manifests, recipe datasets and metrics) get
+the worker's name in their filename, so workers sharing a DOWNLOAD_ROOT don't
+write to the same file.
+"""
+
+import collections
+import contextlib
+import logging
+import os
+import pickle
+import socket
+import sqlite3
+import time
+
+from scrapy.core import scheduler
+from scrapy.utils import request as request_utils
+
+logger = logging.getLogger(__name__)
+
+_PENDING = 0
+_LEASED = 1
+_DONE = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS requests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    spider TEXT NOT NULL,
+    seen_key TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    data BLOB,
+    state INTEGER NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    UNIQUE (spider, seen_key)
+);
+CREATE INDEX IF NOT EXISTS requests_by_state
+    ON requests (spider, state, priority DESC, id);
+CREATE TABLE IF NOT EXISTS discovery (
+    spider TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    lease_expires REAL NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# States of a spider's discovery.
+DISCOVERY_UNCLAIMED = 'unclaimed'
+DISCOVERY_RUNNING = 'running'
+DISCOVERY_EXPIRED = 'expired'
+DISCOVERY_DONE = 'done'
+
+
+def worker_name(settings):
+    """Returns the name of this worker process in a distributed crawl."""
+    return settings.get(
+        'SHARED_QUEUE_WORKER') or '%s-%d' % (socket.gethostname(), os.getpid())
+
+
+def output_suffix(settings):
+    """Returns the suffix for this worker's per-spider output filenames."""
+    if not settings.get('SHARED_QUEUE_PATH'):
+        return ''
+    return '.' + worker_name(settings)
+
+
+class SqliteRequestQueue(object):
+    """Queue of serialized requests with a seen-set and leases, in SQLite.
+
+    Any number of processes may open the same database. Each must use its
+    own SqliteRequestQueue.
+    """
+
+    def __init__(self, path, timeout=60.0):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._connection = sqlite3.connect(path,
+                                           timeout=timeout,
+                                           isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.executescript(_SCHEMA)
+
+    def push(self, spider, seen_key, data, priority=0):
+        """Queues a request unless one with the same seen_key was queued.
+
+        Returns:
+            Whether the request was queued.
+        """
+        cursor = self._connection.execute(
+            'INSERT OR IGNORE INTO requests '
+            '(spider, seen_key, priority, data, state) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (spider, seen_key, priority, data, _PENDING))
+        return cursor.rowcount == 1
+
+    def lease(self, spider, owner, count, lease_seconds, now=None):
+        """Takes up to count pending requests, highest priority first.
+
+        Requests whose lease expired count as pending again.
+
+        Returns:
+            A list of (row ID, serialized request) pairs.
+        """
+        now = time.time() if now is None else now
+        with self._transaction():
+            rows = self._connection.execute(
+                'SELECT id, data FROM requests '
+                'WHERE spider = ? AND (state = ? OR '
+                '(state = ? AND lease_expires < ?)) '
+                'ORDER BY priority DESC, id LIMIT ?',
+                (spider, _PENDING, _LEASED, now, count)).fetchall()
+            self._connection.executemany(
+                'UPDATE requests SET state = ?, lease_owner = ?, '
+                'lease_expires = ? WHERE id = ?',
+                [(_LEASED, owner, now + lease_seconds, row_id)
+                 for row_id, _ in rows])
+        return rows
+
+    def ack(self, row_ids):
+        """Marks leased requests as done, keeping their seen_keys."""
+        self._connection.executemany(
+            'UPDATE requests SET state = ?, data = NULL WHERE id = ?',
+            [(_DONE, row_id) for row_id in row_ids])
+
+    def release(self, row_ids):
+        """Returns leased requests to the queue for any worker to take."""
+        self._connection.executemany(
+            'UPDATE requests SET state = ?, lease_owner = NULL, '
+            'lease_expires = NULL WHERE id = ? AND state = ?',
+            [(_PENDING, row_id, _LEASED) for row_id in row_ids])
+
+    def unfinished_count(self, spider):
+        """Returns the number of requests pending or leased by any worker."""
+        return self._connection.execute(
+            'SELECT COUNT(*) FROM requests WHERE spider = ? AND state < ?',
+            (spider, _DONE)).fetchone()[0]
+
+    def claim_discovery(self, spider, owner, lease_seconds, now=None):
+        """Makes owner the worker that discovers the spider's requests.
+
+        The claim succeeds if no worker has claimed discovery yet, if owner
+        already holds it, or if the previous owner's lease expired before it
+        was done.
+
+        Returns:
+            Whether owner holds the claim.
+        """
+        now = time.time() if now is None else now
+        with self._transaction():
+            row = self._connection.execute(
+                'SELECT owner, lease_expires, done FROM discovery '
+                'WHERE spider = ?', (spider,)).fetchone()
+            if row is None:
+                self._connection.execute(
+                    'INSERT INTO discovery (spider, owner, lease_expires) '
+                    'VALUES (?, ?, ?)', (spider, owner, now + lease_seconds))
+                return True
+            current_owner, lease_expires, done = row
+            if done or (current_owner != owner and lease_expires >= now):
+                return False
+            self._connection.execute(
+                'UPDATE discovery SET owner = ?, lease_expires = ? '
+                'WHERE spider = ?', (owner, now + lease_seconds, spider))
+        return True
+
+    def renew_discovery(self, spider, owner, lease_seconds, now=None):
+        """Extends owner's claim on discovery by lease_seconds from now."""
+        now = time.time() if now is None else now
+        self._connection.execute(
+            'UPDATE discovery SET lease_expires = ? '
+            'WHERE spider = ? AND owner = ? AND NOT done',
+            (now + lease_seconds, spider, owner))
+
+    def release_discovery(self, spider, owner):
+        """Gives up owner's unfinished claim so another worker can take it."""
+        self._connection.execute(
+            'UPDATE discovery SET lease_expires = 0 '
+            'WHERE spider = ? AND owner = ? AND NOT done', (spider, owner))
+
+    def finish_discovery(self, spider, owner):
+        """Records that owner has discovered all of the spider's requests."""
+        self._connection.execute(
+            'UPDATE discovery SET done = 1 WHERE spider = ? AND owner = ?',
+            (spider, owner))
+
+    def discovery_state(self, spider, now=None):
+        """Returns the DISCOVERY_* state of the spider's discovery."""
+        now = time.time() if now is None else now
+        row = self._connection.execute(
+            'SELECT lease_expires, done FROM discovery WHERE spider = ?',
+            (spider,)).fetchone()
+        if row is None:
+            return DISCOVERY_UNCLAIMED
+        lease_expires, done = row
+        if done:
+            return DISCOVERY_DONE
+        if lease_expires < now:
+            return DISCOVERY_EXPIRED
+        return DISCOVERY_RUNNING
+
+    def close(self):
+        self._connection.close()
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # Take the write lock up front so that two workers can't both read
+        # the same pending rows before either leases them.
+        self._connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except Exception:
+            self._connection.execute('ROLLBACK')
+            raise
+        self._connection.execute('COMMIT')
+
+
+class SharedQueueScheduler(scheduler.BaseScheduler):
+    """Scheduler that shares its queue and seen-set with other workers."""
+
+    def __init__(self, crawler, path, batch_size, lease_seconds):
+        self._crawler = crawler
+        self._stats = crawler.stats
+        self._fingerprinter = crawler.request_fingerprinter
+        self._path = path
+        self._batch_size = batch_size
+        self._lease_seconds = lease_seconds
+        self._worker = worker_name(crawler.settings)
+        self._queue = None
+        self._spider = None
+        # (row ID, request) pairs leased but not yet handed to the engine.
+        self._leased = collections.deque()
+        # Requests handed to the engine, by row ID, until their responses have
+        # been handled.
+        self._in_flight = {}
+        # Requests that can't be serialized or are for discovery, so only this
+        # worker can run them.
+        self._local = collections.deque()
+        self._local_seen = set()
+        # Local requests handed to the engine until their responses have been
+        # handled.
+        self._local_in_flight = set()
+        # Whether this worker holds the claim on discovery, or None before
+        # its first discovery request.
+        self._discovering = None
+        self._discovery_renewed = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            crawler,
+            settings.get('SHARED_QUEUE_PATH'),
+            batch_size=settings.getint('SHARED_QUEUE_BATCH_SIZE'),
+            lease_seconds=settings.getfloat('SHARED_QUEUE_LEASE_SECONDS'))
+
+    def open(self, spider):
+        self._spider = spider
+        self._queue = SqliteRequestQueue(self._path)
+        logger.info('Sharing the request queue in %s as worker %s',
+                    self._path,
+                    self._worker,
+                    extra={'spider': spider})
+
+    def close(self, reason):
+        self._ack_handled()
+        if self._discovering:
+            self._queue.release_discovery(self._spider.name, self._worker)
+        # Let other workers take over whatever this one didn't finish.
+        self._queue.release([row_id for row_id, _ in self._leased] +
+                            list(self._in_flight))
+        self._leased.clear()
+        self._in_flight.clear()
+        self._queue.close()
+
+    def __len__(self):
+        return (len(self._leased) + len(self._local) +
+                self._queue.unfinished_count(self._spider.name))
+
+    def has_pending_requests(self):
+        self._ack_handled()
+        # Requests in flight on other workers, and the discovery of another
+        # worker, may still lead to new requests, so wait for them too.
+        return bool(self._update_discovery() or self._leased or self._local or
+                    self._queue.unfinished_count(self._spider.name))
+
+    def enqueue_request(self, request):
+        if request.meta.get('discovery'):
+            return self._enqueue_discovery(request)
+        try:
+            data = pickle.dumps(request.to_dict(spider=self._spider),
+                                protocol=4)
+        except ValueError:
+            self._stats.inc_value('shared_queue/unserializable',
+                                  spider=self._spider)
+            return self._enqueue_local(request)
+        if not self._queue.push(self._spider.name, self._seen_key(request),
+                                data, request.priority):
+            self._stats.inc_value('shared_queue/duplicates',
+                                  spider=self._spider)
+            return False
+        self._stats.inc_value('shared_queue/enqueued', spider=self._spider)
+        return True
+
+    def _enqueue_discovery(self, request):
+        if self._discovering is None:
+            self._discovering = self._queue.claim_discovery(
+                self._spider.name, self._worker, self._lease_seconds)
+            self._discovery_renewed = time.time()
+        if not self._discovering:
+            # Another worker discovers the spider's requests, or already has.
+            self._stats.inc_value('shared_queue/discovery_skipped',
+                                  spider=self._spider)
+            return False
+        return self._enqueue_local(request)
+
+    def _update_discovery(self):
+        """Keeps up this worker's part in discovery.
+
+        Returns:
+            Whether discovery is still running on this or another worker.
+        """
+        now = time.time()
+        if self._discovering:
+            # The engine takes start requests one at a time as it has room,
+            # so discovery isn't done until it has taken all of them.
+            start_requests = self._crawler.engine.slot.start_requests
+            if (start_requests is None and not self._local and
+                    not self._local_in_flight):
+                self._queue.finish_discovery(self._spider.name, self._worker)
+                self._discovering = False
+                return False
+            if now - self._discovery_renewed > self._lease_seconds / 4:
+                self._queue.renew_discovery(self._spider.name, self._worker,
+                                            self._lease_seconds, now)
+                self._discovery_renewed = now
+            return True
+        state = self._queue.discovery_state(self._spider.name, now)
+        if (state == DISCOVERY_EXPIRED and self._queue.claim_discovery(
+                self._spider.name, self._worker, self._lease_seconds, now)):
+            logger.warning('Taking over discovery from a worker that stopped',
+                           extra={'spider': self._spider})
+            self._discovering = True
+            self._discovery_renewed = now
+            for request in self._spider.start_requests():
+                self.enqueue_request(request)
+        return state in (DISCOVERY_RUNNING, DISCOVERY_EXPIRED)
+
+    def _enqueue_local(self, request):
+        if not request.dont_filter:
+            fingerprint = self._fingerprinter.fingerprint(request)
+            if fingerprint in self._local_seen:
+                self._stats.inc_value('shared_queue/duplicates',
+                                      spider=self._spider)
+                return False
+            self._local_seen.add(fingerprint)
+        self._stats.inc_value('shared_queue/local', spider=self._spider)
+        self._local.append(request)
+        return True
+
+    def next_request(self):
+        self._ack_handled()
+        if self._local:
+            request = self._local.popleft()
+            self._local_in_flight.add(request)
+            return request
+        if not self._leased:
+            for row_id, data in self._queue.lease(self._spider.name,
+                                                  self._worker,
+                                                  self._batch_size,
+                                                  self._lease_seconds):
+                request = request_utils.request_from_dict(pickle.loads(data),
+                                                          spider=self._spider)
+                self._leased.append((row_id, request))
+        if not self._leased:
+            return None
+        row_id, request = self._leased.popleft()
+        self._in_flight[row_id] = request
+        self._stats.inc_value('shared_queue/dequeued', spider=self._spider)
+        return request
+
+    def _ack_handled(self):
+        active = self._active_requests()
+        self._local_in_flight &= active
+        done = [
+            row_id for row_id, request in self._in_flight.items()
+            if request not in active
+        ]
+        if done:
+            self._queue.ack(done)
+            for row_id in done:
+                del self._in_flight[row_id]
+
+    def _active_requests(self):
+        # The engine hands every request it takes from the scheduler straight
+        # to the downloader, which tracks it until it's downloaded, answered
+        # from the cache or dropped by a middleware. The scraper then tracks
+        # it until the callback's output, including the requests it leads to,
+        # has been processed, so a worker that dies before then leaves the
+        # request to be leased again.
+        engine = self._crawler.engine
+        active = set(engine.downloader.active)
+        slot = engine.scraper.slot
+        if slot is not None:
+            active.update(slot.active)
+            active.update(request for _, request, _ in slot.queue)
+        return active
+
+    def _seen_key(self, request):
+        key = self._fingerprinter.fingerprint(request).hex()
+        if request.dont_filter:
+            # Requests that bypass the dupe filter, such as retries and
+            # redirects to the same recipe, are still queued once per attempt
+            # rather than once per worker.
+            key += '/%d/%d' % (request.meta.get(
+                'retry_times', 0), request.meta.get('redirect_times', 0))
+        return key
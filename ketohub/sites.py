@@ -0,0 +1,379 @@
+"""Declarative definitions of the recipe sites that ketohub crawls.
+
+Each Site describes where a site's recipes are and how to find them.
+ketohub.spiders builds a spider class from a Site only when that site is
+actually crawled, so adding a site here costs nothing for runs that don't use
+it.
+"""
+
+
+class LinkRule(object):
+    """Describes links to follow from a crawled page.
+
+    The arguments mirror those of Scrapy's LinkExtractor. Links matched by a
+    rule with recipe=True are saved as recipes and not followed further; links
+    matched by other rules are crawled for more links.
+    """
+
+    def __init__(self,
+                 allow=(),
+                 deny=(),
+                 restrict_xpaths=(),
+                 restrict_css=(),
+                 recipe=False):
+        self.allow = allow
+        self.deny = deny
+        self.restrict_xpaths = restrict_xpaths
+        self.restrict_css = restrict_css
+        self.recipe = recipe
+
+
+class Site(object):
+    """Describes a recipe site and how to discover its recipes.
+
+    pagination_url is the URL of the site's numbered listing pages, with
+    {page} in place of the page number. Listing pages are then requested until
+    the last one is found, up to max_pages.
+
+    min_download_delay and max_concurrency bound how fast the crawl may get
+    when the site responds well (see ketohub.throttle). If unset, the
+    ADAPTIVE_THROTTLE_MIN_DELAY and ADAPTIVE_THROTTLE_MAX_CONCURRENCY settings
+    apply.
+
+    recipe_markers are strings that every one of the site's recipe pages
+    contains, such as the class of its recipe card. ketohub.validate reports
+    saved pages without them. Every site lists its own domain, which its
+    canonical links and assets carry, and sites whose recipe cards come from
+    WP Recipe Maker also list its wprm-recipe class.
+    """
+
+    def __init__(self,
+                 name,
+                 allowed_domains,
+                 start_urls=(),
+                 rules=(),
+                 sitemap_urls=(),
+                 sitemap_follow=(),
+                 sitemap_recipe_patterns=(),
+                 pagination_url=None,
+                 max_pages=1000,
+                 min_download_delay=None,
+                 max_concurrency=None,
+                 recipe_markers=()):
+        self.name = name
+        self.allowed_domains = allowed_domains
+        self.start_urls = start_urls
+        self.rules = rules
+        self.sitemap_urls = sitemap_urls
+        self.sitemap_follow = sitemap_follow
+        self.sitemap_recipe_patterns = sitemap_recipe_patterns
+        self.pagination_url = pagination_url
+        self.max_pages = max_pages
+        self.min_download_delay = min_download_delay
+        self.max_concurrency = max_concurrency
+        self.recipe_markers = recipe_markers
+
+
+_DIET_DOCTOR_PAGINATION_URL = ('https://www.dietdoctor.com/low-carb/recipes'
+                               '?s=&st=recipe&lowcarb%5B%5D=keto&sp={page}')
+
+_KETOGASM_PAGINATION_URL = ('https://ketogasm.com/recipe-index/?'
+                            'fwp_recipes_filters=recipe&'
+                            'fwp_paged={page}')
+
+SITES = [
+    Site(
+        name='diet-doctor',
+        allowed_domains=['dietdoctor.com'],
+        recipe_markers=['dietdoctor.com'],
+        pagination_url=_DIET_DOCTOR_PAGINATION_URL,
+        rules=[
+            # Extract links for recipes,
+            # e.g. /recipes/green-onion-no-chile-chicken-enchiladas
+            LinkRule(allow=r'https://www.dietdoctor.com/recipes/', recipe=True),
+        ],
+        # Served from a CDN that handles many concurrent requests.
+        min_download_delay=0.1,
+        max_concurrency=8),
+    Site(
+        name='greek-goes-keto',
+        allowed_domains=['greekgoesketo.com'],
+        recipe_markers=['greekgoesketo.com'],
+        start_urls=['https://www.greekgoesketo.com/category/recipes/'],
+        rules=[
+            # Extract links for finding additional recipe pages,
+            # e.g. https://www.greekgoesketo.com/category/recipes/page/1/
+            LinkRule(allow=(r'https://(.+\.)greekgoesketo.com'
+                            r'/category/recipes/page/\d+/')),
+            # Extract links for recipes,
+            LinkRule(restrict_css='main article', recipe=True),
+        ]),
+    Site(
+        name='hey-keto-mama',
+        allowed_domains=['heyketomama.com'],
+        recipe_markers=['heyketomama.com', 'wprm-recipe'],
+        start_urls=['https://www.heyketomama.com/category/recipes/page/1/'],
+        rules=[
+            # Extract links for finding additional recipe pages,
+            # e.g. https://www.heyketomama.com/category/recipes/page/6/
+            LinkRule(
+                allow=r'https://www.heyketomama.com/category/recipes/page/\d+/'
+            ),
+            # Extract links for recipes,
+            # e.g. https://www.heyketomama.com/ten-minute-keto-nachos/
+            LinkRule(restrict_xpaths='//div[@class="entry-content"]',
+                     recipe=True),
+        ]),
+    Site(
+        name='ketoconnect',
+        allowed_domains=['ketoconnect.net'],
+        recipe_markers=['ketoconnect.net', 'wprm-recipe'],
+        sitemap_urls=['https://www.ketoconnect.net/sitemap_index.xml'],
+        sitemap_follow=[r'/post-sitemap\d*\.xml'],
+        sitemap_recipe_patterns=[r'ketoconnect\.net/recipe/[^/]+/$'],
+        start_urls=[
+            'https://www.ketoconnect.net/main-dishes/',
+            'https://www.ketoconnect.net/side-dishes/',
+            'https://www.ketoconnect.net/breakfasts/',
+            'https://www.ketoconnect.net/snacks/',
+            'https://www.ketoconnect.net/desserts/',
+            'https://www.ketoconnect.net/beverages/'
+        ],
+        rules=[
+            # Extract links for the actual recipes
+            # e.g. https://www.ketoconnect.net/recipe/spicy-cilantro-dressing/
+            LinkRule(restrict_xpaths='//article', recipe=True),
+        ]),
+    Site(name='keto-diet-app',
+         allowed_domains=['ketodietapp.com'],
+         recipe_markers=['ketodietapp.com'],
+         sitemap_urls=['https://ketodietapp.com/Blog/sitemap.axd'],
+         sitemap_recipe_patterns=[r'/Blog/lchf/']),
+    Site(
+        name='ruled-me',
+        allowed_domains=['ruled.me'],
+        recipe_markers=['ruled.me'],
+        start_urls=['https://www.ruled.me/keto-recipes/'],
+        rules=[
+            # Extract links for food category pages,
+            # e.g. https://www.ruled.me/keto-recipes/breakfast/
+            LinkRule(allow=r'https://www.ruled.me/keto-recipes/\w+(\-\w+)*/$',
+                     restrict_xpaths='//div[@class="r-list"]'),
+
+            # Extract links for finding additional pages within food category
+            # pages, e.g. https://www.ruled.me/keto-recipes/dinner/page/2/
+            LinkRule(allow=(
+                r'https://www.ruled.me/keto-recipes/\w+(\-\w+)*/page/\d+/')),
+
+            # Extract links for the actual recipes,
+            # e.g. https://www.ruled.me/easy-keto-cordon-bleu/
+            LinkRule(allow=r'https://www.ruled.me/\w+(\-\w+)*/$',
+                     restrict_xpaths='//div[@id="content"]',
+                     recipe=True),
+        ]),
+    # Note: This site seems to have stopped publishing on 2018-06-15.
+    Site(
+        name='ketogasm',
+        allowed_domains=['ketogasm.com'],
+        recipe_markers=['ketogasm.com'],
+        pagination_url=_KETOGASM_PAGINATION_URL,
+        rules=[
+            # Extract links for recipes.
+            LinkRule(allow=r'https://ketogasm.com/.*/$',
+                     restrict_xpaths='//div[@id="recipes-grid"]',
+                     recipe=True),
+        ]),
+    Site(
+        name='keto-size-me',
+        allowed_domains=['ketosizeme.com'],
+        recipe_markers=['ketosizeme.com'],
+        start_urls=['https://ketosizeme.com/category/ketogenic-diet-recipes/'],
+        rules=[
+            # Extract links for finding additional pages within recipe index,
+            # e.g. https://ketosizeme.com/category/ketogenic-diet-recipes/page/2/
+            LinkRule(allow=(r'https://ketosizeme.com'
+                            r'/category/ketogenic-diet-recipes/page/\d+/')),
+
+            # Extract links for recipes.
+            LinkRule(allow=r'https://ketosizeme.com/.+/$',
+                     restrict_xpaths='//main',
+                     recipe=True),
+        ]),
+    Site(
+        name='ketovangelist-kitchen',
+        allowed_domains=['ketovangelistkitchen.com'],
+        recipe_markers=['ketovangelistkitchen.com'],
+        # Organize start URLs in descending order of category strength (e.g.
+        # muffins should be categorized as "snack" not "eggs".
+        start_urls=[
+            'http://www.ketovangelistkitchen.com/indexes/recipes/appetizers/',
+            'http://www.ketovangelistkitchen.com/indexes/recipes/desserts/',
+            'http://www.ketovangelistkitchen.com/indexes/recipes/beverages/',
+            'http://www.ketovangelistkitchen.com/indexes/recipes/sides/',
+            'http://www.ketovangelistkitchen.com/indexes/recipes/snack/',
+            'http://www.ketovangelistkitchen.com/indexes/recipes/soup/',
+            ('http://www.ketovangelistkitchen.com/indexes/recipes/'
+             'sauces-dressings/'),
+            'http://www.ketovangelistkitchen.com/indexes/recipes/casseroles/',
+            'http://www.ketovangelistkitchen.com/indexes/recipes/fat-bombs/',
+            'http://www.ketovangelistkitchen.com/indexes/recipes/dairy-free/',
+            'http://www.ketovangelistkitchen.com/indexes/recipes/kid-friendly/',
+            'http://www.ketovangelistkitchen.com/indexes/recipes/baked-goods/',
+            'http://www.ketovangelistkitchen.com/indexes/recipes/beef/',
+            ('http://www.ketovangelistkitchen.com/indexes/recipes/'
+             'chicken-turkey/'),
+            'http://www.ketovangelistkitchen.com/indexes/recipes/chocolate/',
+            'http://www.ketovangelistkitchen.com/indexes/recipes/fish/',
+            'http://www.ketovangelistkitchen.com/indexes/recipes/pork/',
+            'http://www.ketovangelistkitchen.com/indexes/recipes/vegetables/',
+            'http://www.ketovangelistkitchen.com/indexes/recipes/nuts/',
+            'http://www.ketovangelistkitchen.com/indexes/recipes/eggs/',
+        ],
+        rules=[
+            # Extract links for recipes.
+            LinkRule(restrict_xpaths='//div[@class="entry-content"]',
+                     recipe=True),
+        ]),
+    Site(
+        name='ketovale',
+        allowed_domains=['ketovale.com'],
+        recipe_markers=['ketovale.com', 'wprm-recipe'],
+        sitemap_urls=['https://www.ketovale.com/sitemap_index.xml'],
+        sitemap_follow=[r'/post-sitemap\d*\.xml'],
+        sitemap_recipe_patterns=[r'ketovale\.com/recipe/[^/]+/$'],
+        start_urls=['https://www.ketovale.com/category/recipes/'],
+        rules=[
+            # Extract links for finding additional recipe pages,
+            # e.g. https://www.ketovale.com/category/recipes/page/3/
+            LinkRule(
+                allow=r'https://www.ketovale.com/category/recipes/page/\d+/'),
+            # Extract links for recipes.
+            LinkRule(allow=r'https://www.ketovale.com/recipe/.*/$',
+                     restrict_xpaths='//h2[@class="entry-title"]',
+                     recipe=True),
+        ]),
+    Site(
+        name='low-carb-yum',
+        allowed_domains=['lowcarbyum.com'],
+        recipe_markers=['lowcarbyum.com', 'wprm-recipe'],
+        start_urls=['https://lowcarbyum.com/recipes/'],
+        rules=[
+            # Extract links for food category pages,
+            # e.g. https://lowcarbyum.com/category/desserts/
+            LinkRule(
+                allow=r'https://lowcarbyum.com/category/',
+                deny=r'https://lowcarbyum.com/category/((reviews)|(articles))'),
+            # Extract links for recipes.
+            LinkRule(allow=r'https://lowcarbyum.com/.+/$',
+                     restrict_xpaths='//header[@class="entry-header"]',
+                     recipe=True),
+        ]),
+    Site(
+        name='queen-bs',
+        allowed_domains=['queenbsincredibleedibles.com'],
+        recipe_markers=['queenbsincredibleedibles.com'],
+        start_urls=[
+            'http://queenbsincredibleedibles.com/category/keto/page/1/'
+        ],
+        rules=[
+            # Extract links for finding additional keto recipe pages,
+            # e.g. http://queenbsincredibleedibles.com/category/keto/page/2/
+            LinkRule(allow=(r'http://queenbsincredibleedibles.com'
+                            r'/category/keto/page/\d+/')),
+
+            # Extract links for recipes, e.g.
+            # http://queenbsincredibleedibles.com/creamy-coconut-kale-sausage-soup/
+            LinkRule(allow=r'http://queenbsincredibleedibles.com/.*/$',
+                     deny=r'(category\/)|(ive-fallen-in-love-with-keto)',
+                     recipe=True),
+        ]),
+    Site(
+        name='skinny-taste',
+        allowed_domains=['skinnytaste.com'],
+        recipe_markers=['skinnytaste.com', 'wprm-recipe'],
+        start_urls=['https://www.skinnytaste.com/recipes/keto/'],
+        rules=[
+            # Extract links for finding additional recipe pages,
+            # e.g. https://www.skinnytaste.com/recipes/keto/page/2/
+            LinkRule(allow=r'skinnytaste.com/recipes/keto/page/\d+/'),
+            # Extract links for recipes.
+            LinkRule(allow=[
+                r'skinnytaste.com/[^\/]+/$',
+            ],
+                     restrict_xpaths='//div[@class="archives"]',
+                     recipe=True),
+        ],
+        # Served from a CDN that handles many concurrent requests.
+        min_download_delay=0.1,
+        max_concurrency=8),
+    Site(
+        name='sugar-free-mom',
+        allowed_domains=['sugarfreemom.com'],
+        recipe_markers=['sugarfreemom.com'],
+        start_urls=['https://www.sugarfreemom.com/recipes/category/diet/keto/'],
+        rules=[
+            # Extract links for finding additional recipe pages,
+            # e.g. https://www.sugarfreemom.com/recipes/category/diet/keto/page/2/
+            LinkRule(
+                allow=(r'sugarfreemom.com/recipes/category/diet/keto/page/\d+/')
+            ),
+            # Extract links for recipes.
+            LinkRule(allow=r'sugarfreemom.com/recipes/[^\/]+/$',
+                     restrict_xpaths='//main',
+                     recipe=True),
+        ]),
+    Site(
+        name='wholesome-yum',
+        allowed_domains=['wholesomeyum.com'],
+        recipe_markers=['wholesomeyum.com', 'wprm-recipe'],
+        start_urls=['https://www.wholesomeyum.com/tag/keto/'],
+        rules=[
+            # Extract links for finding additional recipe pages,
+            # e.g. https://www.wholesomeyum.com/tag/keto/page/2/
+            LinkRule(allow=r'wholesomeyum.com/tag/keto/page/\d+/'),
+            # Extract links for recipes.
+            LinkRule(allow=[
+                r'wholesomeyum.com/[^\/]+/$',
+                r'wholesomeyum.com/recipes/[^\/]+/$'
+            ],
+                     restrict_xpaths='//main',
+                     recipe=True),
+        ]),
+    Site(
+        name='your-friends-j',
+        allowed_domains=['yourfriendsj.com'],
+        recipe_markers=['yourfriendsj.com'],
+        start_urls=['http://yourfriendsj.com/recipe-library/'],
+        rules=[
+            # Extract links for finding additional recipe pages,
+            # e.g. http://yourfriendsj.com/tag/keto/page/2/
+            LinkRule(allow=r'yourfriendsj.com/recipe-library/\?paged=\d+'),
+            # Extract links for recipes,
+            # e.g. http://yourfriendsj.com/recipes/easy-guacamole-recipe/
+            LinkRule(allow=r'http://yourfriendsj.com/recipes/[^\/]*/$',
+                     restrict_xpaths='//article',
+                     recipe=True),
+        ]),
+]
+
+_SITES_BY_NAME = {site.name: site for site in SITES}
+
+
+def names():
+    """Returns the names of all sites."""
+    return [site.name for site in SITES]
+
+
+def get(name):
+    """Returns the Site with the given name.
+
+    Args:
+        name: Name of the site, e.g. 'ruled-me'.
+
+    Returns:
+        The matching Site.
+
+    Raises:
+        KeyError: If there is no site with that name.
+    """
+    return _SITES_BY_NAME[name]
@@ -0,0 +1,72 @@
+"""Reports which recipes changed between two snapshots.
+
+The comparison only reads the snapshots' manifests (see ketohub.manifest), so
+it takes time linear in the number of recipes and never reads their HTML:
+
+    python -m ketohub.snapshot_diff OLD_SNAPSHOT NEW_SNAPSHOT \\
+        --output changes.json
+
+The report lists the keys of the recipes that were added, removed or changed,
+so downstream jobs can reprocess only those.
+"""
+
+import argparse
+import json
+
+from ketohub import manifest
+
+
+def diff_manifests(old_entries, new_entries):
+    """Compares two snapshot manifests.
+
+    Args:
+        old_entries: Manifest of the older snapshot, as returned by
+            manifest.read_manifest.
+        new_entries: Manifest of the newer snapshot.
+
+    Returns:
+        A dictionary with sorted lists of the 'added', 'removed' and 'changed'
+        recipe keys.
+    """
+    added = []
+    changed = []
+    for key, entry in new_entries.items():
+        old_entry = old_entries.get(key)
+        if old_entry is None:
+            added.append(key)
+        elif old_entry != entry:
+            changed.append(key)
+    removed = [key for key in old_entries if key not in new_entries]
+    return {
+        'added': sorted(added),
+        'removed': sorted(removed),
+        'changed': sorted(changed),
+    }
+
+
+def diff_snapshots(old_root, new_root):
+    """Compares the manifests of the snapshots at old_root and new_root."""
+    return diff_manifests(manifest.read_manifest(old_root),
+                          manifest.read_manifest(new_root))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='ketohub-snapshot-diff',
+        description='Report recipes added, removed or changed between two '
+        'snapshots.')
+    parser.add_argument('old_snapshot', help='Directory of the older snapshot')
+    parser.add_argument('new_snapshot', help='Directory of the newer snapshot')
+    parser.add_argument('--output', help='File in which to save the report')
+    args = parser.parse_args()
+
+    report = diff_snapshots(args.old_snapshot, args.new_snapshot)
+    for change in ('added', 'removed', 'changed'):
+        print('%s: %d' % (change, len(report[change])))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+from scrapy import interfaces
+from scrapy.utils import url as url_utils
+from zope import interface
+
+from ketohub import sites
+from ketohub import spiders
+
+
+@interface.implementer(interfaces.ISpiderLoader)
+class SiteSpiderLoader(object):
+    """Spider loader that builds spiders from the site registry on demand.
+
+    Listing spiders only reads site names, and loading a spider builds (and
+    compiles the rules of) that site's spider alone.
+    """
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls()
+
+    def load(self, spider_name):
+        try:
+            site = sites.get(spider_name)
+        except KeyError:
+            raise KeyError('Spider not found: %s' % spider_name)
+        return spiders.spider_class(site)
+
+    def list(self):
+        return sites.names()
+
+    def find_by_request(self, request):
+        return [
+            site.name for site in sites.SITES if
+            url_utils.url_is_from_any_domain(request.url, site.allowed_domains)
+        ]
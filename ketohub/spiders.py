@@ -1,463 +1,360 @@
-from scrapy import conf
+import codecs
+import re
+
+from scrapy import http
 from scrapy import linkextractors
 from scrapy import spiders
+from scrapy.spidermiddlewares import httperror
+from scrapy.utils import gz
+from scrapy.utils import python
+from scrapy.utils import sitemap
 
-import persist
-import recipe_key
-
-
-class Error(Exception):
-    """Base Error class."""
-    pass
+from ketohub import incremental
+from ketohub import metrics
+from ketohub import pagination
+from ketohub import recipe_extract
+from ketohub import recipe_key
 
 
-class MissingDownloadDirectory(Error):
-    """Error raised when the download directory is not defined."""
-    pass
+def _header_value(headers, name):
+    value = headers.get(name)
+    if value is None:
+        return None
+    return python.to_unicode(value, errors='replace')
 
 
-def _get_download_root():
-    download_root = conf.settings.get('DOWNLOAD_ROOT')
-    if not download_root:
-        raise MissingDownloadDirectory(
-            'Make sure you\'re providing a download directory.')
-    return download_root
+def _utf8_body(response):
+    # Avoid decoding and re-encoding pages that are already UTF-8.
+    if codecs.lookup(response.encoding).name == 'utf-8':
+        return response.body
+    return response.text.encode('utf8')
 
 
 class CallbackHandler(object):
-
-    def __init__(self, content_saver):
-        self._content_saver = content_saver
+    """Turns recipe responses into items for the persistence pipeline."""
 
     def process_callback(self, response):
-        key = recipe_key.from_url(response.url)
-        self._content_saver.save_metadata(
-            key, {
-                'url': response.url,
-                'referer': response.request.headers['Referer'],
-            })
-        self._content_saver.save_recipe_html(key, response.text.encode('utf8'))
-
-
-class DietDoctorSpider(spiders.CrawlSpider):
-    name = 'diet-doctor'
-
-    callback_handler = CallbackHandler(
-        content_saver=persist.ContentSaver(_get_download_root()))
-
-    allowed_domains = ['dietdoctor.com']
-
-    # TODO(mtlynch): Make this more flexible. It's now limited to only 40 pages
-    # but it should just figure out which ones are present. I've adding Rules
-    # for the Previous/Next links but they don't seem to work.
-    _url_prefix = ('https://www.dietdoctor.com/low-carb/recipes'
-                   '?s=&st=recipe&lowcarb%5B%5D=keto&sp=')
-    start_urls = [_url_prefix + str(i) for i in range(1, 40)]
-
-    rules = [
-        # Extract links for recipes,
-        # e.g. /recipes/green-onion-no-chile-chicken-enchiladas
-        spiders.Rule(linkextractors.LinkExtractor(
-            allow=r'https://www.dietdoctor.com/recipes/'),
-                     callback=callback_handler.process_callback,
-                     follow=False),
-    ]
-
-
-class GreekGoesKetoSpider(spiders.CrawlSpider):
-    name = 'greek-goes-keto'
-
-    callback_handler = CallbackHandler(
-        content_saver=persist.ContentSaver(_get_download_root()))
-
-    allowed_domains = ['greekgoesketo.com']
-    start_urls = ['https://www.greekgoesketo.com/category/recipes/']
-
-    rules = [
-        # Extract links for finding additional recipe pages,
-        # e.g. https://www.greekgoesketo.com/category/recipes/page/1/
-        spiders.Rule(
-            linkextractors.LinkExtractor(
-                allow=r'https://(.+\.)greekgoesketo.com/category/recipes/page/\d+/')),
-        # Extract links for recipes,
-        spiders.Rule(
-            linkextractors.LinkExtractor(
-                restrict_css='main article'),
-            callback=callback_handler.process_callback,
-            follow=False),
-    ]
-
-
-class HeyKetoMamaSpider(spiders.CrawlSpider):
-    name = 'hey-keto-mama'
-
-    callback_handler = CallbackHandler(
-        content_saver=persist.ContentSaver(_get_download_root()))
-
-    allowed_domains = ['heyketomama.com']
-    start_urls = ['https://www.heyketomama.com/category/recipes/page/1/']
-
-    rules = [
-        # Extract links for finding additional recipe pages,
-        # e.g. https://www.heyketomama.com/category/recipes/page/6/
-        spiders.Rule(
-            linkextractors.LinkExtractor(
-                allow=r'https://www.heyketomama.com/category/recipes/page/\d+/')
-        ),
-        # Extract links for recipes,
-        # e.g. https://www.heyketomama.com/ten-minute-keto-nachos/
-        spiders.Rule(linkextractors.LinkExtractor(
-            restrict_xpaths='//div[@class="entry-content"]'),
-                     callback=callback_handler.process_callback,
-                     follow=False),
-    ]
-
-
-class KetoConnectSpider(spiders.CrawlSpider):
-    name = 'ketoconnect'
-
-    callback_handler = CallbackHandler(
-        content_saver=persist.ContentSaver(_get_download_root()))
-
-    allowed_domains = ['ketoconnect.net']
-    start_urls = [
-        'https://www.ketoconnect.net/main-dishes/',
-        'https://www.ketoconnect.net/side-dishes/',
-        'https://www.ketoconnect.net/breakfasts/',
-        'https://www.ketoconnect.net/snacks/',
-        'https://www.ketoconnect.net/desserts/',
-        'https://www.ketoconnect.net/beverages/'
-    ]
-
-    rules = [
-        # Extract links for the actual recipes
-        # e.g. https://www.ketoconnect.net/recipe/spicy-cilantro-dressing/
-        spiders.Rule(linkextractors.LinkExtractor(restrict_xpaths='//article'),
-                     callback=callback_handler.process_callback,
-                     follow=False),
-    ]
-
-
-class KetoDietAppSpider(spiders.SitemapSpider):
-    name = 'keto-diet-app'
-
-    sitemap_urls = [
-        'https://ketodietapp.com/Blog/sitemap.axd',
-    ]
-
-    sitemap_rules = [
-        ('/Blog/lchf/', 'parse_recipe'),
-    ]
+        metadata = {
+            'url': response.url,
+            'referer': _header_value(response.request.headers, 'Referer'),
+        }
+        # Save the validators so that an incremental crawl can send
+        # conditional requests for this page next time.
+        if 'ETag' in response.headers:
+            metadata['etag'] = _header_value(response.headers, 'ETag')
+        if 'Last-Modified' in response.headers:
+            metadata['last_modified'] = _header_value(response.headers,
+                                                      'Last-Modified')
+
+        # Pages that haven't changed since the previous snapshot are linked
+        # from there rather than saved again.
+        previous_html_path = response.meta.get('previous_html_path')
+        html = None
+        if not previous_html_path:
+            html = _utf8_body(response)
+        elif response.meta.get('previous_simhash'):
+            metadata['simhash'] = response.meta['previous_simhash']
+        json_ld_blocks = recipe_extract.json_ld_blocks(response.body,
+                                                       response.encoding)
+        return {
+            'key': recipe_key.from_url(response.url),
+            'metadata': metadata,
+            'html': html,
+            'previous_html_path': previous_html_path,
+            'recipe': recipe_extract.extract_recipe(json_ld_blocks),
+        }
+
+
+class RecipeSpider(spiders.CrawlSpider):
+    """Base class for spiders that discover recipes from sitemaps first.
+
+    When sitemap_urls is set, the spider starts from the site's sitemaps and
+    treats every URL matching one of sitemap_recipe_patterns as a recipe, so
+    finding recipes costs a few compact XML downloads instead of a crawl
+    through every listing page. If the sitemaps can't be fetched or contain no
+    recipes, the spider falls back to crawling start_urls with its rules.
+
+    When pagination_url is set, the site's numbered listing pages are crawled
+    too, and a pagination.Paginator works out how many there are. A page is
+    treated as past the end if it has no recipe links or the same recipe
+    links as an earlier page.
+
+    With the SITEMAP_LASTMOD_SINCE setting (an ISO 8601 date), sitemap entries
+    last modified before that date are not fetched. Recipes skipped that way
+    are carried over from PREVIOUS_DOWNLOAD_ROOT if it has them.
+    """
+
+    callback_handler = CallbackHandler()
+
+    sitemap_urls = ()
+    # Patterns matching the recipe URLs listed in the sitemaps. If empty, every
+    # URL in the sitemaps is a recipe.
+    sitemap_recipe_patterns = ()
+    # Patterns matching the nested sitemaps of a sitemap index to follow. If
+    # empty, all nested sitemaps are followed.
+    sitemap_follow = ()
+
+    # URL of the numbered listing pages, with {page} in place of the page
+    # number, and the most pages to look for.
+    pagination_url = None
+    max_pages = 1000
+
+    # Bounds for ketohub.throttle.AdaptiveThrottle. None means the settings'
+    # defaults apply.
+    min_download_delay = None
+    max_concurrency = None
+
+    # Set by ketohub.metrics.CrawlMetrics when METRICS_PROFILE is on.
+    callback_profiler = None
+
+    # Path to a file of recipe URLs, one per line, set with
+    # `-a recrawl_urls=...`. If set, the spider fetches only those recipes.
+    recrawl_urls = None
+
+    def start_requests(self):
+        if self.recrawl_urls:
+            for request in self._recrawl_requests():
+                yield request
+            return
+        if not self.sitemap_urls:
+            for request in self._listing_requests():
+                yield request
+            return
+
+        self._pending_sitemaps = 0
+        self._sitemap_recipe_count = 0
+        # Nested sitemaps skipped as unmodified. Their recipes exist, so the
+        # spider mustn't fall back to the listings for lack of them.
+        self._skipped_sitemap_count = 0
+        self._lastmod_since = self.settings.get('SITEMAP_LASTMOD_SINCE')
+        self._previous_snapshot = incremental.get_previous_snapshot(
+            self.settings)
+        for url in self.sitemap_urls:
+            yield self._sitemap_request(url)
 
     def parse_recipe(self, response):
-        callback_handler = CallbackHandler(
-            content_saver=persist.ContentSaver(_get_download_root()))
-        callback_handler.process_callback(response)
-
-
-class RuledMeSpider(spiders.CrawlSpider):
-    name = 'ruled-me'
-
-    callback_handler = CallbackHandler(
-        content_saver=persist.ContentSaver(_get_download_root()))
-
-    allowed_domains = ['ruled.me']
-    start_urls = ['https://www.ruled.me/keto-recipes/']
-
-    rules = [
-        # Extract links for food category pages,
-        # e.g. https://www.ruled.me/keto-recipes/breakfast/
-        spiders.Rule(
-            linkextractors.LinkExtractor(
-                allow=r'https://www.ruled.me/keto-recipes/\w+(\-\w+)*/$',
-                restrict_xpaths='//div[@class="r-list"]')),
-
-        # Extract links for finding additional pages within food category pages,
-        # e.g. https://www.ruled.me/keto-recipes/dinner/page/2/
-        spiders.Rule(
-            linkextractors.LinkExtractor(allow=(
-                r'https://www.ruled.me/keto-recipes/\w+(\-\w+)*/page/\d+/'))),
-
-        # Extract links for the actual recipes,
-        # e.g. https://www.ruled.me/easy-keto-cordon-bleu/
-        spiders.Rule(linkextractors.LinkExtractor(
-            allow=r'https://www.ruled.me/\w+(\-\w+)*/$',
-            restrict_xpaths='//div[@id="content"]'),
-                     callback=callback_handler.process_callback,
-                     follow=False)
-    ]
-
-
-# Note: This site seems to have stopped publishing on 2018-06-15.
-class KetogasmSpider(spiders.CrawlSpider):
-    name = 'ketogasm'
-
-    callback_handler = CallbackHandler(
-        content_saver=persist.ContentSaver(_get_download_root()))
-
-    allowed_domains = ['ketogasm.com']
-    _url_format = ('https://ketogasm.com/recipe-index/?'
-                   'fwp_recipes_filters=recipe&'
-                   'fwp_paged=%d')
-    start_urls = [
-        (_url_format % 1),
-        (_url_format % 2),
-        (_url_format % 3),
-        (_url_format % 4),
-    ]
-
-    rules = [
-        # Extract links for recipes.
-        spiders.Rule(linkextractors.LinkExtractor(
-            allow=r'https://ketogasm.com/.*/$',
-            restrict_xpaths='//div[@id="recipes-grid"]'),
-                     callback=callback_handler.process_callback,
-                     follow=False)
-    ]
-
-
-class KetoSizeMe(spiders.CrawlSpider):
-    name = 'keto-size-me'
-
-    callback_handler = CallbackHandler(
-        content_saver=persist.ContentSaver(_get_download_root()))
-
-    allowed_domains = ['ketosizeme.com']
-    start_urls = ['https://ketosizeme.com/category/ketogenic-diet-recipes/']
-
-    rules = [
-
-        # Extract links for finding additional pages within recipe index,
-        # e.g. https://ketosizeme.com/category/ketogenic-diet-recipes/page/2/
-        spiders.Rule(
-            linkextractors.LinkExtractor(
-                allow=
-                r'https://ketosizeme.com/category/ketogenic-diet-recipes/page/\d+/'
-            )),
-
-        # Extract links for recipes.
-        spiders.Rule(linkextractors.LinkExtractor(
-            allow=r'https://ketosizeme.com/.+/$', restrict_xpaths='//main'),
-                     callback=callback_handler.process_callback,
-                     follow=False),
-    ]
-
-
-class KetovangelistKitchen(spiders.CrawlSpider):
-    name = 'ketovangelist-kitchen'
-
-    callback_handler = CallbackHandler(
-        content_saver=persist.ContentSaver(_get_download_root()))
-
-    allowed_domains = ['ketovangelistkitchen.com']
-    # Organize start URLs in descending order of category strength (e.g. muffins
-    # should be categorized as "snack" not "eggs".
-    start_urls = [
-        'http://www.ketovangelistkitchen.com/indexes/recipes/appetizers/',
-        'http://www.ketovangelistkitchen.com/indexes/recipes/desserts/',
-        'http://www.ketovangelistkitchen.com/indexes/recipes/beverages/',
-        'http://www.ketovangelistkitchen.com/indexes/recipes/sides/',
-        'http://www.ketovangelistkitchen.com/indexes/recipes/snack/',
-        'http://www.ketovangelistkitchen.com/indexes/recipes/soup/',
-        'http://www.ketovangelistkitchen.com/indexes/recipes/sauces-dressings/',
-        'http://www.ketovangelistkitchen.com/indexes/recipes/casseroles/',
-        'http://www.ketovangelistkitchen.com/indexes/recipes/fat-bombs/',
-        'http://www.ketovangelistkitchen.com/indexes/recipes/dairy-free/',
-        'http://www.ketovangelistkitchen.com/indexes/recipes/kid-friendly/',
-        'http://www.ketovangelistkitchen.com/indexes/recipes/baked-goods/',
-        'http://www.ketovangelistkitchen.com/indexes/recipes/beef/',
-        'http://www.ketovangelistkitchen.com/indexes/recipes/chicken-turkey/',
-        'http://www.ketovangelistkitchen.com/indexes/recipes/chocolate/',
-        'http://www.ketovangelistkitchen.com/indexes/recipes/fish/',
-        'http://www.ketovangelistkitchen.com/indexes/recipes/pork/',
-        'http://www.ketovangelistkitchen.com/indexes/recipes/vegetables/',
-        'http://www.ketovangelistkitchen.com/indexes/recipes/nuts/',
-        'http://www.ketovangelistkitchen.com/indexes/recipes/eggs/',
-    ]
-
-    rules = [
-        # Extract links for recipes.
-        spiders.Rule(linkextractors.LinkExtractor(
-            restrict_xpaths='//div[@class="entry-content"]'),
-                     callback=callback_handler.process_callback,
-                     follow=False)
-    ]
-
-
-class Ketovale(spiders.CrawlSpider):
-    name = 'ketovale'
-
-    callback_handler = CallbackHandler(
-        content_saver=persist.ContentSaver(_get_download_root()))
-
-    allowed_domains = ['ketovale.com']
-    start_urls = ['https://www.ketovale.com/category/recipes/']
-
-    rules = [
-        # Extract links for finding additional recipe pages,
-        # e.g. https://www.ketovale.com/category/recipes/page/3/
-        spiders.Rule(
-            linkextractors.LinkExtractor(
-                allow=r'https://www.ketovale.com/category/recipes/page/\d+/')),
-        # Extract links for recipes.
-        spiders.Rule(linkextractors.LinkExtractor(
-            allow=r'https://www.ketovale.com/recipe/.*/$',
-            restrict_xpaths='//h2[@class="entry-title"]'),
-                     callback=callback_handler.process_callback,
-                     follow=False),
-    ]
-
-
-class LowCarbYum(spiders.CrawlSpider):
-    name = 'low-carb-yum'
-
-    callback_handler = CallbackHandler(
-        content_saver=persist.ContentSaver(_get_download_root()))
-
-    allowed_domains = ['lowcarbyum.com']
-    start_urls = ['https://lowcarbyum.com/recipes/']
-
-    rules = [
-        # Extract links for food category pages,
-        # e.g. https://lowcarbyum.com/category/desserts/
-        spiders.Rule(
-            linkextractors.LinkExtractor(
-                allow=r'https://lowcarbyum.com/category/',
-                deny=r'https://lowcarbyum.com/category/((reviews)|(articles))')
-        ),
-        # Extract links for recipes.
-        spiders.Rule(linkextractors.LinkExtractor(
-            allow=r'https://lowcarbyum.com/.+/$',
-            restrict_xpaths='//header[@class="entry-header"]'),
-                     callback=callback_handler.process_callback,
-                     follow=False)
-    ]
-
-
-class QueenBs(spiders.CrawlSpider):
-    name = 'queen-bs'
-
-    callback_handler = CallbackHandler(
-        content_saver=persist.ContentSaver(_get_download_root()))
-
-    allowed_domains = ['queenbsincredibleedibles.com']
-    start_urls = ['http://queenbsincredibleedibles.com/category/keto/page/1/']
-
-    rules = [
-        # Extract links for finding additional keto recipe pages,
-        # e.g. http://queenbsincredibleedibles.com/category/keto/page/2/
-        spiders.Rule(
-            linkextractors.LinkExtractor(
-                allow=
-                r'http://queenbsincredibleedibles.com/category/keto/page/\d+/')
-        ),
-
-        # Extract links for recipes,
-        # e.g. http://queenbsincredibleedibles.com/creamy-coconut-kale-sausage-soup/
-        spiders.Rule(linkextractors.LinkExtractor(
-            allow=r'http://queenbsincredibleedibles.com/.*/$',
-            deny=r'(category\/)|(ive-fallen-in-love-with-keto)'),
-                     callback=callback_handler.process_callback,
-                     follow=False)
-    ]
-
-
-class SkinnyTaste(spiders.CrawlSpider):
-    name = 'skinny-taste'
-
-    callback_handler = CallbackHandler(
-        content_saver=persist.ContentSaver(_get_download_root()))
-
-    allowed_domains = ['skinnytaste.com']
-    start_urls = ['https://www.skinnytaste.com/recipes/keto/']
-
-    rules = [
-        # Extract links for finding additional recipe pages,
-        # e.g. https://www.skinnytaste.com/recipes/keto/page/2/
-        spiders.Rule(
-            linkextractors.LinkExtractor(
-                allow=r'skinnytaste.com/recipes/keto/page/\d+/')),
-        # Extract links for recipes.
-        spiders.Rule(linkextractors.LinkExtractor(
-            allow=[
-                r'skinnytaste.com/[^\/]+/$',
-            ],
-            restrict_xpaths='//div[@class="archives"]'),
-                     callback=callback_handler.process_callback,
-                     follow=False),
-    ]
-
-
-class SugarFreeMom(spiders.CrawlSpider):
-    name = 'sugar-free-mom'
-
-    callback_handler = CallbackHandler(
-        content_saver=persist.ContentSaver(_get_download_root()))
-
-    allowed_domains = ['sugarfreemom.com']
-    start_urls = ['https://www.sugarfreemom.com/recipes/category/diet/keto/']
-
-    rules = [
-        # Extract links for finding additional recipe pages,
-        # e.g. https://www.sugarfreemom.com/recipes/category/diet/keto/page/2/
-        spiders.Rule(
-            linkextractors.LinkExtractor(allow=(
-                r'sugarfreemom.com/recipes/category/diet/keto/page/\d+/'))),
-        # Extract links for recipes.
-        spiders.Rule(linkextractors.LinkExtractor(
-            allow=r'sugarfreemom.com/recipes/[^\/]+/$',
-            restrict_xpaths='//main'),
-                     callback=callback_handler.process_callback,
-                     follow=False),
-    ]
-
-
-class WholesomeYum(spiders.CrawlSpider):
-    name = 'wholesome-yum'
-
-    callback_handler = CallbackHandler(
-        content_saver=persist.ContentSaver(_get_download_root()))
-
-    allowed_domains = ['wholesomeyum.com']
-    start_urls = ['https://www.wholesomeyum.com/tag/keto/']
-
-    rules = [
-        # Extract links for finding additional recipe pages,
-        # e.g. https://www.wholesomeyum.com/tag/keto/page/2/
-        spiders.Rule(
-            linkextractors.LinkExtractor(
-                allow=r'wholesomeyum.com/tag/keto/page/\d+/')),
-        # Extract links for recipes.
-        spiders.Rule(linkextractors.LinkExtractor(allow=[
-            r'wholesomeyum.com/[^\/]+/$', r'wholesomeyum.com/recipes/[^\/]+/$'
-        ],
-                                                  restrict_xpaths='//main'),
-                     callback=callback_handler.process_callback,
-                     follow=False),
-    ]
-
-
-class YourFriendsJ(spiders.CrawlSpider):
-    name = 'your-friends-j'
-
-    callback_handler = CallbackHandler(
-        content_saver=persist.ContentSaver(_get_download_root()))
-
-    allowed_domains = ['yourfriendsj.com']
-    start_urls = ['http://yourfriendsj.com/recipe-library/']
-
-    rules = [
-
-        # Extract links for finding additional recipe pages,
-        # e.g. http://yourfriendsj.com/tag/keto/page/2/
-        spiders.Rule(
-            linkextractors.LinkExtractor(
-                allow=r'yourfriendsj.com/recipe-library/\?paged=\d+')),
-        # Extract links for recipes,
-        # e.g. http://yourfriendsj.com/recipes/easy-guacamole-recipe/
-        spiders.Rule(linkextractors.LinkExtractor(
-            allow=r'http://yourfriendsj.com/recipes/[^\/]*/$',
-            restrict_xpaths='//article'),
-                     callback=callback_handler.process_callback,
-                     follow=False)
-    ]
+        with metrics.timed(self.crawler.stats, 'callback',
+                           self.callback_profiler):
+            return self.callback_handler.process_callback(response)
+
+    def _requests_to_follow(self, response):
+        with metrics.timed(self.crawler.stats, 'link_extraction'):
+            requests = list(
+                super(RecipeSpider, self)._requests_to_follow(response))
+        return requests
+
+    def _recrawl_requests(self):
+        with open(self.recrawl_urls) as f:
+            urls = [line.strip() for line in f if line.strip()]
+        self.logger.info('Recrawling %d recipes from %s', len(urls),
+                         self.recrawl_urls)
+        for url in urls:
+            yield http.Request(url,
+                               callback=self.parse_recipe,
+                               dont_filter=True)
+
+    def _sitemap_request(self, url):
+        self._pending_sitemaps += 1
+        # Sitemaps and listing pages are counted by this spider, so in a
+        # distributed crawl only one worker discovers recipes through them
+        # (see ketohub.shared_queue).
+        return http.Request(url,
+                            callback=self._parse_sitemap,
+                            errback=self._sitemap_failed,
+                            meta={'discovery': True})
+
+    def _parse_sitemap(self, response):
+        self._pending_sitemaps -= 1
+        body = _get_sitemap_body(response)
+        if body is None:
+            self.logger.warning('Ignoring invalid sitemap: %s', response.url)
+        else:
+            site_map = sitemap.Sitemap(body)
+            if site_map.type == 'sitemapindex':
+                for entry in site_map:
+                    if not _matches_any(entry['loc'], self.sitemap_follow):
+                        continue
+                    # The recipes of an unmodified sitemap still have to be
+                    # carried over from the previous snapshot, if there is
+                    # one.
+                    if (self._previous_snapshot or
+                            self._modified_since_last_crawl(entry)):
+                        yield self._sitemap_request(entry['loc'])
+                    else:
+                        self._skipped_sitemap_count += 1
+            elif site_map.type == 'urlset':
+                for result in self._parse_urlset(site_map):
+                    yield result
+        for request in self._fall_back_if_done():
+            yield request
+
+    def _parse_urlset(self, site_map):
+        for entry in site_map:
+            url = entry['loc']
+            if not _matches_any(url, self.sitemap_recipe_patterns):
+                continue
+            self._sitemap_recipe_count += 1
+            if self._modified_since_last_crawl(entry):
+                yield http.Request(url, callback=self.parse_recipe)
+                continue
+            item = self._carry_over_previous_recipe(url)
+            if item:
+                yield item
+
+    def _sitemap_failed(self, failure):
+        self._pending_sitemaps -= 1
+        self.logger.warning('Failed to fetch sitemap: %s', failure.request.url)
+        return self._fall_back_if_done()
+
+    def _fall_back_if_done(self):
+        if (self._pending_sitemaps or self._sitemap_recipe_count or
+                self._skipped_sitemap_count):
+            return []
+        self.logger.info('No recipes found in sitemaps, crawling start URLs')
+        return self._listing_requests()
+
+    def _listing_requests(self):
+        requests = list(super(RecipeSpider, self).start_requests())
+        if self.pagination_url:
+            self._paginator = pagination.Paginator(self.max_pages)
+            # Maps the recipe links of each listing page seen so far to the
+            # first page they appeared on.
+            self._first_pages = {}
+            requests.extend(
+                self._page_request(page) for page in self._paginator.start())
+        return requests
+
+    def _page_request(self, page):
+        # The paginator only lives as long as the process, so a resumed crawl
+        # probes the listing again from page 1 rather than having the pages it
+        # already requested filtered out as seen.
+        return http.Request(self.pagination_url.format(page=page),
+                            callback=self._parse_listing_page,
+                            errback=self._listing_page_failed,
+                            meta={
+                                'page': page,
+                                'discovery': True
+                            },
+                            dont_filter=True)
+
+    def _parse_listing_page(self, response):
+        page = response.meta['page']
+        requests = self._requests_to_follow(response)
+        recipe_urls = frozenset(
+            request.url
+            for request in requests
+            if self._rules[request.meta['rule']].callback == self.parse_recipe)
+        first_page = self._first_pages.setdefault(recipe_urls, page)
+        empty = not recipe_urls or first_page < page
+        for next_page in self._paginator.page_done(page, empty):
+            yield self._page_request(next_page)
+        for request in requests:
+            yield request
+
+    def _listing_page_failed(self, failure):
+        page = failure.request.meta['page']
+        # Only a missing page ends the listing; timeouts, DNS errors and
+        # server errors say nothing about whether the page exists.
+        if (failure.check(httperror.HttpError) and
+                failure.value.response.status == 404):
+            next_pages = self._paginator.page_done(page, empty=True)
+        else:
+            next_pages = self._paginator.page_failed(page)
+            if page not in next_pages:
+                self.logger.warning('Giving up on listing page %s: %s',
+                                    failure.request.url, failure.value)
+        return [self._page_request(next_page) for next_page in next_pages]
+
+    def _modified_since_last_crawl(self, entry):
+        if not self._lastmod_since or 'lastmod' not in entry:
+            return True
+        # W3C datetimes compare correctly as strings at the same precision.
+        return entry['lastmod'][:10] >= self._lastmod_since[:10]
+
+    def _carry_over_previous_recipe(self, url):
+        if not self._previous_snapshot:
+            return None
+        key = recipe_key.from_url(url)
+        metadata = self._previous_snapshot.metadata(key)
+        if not metadata:
+            return None
+        previous_html_path = None
+        recipe = None
+        # Near-duplicates have no HTML or recipe of their own to carry over.
+        if 'duplicate_of' not in metadata:
+            previous_html_path = self._previous_snapshot.html_path(key)
+            recipe = self._previous_snapshot.recipe(key)
+        return {
+            'key': key,
+            'metadata': metadata,
+            'html': None,
+            'previous_html_path': previous_html_path,
+            'recipe': recipe,
+        }
+
+
+def _matches_any(url, patterns):
+    if not patterns:
+        return True
+    return any(re.search(pattern, url) for pattern in patterns)
+
+
+def _get_sitemap_body(response):
+    if isinstance(response, http.XmlResponse):
+        return response.body
+    if gz.gzip_magic_number(response):
+        return gz.gunzip(response.body)
+    if response.url.endswith('.xml') or response.url.endswith('.xml.gz'):
+        return response.body
+    return None
+
+
+_spider_classes = {}
+
+
+def _compile_rule(link_rule):
+    link_extractor = linkextractors.LinkExtractor(
+        allow=link_rule.allow,
+        deny=link_rule.deny,
+        restrict_xpaths=link_rule.restrict_xpaths,
+        restrict_css=link_rule.restrict_css)
+    if link_rule.recipe:
+        return spiders.Rule(link_extractor,
+                            callback='parse_recipe',
+                            follow=False)
+    return spiders.Rule(link_extractor)
+
+
+def _class_name(site_name):
+    return ''.join(
+        part.capitalize() for part in site_name.split('-')) + 'Spider'
+
+
+def spider_class(site):
+    """Returns the spider class for a site, building it on first use.
+
+    Args:
+        site: The sites.Site to crawl.
+
+    Returns:
+        A RecipeSpider subclass configured for the site.
+    """
+    cls = _spider_classes.get(site.name)
+    if cls is None:
+        cls = type(
+            str(_class_name(site.name)), (RecipeSpider,), {
+                'name': site.name,
+                'allowed_domains': list(site.allowed_domains),
+                'start_urls': list(site.start_urls),
+                'rules': [_compile_rule(rule) for rule in site.rules],
+                'sitemap_urls': list(site.sitemap_urls),
+                'sitemap_follow': list(site.sitemap_follow),
+                'sitemap_recipe_patterns': list(site.sitemap_recipe_patterns),
+                'pagination_url': site.pagination_url,
+                'max_pages': site.max_pages,
+                'min_download_delay': site.min_download_delay,
+                'max_concurrency': site.max_concurrency,
+                '__module__': __name__,
+            })
+        _spider_classes[site.name] = cls
+    return cls
@@ -0,0 +1,174 @@
+"""Per-site adaptive request rates.
+
+AdaptiveThrottle tunes each download slot (one per domain) separately. The
+slot starts slowly and, while the host answers quickly, gains one concurrent
+request per round of successful responses and shortens its delay. Slow
+responses take one concurrent request away, and 429 or 503 responses halve
+concurrency, double the delay and honor the host's Retry-After header.
+
+Each site can set its own bounds through the min_download_delay and
+max_concurrency attributes of its spider, which come from ketohub.sites. The
+effective rate of every slot is logged periodically and saved in the crawl
+stats.
+"""
+
+import email.utils
+import logging
+import time
+
+from scrapy import exceptions
+from scrapy import signals
+from twisted.internet import task
+
+logger = logging.getLogger(__name__)
+
+_BACKOFF_STATUSES = (429, 503)
+
+
+def _retry_after_seconds(response):
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    value = value.decode('latin-1').strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class _SlotPolicy(object):
+    """Rate state of one download slot."""
+
+    def __init__(self, delay, concurrency):
+        self.delay = delay
+        self.concurrency = concurrency
+        self.successes = 0
+        self.responses = 0
+        self.reported_responses = 0
+        self.backoffs = 0
+
+
+class AdaptiveThrottle(object):
+    """Extension that adapts each slot's concurrency and delay to its host."""
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('ADAPTIVE_THROTTLE_ENABLED'):
+            raise exceptions.NotConfigured()
+        self._crawler = crawler
+        self._stats = crawler.stats
+        self._start_delay = settings.getfloat('DOWNLOAD_DELAY')
+        self._min_delay = settings.getfloat('ADAPTIVE_THROTTLE_MIN_DELAY')
+        self._max_delay = settings.getfloat('ADAPTIVE_THROTTLE_MAX_DELAY')
+        self._max_concurrency = settings.getint(
+            'ADAPTIVE_THROTTLE_MAX_CONCURRENCY')
+        self._target_latency = settings.getfloat(
+            'ADAPTIVE_THROTTLE_TARGET_LATENCY')
+        self._report_interval = settings.getfloat(
+            'ADAPTIVE_THROTTLE_REPORT_INTERVAL')
+        self._policies = {}
+        self._report_task = None
+        self._started = None
+        crawler.signals.connect(self._spider_opened,
+                                signal=signals.spider_opened)
+        crawler.signals.connect(self._spider_closed,
+                                signal=signals.spider_closed)
+        crawler.signals.connect(self._response_downloaded,
+                                signal=signals.response_downloaded)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def _spider_opened(self, spider):
+        if getattr(spider, 'min_download_delay', None) is not None:
+            self._min_delay = spider.min_download_delay
+        if getattr(spider, 'max_concurrency', None) is not None:
+            self._max_concurrency = spider.max_concurrency
+        self._start_delay = max(self._start_delay, self._min_delay)
+        self._started = time.time()
+        if self._report_interval:
+            self._report_task = task.LoopingCall(self._report, spider)
+            self._report_task.start(self._report_interval, now=False)
+
+    def _spider_closed(self, spider, reason):
+        if self._report_task and self._report_task.running:
+            self._report_task.stop()
+        elapsed = max(time.time() - self._started, 1e-6)
+        for key, policy in self._policies.items():
+            self._stats.set_value('throttle/%s/rate' % key,
+                                  policy.responses / elapsed,
+                                  spider=spider)
+            self._record_policy(key, policy, spider)
+
+    def _response_downloaded(self, response, request, spider):
+        key = request.meta.get('download_slot')
+        slot = self._crawler.engine.downloader.slots.get(key)
+        if slot is None:
+            return
+        policy = self._policies.get(key)
+        if policy is None:
+            policy = _SlotPolicy(self._start_delay, 1)
+            self._policies[key] = policy
+        policy.responses += 1
+        self._adjust(policy, response, request.meta.get('download_latency'))
+        slot.delay = policy.delay
+        slot.concurrency = policy.concurrency
+
+    def _adjust(self, policy, response, latency):
+        if response.status in _BACKOFF_STATUSES:
+            policy.backoffs += 1
+            policy.successes = 0
+            policy.concurrency = max(1, policy.concurrency // 2)
+            delay = max(policy.delay * 2, self._min_delay, 1.0,
+                        _retry_after_seconds(response) or 0)
+            policy.delay = min(delay, self._max_delay)
+            self._stats.inc_value('throttle/backoffs')
+            logger.info(
+                'Backing off %s after HTTP %d: concurrency %d, '
+                'delay %.2fs', response.url, response.status,
+                policy.concurrency, policy.delay)
+        elif latency is not None and latency > self._target_latency:
+            policy.successes = 0
+            policy.concurrency = max(1, policy.concurrency - 1)
+            policy.delay = min(max(policy.delay * 1.5, self._min_delay),
+                               self._max_delay)
+        elif response.status == 200:
+            # Additive increase: one more concurrent request for every round
+            # of successful responses at the current concurrency.
+            policy.successes += 1
+            if policy.successes >= policy.concurrency:
+                policy.successes = 0
+                policy.concurrency = min(policy.concurrency + 1,
+                                         self._max_concurrency)
+                policy.delay = max(policy.delay * 0.75, self._min_delay)
+
+    def _record_policy(self, key, policy, spider):
+        self._stats.set_value('throttle/%s/concurrency' % key,
+                              policy.concurrency,
+                              spider=spider)
+        self._stats.set_value('throttle/%s/delay' % key,
+                              policy.delay,
+                              spider=spider)
+        self._stats.set_value('throttle/%s/backoffs' % key,
+                              policy.backoffs,
+                              spider=spider)
+
+    def _report(self, spider):
+        for key, policy in sorted(self._policies.items()):
+            rate = ((policy.responses - policy.reported_responses) /
+                    self._report_interval)
+            policy.reported_responses = policy.responses
+            logger.info(
+                'Throttle %s: %.2f responses/sec (concurrency %d, '
+                'delay %.2fs, %d backoffs)',
+                key,
+                rate,
+                policy.concurrency,
+                policy.delay,
+                policy.backoffs,
+                extra={'spider': spider})
+            self._record_policy(key, policy, spider)
@@ -0,0 +1,276 @@
+"""Finds recipes in a snapshot whose saved page isn't a usable recipe page.
+
+Truncated downloads, soft 404s and bot challenge pages are saved like any
+other page, and otherwise only show up when downstream parsing fails. The
+validator checks every saved recipe in a pool of worker processes:
+
+    python -m ketohub.validate SNAPSHOT --output report.json \\
+        --recrawl-dir recrawl/
+
+A recipe fails if its page is missing, smaller than --min-size, cut off
+before </html>, looks like an error or challenge page, lacks a schema.org
+Recipe in its JSON-LD, or lacks its site's recipe_markers (see
+ketohub.sites). Near-duplicates, whose pages aren't saved, are skipped.
+
+The report counts the failures by reason and lists the failed keys. With
+--recrawl-dir, the URLs of the failed recipes are also written to
+recrawl-<spider>.txt files, which `python -m ketohub.runner --recrawl-dir`
+fetches again into the snapshot. Snapshots saved with
+STORAGE_BACKEND=archive or object-store can't be validated.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import re
+
+from scrapy.utils import url as url_utils
+
+from ketohub import persist
+from ketohub import recipe_extract
+from ketohub import sites
+
+logger = logging.getLogger(__name__)
+
+MISSING_METADATA = 'missing_metadata'
+MISSING_HTML = 'missing_html'
+TOO_SMALL = 'too_small'
+TRUNCATED = 'truncated'
+ERROR_PAGE = 'error_page'
+CHALLENGE_PAGE = 'challenge_page'
+NO_RECIPE_JSON_LD = 'no_recipe_json_ld'
+MISSING_MARKER = 'missing_marker'
+
+DEFAULT_MIN_SIZE = 2048
+
+_RECRAWL_PATTERN = 'recrawl-%s.txt'
+# </html> is looked for this close to the end of the page.
+_TAIL_BYTES = 1024
+_TITLE_PATTERN = re.compile(br'<title[^>]*>(.*?)</title>', re.I | re.S)
+_ERROR_TITLE_PATTERN = re.compile(br'\b(?:404|not found|nothing found)\b', re.I)
+# Markers of Cloudflare's challenge pages. Cloudflare also injects its
+# /cdn-cgi/challenge-platform detection script into ordinary pages, so that
+# path alone doesn't make a challenge page.
+_CHALLENGE_PATTERNS = (
+    re.compile(br'<title[^>]*>\s*just a moment\.\.\.', re.I),
+    re.compile(br'attention required! \| cloudflare', re.I),
+    re.compile(br'cf-browser-verification|id="challenge-form"', re.I),
+)
+
+
+def _site_for_url(url):
+    for site in sites.SITES:
+        if url_utils.url_is_from_any_domain(url, site.allowed_domains):
+            return site
+    return None
+
+
+def check_html(html, min_size=DEFAULT_MIN_SIZE, recipe_markers=()):
+    """Checks that a saved page looks like a complete recipe page.
+
+    Args:
+        html: Content of the saved page, as bytes.
+        min_size: Smallest size in bytes of a valid page.
+        recipe_markers: Strings that every recipe page of the site contains.
+
+    Returns:
+        A list of the reasons the page is invalid, empty if it's valid.
+    """
+    # A challenge page may be long and complete, so rule it out first.
+    for pattern in _CHALLENGE_PATTERNS:
+        if pattern.search(html):
+            return [CHALLENGE_PAGE]
+    reasons = []
+    if len(html) < min_size:
+        reasons.append(TOO_SMALL)
+    if b'</html>' not in html[-_TAIL_BYTES:].lower():
+        reasons.append(TRUNCATED)
+    title = _TITLE_PATTERN.search(html)
+    if title and _ERROR_TITLE_PATTERN.search(title.group(1)):
+        reasons.append(ERROR_PAGE)
+    if not recipe_extract.extract_recipe(recipe_extract.json_ld_blocks(html)):
+        reasons.append(NO_RECIPE_JSON_LD)
+    for marker in recipe_markers:
+        if marker.encode('utf8') not in html:
+            reasons.append(MISSING_MARKER)
+            break
+    return reasons
+
+
+def _read_file(filepath):
+    with open(filepath, 'rb') as f:
+        return f.read()
+
+
+def check_recipe(snapshot_root, key, min_size=DEFAULT_MIN_SIZE, blob_root=None):
+    """Checks one saved recipe.
+
+    Args:
+        snapshot_root: Directory of the snapshot.
+        key: Recipe key of the recipe to check.
+        min_size: Smallest size in bytes of a valid page.
+        blob_root: BLOB_ROOT of a snapshot saved with content-addressed
+            storage.
+
+    Returns:
+        A (key, url, reasons) tuple, where url is the recipe's URL (if known)
+        and reasons is a list of the reasons the recipe is invalid.
+    """
+    recipe_dir = os.path.join(snapshot_root, key)
+    try:
+        with open(os.path.join(recipe_dir, 'metadata.json')) as f:
+            metadata = json.load(f)
+    except (IOError, ValueError):
+        return key, None, [MISSING_METADATA]
+    url = metadata.get('url')
+    if 'duplicate_of' in metadata:
+        return key, url, []
+
+    read_file_fn = _read_file
+    if blob_root:
+        read_file_fn = persist.BlobStore(blob_root).read_file
+    try:
+        html = read_file_fn(os.path.join(recipe_dir, 'index.html'))
+    except (IOError, OSError, ValueError):
+        return key, url, [MISSING_HTML]
+    site = _site_for_url(url) if url else None
+    recipe_markers = site.recipe_markers if site else ()
+    return key, url, check_html(html, min_size, recipe_markers)
+
+
+def _check_recipe(args):
+    return check_recipe(*args)
+
+
+def _recipe_keys(snapshot_root):
+    for entry in os.scandir(snapshot_root):
+        if entry.is_dir():
+            yield entry.name
+
+
+def validate_snapshot(snapshot_root,
+                      min_size=DEFAULT_MIN_SIZE,
+                      blob_root=None,
+                      processes=None):
+    """Checks every recipe in a snapshot in a pool of worker processes.
+
+    Args:
+        snapshot_root: Directory of the snapshot.
+        min_size: Smallest size in bytes of a valid page.
+        blob_root: BLOB_ROOT of a snapshot saved with content-addressed
+            storage.
+        processes: Number of worker processes, defaults to the number of
+            CPUs.
+
+    Returns:
+        A report dictionary with the number of recipes 'checked', the number
+        of recipes that 'failed' per reason in 'reasons', and a 'failures'
+        dictionary mapping each failed key to its URL and reasons.
+    """
+    tasks = ((snapshot_root, key, min_size, blob_root)
+             for key in _recipe_keys(snapshot_root))
+    checked = 0
+    reasons = {}
+    failures = {}
+    with multiprocessing.Pool(processes) as pool:
+        for key, url, key_reasons in pool.imap_unordered(_check_recipe,
+                                                         tasks,
+                                                         chunksize=64):
+            checked += 1
+            if not key_reasons:
+                continue
+            failures[key] = {'url': url, 'reasons': key_reasons}
+            for reason in key_reasons:
+                reasons[reason] = reasons.get(reason, 0) + 1
+    return {
+        'checked': checked,
+        'failed': len(failures),
+        'reasons': reasons,
+        'failures': failures,
+    }
+
+
+def write_recrawl_lists(report, recrawl_dir):
+    """Writes the URLs of failed recipes to one recrawl file per spider.
+
+    Args:
+        report: Report returned by validate_snapshot.
+        recrawl_dir: Directory in which to write the recrawl-<spider>.txt
+            files.
+
+    Returns:
+        A dictionary mapping each spider name to the number of URLs written.
+    """
+    urls_by_spider = {}
+    for key, failure in sorted(report['failures'].items()):
+        url = failure['url']
+        site = _site_for_url(url) if url else None
+        if not site:
+            logger.warning('Can\'t recrawl %s, which has no known site', key)
+            continue
+        urls_by_spider.setdefault(site.name, []).append(url)
+    persist._ensure_directory_exists(recrawl_dir)
+    for spider_name, urls in urls_by_spider.items():
+        with open(recrawl_path(recrawl_dir, spider_name), 'w') as f:
+            f.write(''.join(url + '\n' for url in urls))
+    return {
+        spider_name: len(urls) for spider_name, urls in urls_by_spider.items()
+    }
+
+
+def recrawl_path(recrawl_dir, spider_name):
+    return os.path.join(recrawl_dir, _RECRAWL_PATTERN % spider_name)
+
+
+def read_recrawl_lists(recrawl_dir):
+    """Returns a dictionary mapping spider names to their recrawl files."""
+    prefix, suffix = _RECRAWL_PATTERN.split('%s')
+    paths = {}
+    for filename in sorted(os.listdir(recrawl_dir)):
+        if filename.startswith(prefix) and filename.endswith(suffix):
+            spider_name = filename[len(prefix):-len(suffix)]
+            paths[spider_name] = os.path.join(recrawl_dir, filename)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='ketohub-validate',
+        description='Check that the recipes in a snapshot are complete.')
+    parser.add_argument('snapshot', help='Directory of the snapshot')
+    parser.add_argument('--output', help='File in which to save the report')
+    parser.add_argument(
+        '--recrawl-dir',
+        help=('Directory in which to write the URLs of failed recipes, one '
+              'file per spider'))
+    parser.add_argument('--min-size',
+                        type=int,
+                        default=DEFAULT_MIN_SIZE,
+                        help='Smallest size in bytes of a valid page')
+    parser.add_argument(
+        '--blob-root',
+        help='BLOB_ROOT of a snapshot saved with content-addressed storage')
+    parser.add_argument('--processes',
+                        type=int,
+                        help='Number of worker processes')
+    args = parser.parse_args()
+
+    report = validate_snapshot(args.snapshot,
+                               min_size=args.min_size,
+                               blob_root=args.blob_root,
+                               processes=args.processes)
+    print('checked: %d' % report['checked'])
+    print('failed: %d' % report['failed'])
+    for reason, count in sorted(report['reasons'].items()):
+        print('  %s: %d' % (reason, count))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4, sort_keys=True)
+    if args.recrawl_dir:
+        write_recrawl_lists(report, args.recrawl_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from ketohub import archive
+
+
+class ArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.archive_path = os.path.join(self.root, archive.ARCHIVE_FILENAME)
+
+    def _write(self, files):
+        writer = archive.get_writer(self.archive_path, self.root)
+        for key, filename, content in files:
+            writer.write_file(os.path.join(self.root, key, filename), content)
+        writer.release()
+
+    def test_reader_reads_recipes_by_key(self):
+        self._write([
+            ('foo', 'metadata.json', '{"url": "https://mock.com/foo/"}'),
+            ('foo', 'index.html', b'<html>Foo</html>'),
+            ('bar', 'index.html', b'<html>Bar</html>' * 100),
+        ])
+
+        with archive.ArchiveReader(self.archive_path) as reader:
+            self.assertEqual(['foo', 'bar'], reader.keys())
+            self.assertIn('foo', reader)
+            self.assertNotIn('baz', reader)
+            self.assertEqual(b'<html>Foo</html>',
+                             reader.read_recipe_html('foo'))
+            self.assertEqual(b'<html>Bar</html>' * 100,
+                             reader.read_recipe_html('bar'))
+            self.assertEqual({'url': 'https://mock.com/foo/'},
+                             reader.read_metadata('foo'))
+
+    def test_archive_is_a_standard_tar_file(self):
+        self._write([('foo', 'index.html', b'<html>Foo</html>')])
+
+        with tarfile.open(self.archive_path) as tar:
+            self.assertEqual(['foo/index.html'], tar.getnames())
+            self.assertEqual(b'<html>Foo</html>',
+                             tar.extractfile('foo/index.html').read())
+
+    def test_writer_appends_to_existing_archive(self):
+        self._write([('foo', 'index.html', b'<html>Foo</html>')])
+        self._write([('bar', 'index.html', b'<html>Bar</html>')])
+
+        with archive.ArchiveReader(self.archive_path) as reader:
+            self.assertEqual(b'<html>Foo</html>',
+                             reader.read_recipe_html('foo'))
+            self.assertEqual(b'<html>Bar</html>',
+                             reader.read_recipe_html('bar'))
+
+    def test_get_writer_shares_writer_until_released(self):
+        first = archive.get_writer(self.archive_path, self.root)
+        second = archive.get_writer(self.archive_path, self.root)
+        self.assertIs(first, second)
+
+        first.release()
+        second.write_file(os.path.join(self.root, 'foo', 'index.html'),
+                          b'<html>Foo</html>')
+        second.release()
+
+        with archive.ArchiveReader(self.archive_path) as reader:
+            self.assertEqual(['foo'], reader.keys())
@@ -0,0 +1,74 @@
+import unittest
+
+import mock
+from scrapy import exceptions
+from scrapy.settings import Settings
+
+from ketohub import backpressure
+
+_MB = 1024 * 1024
+
+
+class MemoryBackpressureTest(unittest.TestCase):
+
+    def setUp(self):
+        self.crawler = mock.Mock()
+        self.crawler.settings = Settings({
+            'MEMORY_BACKPRESSURE_LIMIT_MB': 100,
+            'MEMORY_BACKPRESSURE_RESUME_RATIO': 0.9,
+            'MEMORY_BACKPRESSURE_CHECK_INTERVAL': 1.0,
+        })
+        self.engine = self.crawler.engine
+        self.engine.downloader.active = {mock.Mock()}
+        self.engine.scraper.slot.is_idle.return_value = False
+        self.rss = 50 * _MB
+        self.spider = mock.Mock()
+        self.extension = backpressure.MemoryBackpressure(
+            self.crawler, rss_fn=lambda: self.rss)
+
+    def test_disabled_without_limit(self):
+        self.crawler.settings = Settings({'MEMORY_BACKPRESSURE_LIMIT_MB': 0})
+
+        with self.assertRaises(exceptions.NotConfigured):
+            backpressure.MemoryBackpressure(self.crawler)
+
+    def test_disabled_when_rss_is_unknown(self):
+        with self.assertRaises(exceptions.NotConfigured):
+            backpressure.MemoryBackpressure(self.crawler, rss_fn=lambda: None)
+
+    def test_pauses_over_limit_and_resumes_below_resume_ratio(self):
+        self.extension._check(self.spider)
+        self.engine.pause.assert_not_called()
+
+        self.rss = 120 * _MB
+        self.extension._check(self.spider)
+        self.engine.pause.assert_called_once_with()
+
+        self.rss = 95 * _MB
+        self.extension._check(self.spider)
+        self.engine.unpause.assert_not_called()
+
+        self.rss = 80 * _MB
+        self.extension._check(self.spider)
+        self.engine.unpause.assert_called_once_with()
+        self.engine.slot.nextcall.schedule.assert_called_once_with()
+        self.crawler.stats.inc_value.assert_called_once_with(
+            'memory_backpressure/pauses', spider=self.spider)
+
+    def test_resumes_when_nothing_left_in_flight(self):
+        self.rss = 120 * _MB
+        self.extension._check(self.spider)
+        self.engine.downloader.active = set()
+        self.engine.scraper.slot.is_idle.return_value = True
+
+        self.extension._check(self.spider)
+
+        self.engine.unpause.assert_called_once_with()
+        self.crawler.stats.inc_value.assert_any_call(
+            'memory_backpressure/forced_resumes', spider=self.spider)
+
+    def test_current_rss_bytes(self):
+        rss = backpressure.current_rss_bytes()
+
+        if rss is not None:
+            self.assertGreater(rss, 0)
@@ -0,0 +1,109 @@
+import gzip
+import shutil
+import tempfile
+import unittest
+from urllib import error
+from urllib import request
+
+from scrapy import http
+from scrapy import spiders
+from scrapy.core.downloader import middleware
+from scrapy.utils import test
+
+from ketohub import benchmark
+
+
+class FixtureServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fixtures_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.fixtures_dir)
+        self.server = benchmark.FixtureServer(self.fixtures_dir)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def test_serves_fixture_recorded_for_url(self):
+        with open(
+                benchmark._fixture_path(self.fixtures_dir,
+                                        'https://www.mock.com/chicken-kiev/'),
+                'wb') as f:
+            f.write(b'<html>Mock HTML</html>')
+
+        response = request.urlopen(self.server.url + '/mock-com_chicken-kiev')
+
+        self.assertEqual(b'<html>Mock HTML</html>', response.read())
+        self.assertEqual('text/html; charset=utf-8',
+                         response.headers['Content-Type'])
+
+    def test_returns_404_for_unrecorded_url(self):
+        with self.assertRaises(error.HTTPError) as context:
+            request.urlopen(self.server.url + '/mock-com_beef-stew')
+        self.assertEqual(404, context.exception.code)
+
+
+class FixtureRecorderMiddlewareTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fixtures_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.fixtures_dir)
+
+    def test_records_decompressed_body(self):
+        settings = benchmark._record_settings(self.fixtures_dir, 10,
+                                              self.fixtures_dir)
+        crawler = test.get_crawler(spiders.Spider, settings.copy_to_dict())
+        crawler.spider = spiders.Spider('mock')
+        manager = middleware.DownloaderMiddlewareManager.from_crawler(crawler)
+        url = 'https://www.mock.com/chicken-kiev/'
+        response = http.Response(url,
+                                 headers={'Content-Encoding': 'gzip'},
+                                 body=gzip.compress(b'<html>Mock HTML</html>'),
+                                 request=http.Request(url))
+
+        for method in manager.methods['process_response']:
+            response = method(http.Request(url), response, crawler.spider)
+
+        with open(benchmark._fixture_path(self.fixtures_dir, url), 'rb') as f:
+            self.assertEqual(b'<html>Mock HTML</html>', f.read())
+
+
+class CompareToBaselineTest(unittest.TestCase):
+
+    def test_reports_metrics_that_got_worse(self):
+        regressions = benchmark.compare_to_baseline(
+            {'ruled-me': {
+                'pages_per_sec': 50.0,
+                'peak_rss_bytes': 150.0,
+            }},
+            {'ruled-me': {
+                'pages_per_sec': 100.0,
+                'peak_rss_bytes': 100.0,
+            }},
+            tolerance=0.1)
+
+        self.assertEqual([
+            'ruled-me: pages_per_sec regressed 50.0% (100.00 -> 50.00)',
+            'ruled-me: peak_rss_bytes regressed 50.0% (100.00 -> 150.00)',
+        ], regressions)
+
+    def test_ignores_changes_within_tolerance_and_improvements(self):
+        self.assertEqual(
+            [],
+            benchmark.compare_to_baseline(
+                {'ruled-me': {
+                    'pages_per_sec': 95.0,
+                    'peak_rss_bytes': 50.0,
+                }}, {
+                    'ruled-me': {
+                        'pages_per_sec': 100.0,
+                        'peak_rss_bytes': 100.0,
+                    }
+                },
+                tolerance=0.1))
+
+    def test_ignores_spiders_missing_from_baseline(self):
+        self.assertEqual([],
+                         benchmark.compare_to_baseline(
+                             {'ruled-me': {
+                                 'pages_per_sec': 1.0
+                             }}, {},
+                             tolerance=0.1))
@@ -0,0 +1,101 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from scrapy import http
+
+from ketohub import dupefilter
+from ketohub import fingerprint
+
+
+def _digest(value):
+    return hashlib.sha1(value.encode('utf8')).digest()
+
+
+class BloomFilterTest(unittest.TestCase):
+
+    def test_add_reports_items_added_before(self):
+        bloom = dupefilter.BloomFilter(capacity=1000, error_rate=0.001)
+
+        self.assertFalse(bloom.add(_digest('foo')))
+        self.assertTrue(bloom.add(_digest('foo')))
+        self.assertIn(_digest('foo'), bloom)
+        self.assertNotIn(_digest('bar'), bloom)
+
+    def test_false_positive_rate_within_bounds(self):
+        bloom = dupefilter.BloomFilter(capacity=10000, error_rate=0.01)
+        for i in range(10000):
+            bloom.add(_digest('added-%d' % i))
+
+        false_positives = sum(
+            _digest('missing-%d' % i) in bloom for i in range(10000))
+
+        self.assertLess(false_positives, 200)
+
+    def test_size_is_fixed_by_capacity_and_error_rate(self):
+        bloom = dupefilter.BloomFilter(capacity=1000000, error_rate=0.00001)
+
+        self.assertLess(bloom.size_bytes, 3 * 1024 * 1024)
+
+
+class BloomDupeFilterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.job_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.job_dir)
+        self.fingerprinter = fingerprint.RecipeKeyRequestFingerprinter()
+
+    def _dupe_filter(self, path=None):
+        return dupefilter.BloomDupeFilter(self.fingerprinter,
+                                          capacity=1000,
+                                          error_rate=0.001,
+                                          path=path)
+
+    def test_filters_requests_for_same_recipe_key(self):
+        dupe_filter = self._dupe_filter()
+
+        self.assertFalse(
+            dupe_filter.request_seen(http.Request('https://mock.com/kiev/')))
+        self.assertTrue(
+            dupe_filter.request_seen(
+                http.Request('http://www.mock.com/kiev/?utm_source=feed')))
+        self.assertFalse(
+            dupe_filter.request_seen(http.Request('https://mock.com/pie/')))
+
+    def test_resumed_crawl_remembers_seen_requests(self):
+        dupe_filter = self._dupe_filter(self.job_dir)
+        dupe_filter.request_seen(http.Request('https://mock.com/kiev/'))
+        dupe_filter.close('shutdown')
+
+        dupe_filter = self._dupe_filter(self.job_dir)
+
+        self.assertTrue(
+            dupe_filter.request_seen(http.Request('https://mock.com/kiev/')))
+        self.assertFalse(
+            dupe_filter.request_seen(http.Request('https://mock.com/pie/')))
+
+    def test_seeds_from_default_dupe_filter_file(self):
+        fp = self.fingerprinter.fingerprint(
+            http.Request('https://mock.com/kiev/'))
+        with open(os.path.join(self.job_dir, 'requests.seen'), 'w') as f:
+            f.write(fp.hex() + '\n')
+
+        dupe_filter = self._dupe_filter(self.job_dir)
+
+        self.assertTrue(
+            dupe_filter.request_seen(http.Request('https://mock.com/kiev/')))
+
+    def test_ignores_filter_saved_with_different_size(self):
+        dupe_filter = dupefilter.BloomDupeFilter(self.fingerprinter,
+                                                 capacity=10,
+                                                 error_rate=0.1,
+                                                 path=self.job_dir)
+        dupe_filter.request_seen(http.Request('https://mock.com/kiev/'))
+        dupe_filter.close('shutdown')
+
+        dupe_filter = self._dupe_filter(self.job_dir)
+
+        self.assertFalse(
+            dupe_filter.request_seen(http.Request('https://mock.com/kiev/')))
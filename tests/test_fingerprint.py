@@ -0,0 +1,72 @@
+import unittest
+
+from scrapy import http
+from scrapy import spiders
+from scrapy.utils import test
+
+from ketohub import fingerprint
+
+
+class RecipeKeyRequestFingerprinterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fingerprinter = fingerprint.RecipeKeyRequestFingerprinter()
+
+    def test_requests_for_same_recipe_key_share_fingerprint(self):
+        self.assertEqual(
+            self.fingerprinter.fingerprint(
+                http.Request('https://www.mock.com/Mikes_Chicken_Kiev/')),
+            self.fingerprinter.fingerprint(
+                http.Request('http://mock.com/mikes-chicken-kiev')))
+
+    def test_requests_for_different_recipes_differ(self):
+        self.assertNotEqual(
+            self.fingerprinter.fingerprint(
+                http.Request('https://www.mock.com/chicken-kiev/')),
+            self.fingerprinter.fingerprint(
+                http.Request('https://www.mock.com/beef-stew/')))
+
+    def test_post_requests_use_default_fingerprint(self):
+        self.assertNotEqual(
+            self.fingerprinter.fingerprint(
+                http.Request('https://www.mock.com/search',
+                             method='POST',
+                             body=b'q=kiev')),
+            self.fingerprinter.fingerprint(
+                http.Request('https://www.mock.com/search',
+                             method='POST',
+                             body=b'q=stew')))
+
+
+class SameRecipeRedirectMiddlewareTest(unittest.TestCase):
+
+    def setUp(self):
+        crawler = test.get_crawler(spiders.Spider)
+        self.spider = crawler._create_spider('mock')
+        self.middleware = (
+            fingerprint.SameRecipeRedirectMiddleware.from_crawler(crawler))
+
+    def _redirect(self, url, location):
+        request = http.Request(url)
+        response = http.Response(url,
+                                 status=301,
+                                 headers={'Location': location},
+                                 request=request)
+        return self.middleware.process_response(request, response, self.spider)
+
+    def test_redirect_to_same_recipe_bypasses_dupe_filter(self):
+        for url, location in (
+            ('https://www.mock.com/kiev', 'https://www.mock.com/kiev/'),
+            ('http://www.mock.com/kiev/', 'https://www.mock.com/kiev/'),
+            ('https://mock.com/kiev/', 'https://www.mock.com/kiev/'),
+        ):
+            redirected = self._redirect(url, location)
+
+            self.assertEqual(location, redirected.url)
+            self.assertTrue(redirected.dont_filter)
+
+    def test_redirect_to_other_recipe_is_filtered(self):
+        redirected = self._redirect('https://www.mock.com/kiev/',
+                                    'https://www.mock.com/beef-stew/')
+
+        self.assertFalse(redirected.dont_filter)
@@ -0,0 +1,62 @@
+import unittest
+
+from ketohub import html_filter
+
+
+class ReduceHtmlTest(unittest.TestCase):
+
+    def test_keeps_title_json_ld_and_article(self):
+        html = (b'<html><head><title>Chicken Kiev</title>'
+                b'<script>trackVisitor();</script>'
+                b'<script type="application/ld+json">{"@type": "Recipe"}'
+                b'</script></head><body><nav>Home</nav><div><article>'
+                b'<h1>Chicken Kiev</h1><script>showAd();</script>'
+                b'<img src="data:image/png;base64,AAAA"><img src="kiev.jpg">'
+                b'</article></div><footer>Copyright</footer></body></html>')
+
+        self.assertEqual(
+            b'<!DOCTYPE html>\n<html><head><meta charset="utf-8">'
+            b'<title>Chicken Kiev</title>'
+            b'<script type="application/ld+json">{"@type": "Recipe"}</script>'
+            b'</head><body><article><h1>Chicken Kiev</h1><img>'
+            b'<img src="kiev.jpg"></article></body></html>',
+            html_filter.reduce_html(html))
+
+    def test_keeps_json_ld_nested_in_article(self):
+        html = (b'<html><body><article><p>Kiev</p>'
+                b'<script type="application/ld+json">{"@type": "Recipe"}'
+                b'</script></article></body></html>')
+
+        self.assertEqual(
+            b'<!DOCTYPE html>\n<html><head><meta charset="utf-8">'
+            b'<script type="application/ld+json">{"@type": "Recipe"}</script>'
+            b'</head><body><article><p>Kiev</p></article></body></html>',
+            html_filter.reduce_html(html))
+
+    def test_keeps_utf8_without_declared_charset(self):
+        html = ('<html><body><script type="application/ld+json">'
+                '{"name": "Cr\xe8me br\xfbl\xe9e"}</script>'
+                '<article>Cr\xe8me br\xfbl\xe9e</article></body></html>'
+               ).encode('utf8')
+
+        reduced = html_filter.reduce_html(html)
+
+        self.assertIn('{"name": "Cr\xe8me br\xfbl\xe9e"}'.encode('utf8'),
+                      reduced)
+        self.assertIn('<article>Cr\xe8me br\xfbl\xe9e</article>'.encode('utf8'),
+                      reduced)
+
+    def test_ignores_stale_declared_charset(self):
+        html = ('<html><head><meta charset="iso-8859-1"></head><body>'
+                '<article>Caf\xe9</article></body></html>').encode('utf8')
+
+        self.assertIn(b'<article>Caf\xc3\xa9</article>',
+                      html_filter.reduce_html(html))
+
+    def test_returns_page_without_recipe_content_unchanged(self):
+        html = b'<html><body><p>Page not found</p></body></html>'
+
+        self.assertEqual(html, html_filter.reduce_html(html))
+
+    def test_returns_empty_page_unchanged(self):
+        self.assertEqual(b'', html_filter.reduce_html(b''))
@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+from scrapy import http
+from scrapy.settings import Settings
+
+from ketohub import httpcache
+
+
+class CanonicalCacheStorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.spider = mock.Mock()
+        self.spider.name = 'mock-site'
+
+    def _open_storage(self, expiration_secs=0, max_bytes=0):
+        storage = httpcache.CanonicalCacheStorage(
+            Settings({
+                'HTTPCACHE_DIR': self.cache_dir,
+                'HTTPCACHE_EXPIRATION_SECS': expiration_secs,
+                'HTTPCACHE_MAX_BYTES': max_bytes,
+            }))
+        storage.open_spider(self.spider)
+        return storage
+
+    def _store(self, storage, url, body=b'<html>Mock HTML</html>'):
+        storage.store_response(
+            self.spider, http.Request(url),
+            http.HtmlResponse(url,
+                              headers={'ETag': '"abc123"'},
+                              body=body,
+                              encoding='utf-8'))
+
+    def test_retrieves_stored_response_by_canonical_url(self):
+        self._store(self._open_storage(), 'https://www.mock.com/kiev/')
+
+        response = self._open_storage().retrieve_response(
+            self.spider, http.Request('http://mock.com/kiev/?utm_source=x'))
+
+        self.assertIsInstance(response, http.HtmlResponse)
+        self.assertEqual('https://www.mock.com/kiev/', response.url)
+        self.assertEqual(200, response.status)
+        self.assertEqual(b'"abc123"', response.headers['ETag'])
+        self.assertEqual(b'<html>Mock HTML</html>', response.body)
+
+    def test_compresses_cached_responses(self):
+        self._store(self._open_storage(), 'https://mock.com/kiev/',
+                    b'<html>' + b'a' * 10000 + b'</html>')
+
+        self.assertLess(
+            os.path.getsize(
+                os.path.join(self.cache_dir, 'mock-site', 'mock-com_kiev.gz')),
+            1000)
+
+    def test_returns_none_for_missing_response(self):
+        self.assertIsNone(self._open_storage().retrieve_response(
+            self.spider, http.Request('https://mock.com/kiev/')))
+
+    def test_ignores_expired_response(self):
+        storage = self._open_storage(expiration_secs=60)
+        with mock.patch.object(httpcache.time, 'time', return_value=1000.0):
+            self._store(storage, 'https://mock.com/kiev/')
+
+        with mock.patch.object(httpcache.time, 'time', return_value=1100.0):
+            self.assertIsNone(
+                storage.retrieve_response(
+                    self.spider, http.Request('https://mock.com/kiev/')))
+
+    def test_evicts_least_recently_used_entries_beyond_max_size(self):
+        storage = self._open_storage()
+        self._store(storage, 'https://mock.com/kiev/')
+        entry_size = os.path.getsize(
+            os.path.join(self.cache_dir, 'mock-site', 'mock-com_kiev.gz'))
+        storage = self._open_storage(max_bytes=int(entry_size * 2.5))
+        self._store(storage, 'https://mock.com/stew/')
+        storage.retrieve_response(self.spider,
+                                  http.Request('https://mock.com/kiev/'))
+
+        self._store(storage, 'https://mock.com/mash/')
+
+        self.assertEqual(
+            ['mock-com_kiev.gz', 'mock-com_mash.gz'],
+            sorted(os.listdir(os.path.join(self.cache_dir, 'mock-site'))))
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+from scrapy import exceptions
+from scrapy import http
+
+from ketohub import incremental
+
+
+class ConditionalRequestMiddlewareTest(unittest.TestCase):
+
+    def setUp(self):
+        self.previous_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.previous_root)
+        self.mock_stats = mock.Mock()
+        self.middleware = incremental.ConditionalRequestMiddleware(
+            incremental.PreviousSnapshot(self.previous_root), self.mock_stats)
+        self.spider = mock.Mock()
+
+    def _save_previous(self, key, metadata, html):
+        os.makedirs(os.path.join(self.previous_root, key))
+        with open(os.path.join(self.previous_root, key, 'metadata.json'),
+                  'w') as f:
+            json.dump(metadata, f)
+        with open(os.path.join(self.previous_root, key, 'index.html'),
+                  'wb') as f:
+            f.write(html)
+
+    def test_from_crawler_requires_previous_download_root(self):
+        crawler = mock.Mock()
+        crawler.settings = {'PREVIOUS_DOWNLOAD_ROOT': None}
+        with self.assertRaises(exceptions.NotConfigured):
+            incremental.ConditionalRequestMiddleware.from_crawler(crawler)
+
+    def test_adds_validators_for_previously_saved_recipe(self):
+        self._save_previous('mock-com_chicken-kiev', {
+            'etag': '"abc123"',
+            'last_modified': 'Wed, 21 Oct 2015 07:28:00 GMT'
+        }, b'<html>Old</html>')
+        request = http.Request('https://www.mock.com/chicken-kiev/')
+
+        self.assertIsNone(self.middleware.process_request(request, self.spider))
+
+        self.assertEqual(b'"abc123"', request.headers['If-None-Match'])
+        self.assertEqual(b'Wed, 21 Oct 2015 07:28:00 GMT',
+                         request.headers['If-Modified-Since'])
+
+    def test_leaves_unknown_recipe_unconditional(self):
+        request = http.Request('https://www.mock.com/chicken-kiev/')
+
+        self.assertIsNone(self.middleware.process_request(request, self.spider))
+
+        self.assertNotIn('If-None-Match', request.headers)
+        self.assertNotIn('If-Modified-Since', request.headers)
+
+    def test_replaces_not_modified_response_with_previous_page(self):
+        self._save_previous('mock-com_chicken-kiev', {
+            'etag': '"abc123"',
+            'simhash': '00000000000000ff'
+        }, b'<html>Old</html>')
+        request = http.Request('https://www.mock.com/chicken-kiev/')
+        response = http.Response(request.url, status=304, request=request)
+
+        replaced = self.middleware.process_response(request, response,
+                                                    self.spider)
+
+        self.assertEqual(200, replaced.status)
+        self.assertEqual(b'<html>Old</html>', replaced.body)
+        self.assertEqual(b'"abc123"', replaced.headers['ETag'])
+        self.assertEqual(
+            os.path.join(self.previous_root, 'mock-com_chicken-kiev',
+                         'index.html'), request.meta['previous_html_path'])
+        self.assertEqual('00000000000000ff', request.meta['previous_simhash'])
+        self.mock_stats.inc_value.assert_called_once_with(
+            'incremental/unchanged', spider=self.spider)
+
+    def test_passes_through_modified_response(self):
+        self._save_previous('mock-com_chicken-kiev', {'etag': '"abc123"'},
+                            b'<html>Old</html>')
+        request = http.Request('https://www.mock.com/chicken-kiev/')
+        response = http.HtmlResponse(request.url,
+                                     status=200,
+                                     body=b'<html>New</html>',
+                                     request=request)
+
+        self.assertIs(
+            response,
+            self.middleware.process_response(request, response, self.spider))
+        self.assertNotIn('previous_html_path', request.meta)
+
+
+class PreviousSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.previous_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.previous_root)
+        self.snapshot = incremental.PreviousSnapshot(self.previous_root)
+
+    def test_content_entry_comes_from_manifest(self):
+        with open(os.path.join(self.previous_root, 'manifest-mock.tsv'),
+                  'w') as f:
+            f.write('foo\tabc\t10\n')
+
+        self.assertEqual(('abc', 10), self.snapshot.content_entry('foo'))
+
+    def test_content_entry_hashes_html_missing_from_manifest(self):
+        os.makedirs(os.path.join(self.previous_root, 'foo'))
+        with open(os.path.join(self.previous_root, 'foo', 'index.html'),
+                  'wb') as f:
+            f.write(b'<html>Mock HTML</html>')
+
+        self.assertEqual(
+            (hashlib.sha256(b'<html>Mock HTML</html>').hexdigest(), 22),
+            self.snapshot.content_entry('foo'))
+
+    def test_content_entry_is_none_for_unknown_key(self):
+        self.assertIsNone(self.snapshot.content_entry('foo'))
+
+    def test_recipe_comes_from_dataset(self):
+        with open(os.path.join(self.previous_root, 'recipes-mock.jsonl'),
+                  'w') as f:
+            f.write(json.dumps({'key': 'foo', 'name': 'Chicken Kiev'}) + '\n')
+
+        self.assertEqual({
+            'key': 'foo',
+            'name': 'Chicken Kiev'
+        }, self.snapshot.recipe('foo'))
+        self.assertIsNone(self.snapshot.recipe('bar'))
+
+
+class GetPreviousSnapshotTest(unittest.TestCase):
+
+    def test_returns_none_without_previous_download_root(self):
+        self.assertIsNone(
+            incremental.get_previous_snapshot({'PREVIOUS_DOWNLOAD_ROOT': None}))
+
+    def test_shares_snapshot_within_process(self):
+        settings = {'PREVIOUS_DOWNLOAD_ROOT': '/mock/previous'}
+
+        self.assertIs(incremental.get_previous_snapshot(settings),
+                      incremental.get_previous_snapshot(dict(settings)))
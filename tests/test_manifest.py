@@ -0,0 +1,46 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from ketohub import manifest
+
+
+class ManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.snapshot_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.snapshot_root)
+
+    def test_reads_entries_written_by_every_spider(self):
+        writer = manifest.ManifestWriter(
+            manifest.manifest_path(self.snapshot_root, 'ruled-me'))
+        writer.add('ruled-me_kiev', manifest.content_entry(b'<html>Kiev'))
+        writer.close()
+        writer = manifest.ManifestWriter(
+            manifest.manifest_path(self.snapshot_root, 'ketovale'))
+        writer.add('ketovale-com_stew', ('abc', 10))
+        writer.close()
+
+        self.assertEqual(
+            {
+                'ruled-me_kiev':
+                    (hashlib.sha256(b'<html>Kiev').hexdigest(), 10),
+                'ketovale-com_stew': ('abc', 10),
+            }, manifest.read_manifest(self.snapshot_root))
+
+    def test_later_entries_win(self):
+        writer = manifest.ManifestWriter(
+            manifest.manifest_path(self.snapshot_root, 'ruled-me'))
+        writer.add('ruled-me_kiev', ('abc', 10))
+        writer.add('ruled-me_kiev', ('def', 12))
+        writer.close()
+
+        self.assertEqual({'ruled-me_kiev': ('def', 12)},
+                         manifest.read_manifest(self.snapshot_root))
+
+    def test_reads_empty_manifest_of_snapshot_without_manifests(self):
+        self.assertEqual({},
+                         manifest.read_manifest(
+                             os.path.join(self.snapshot_root, 'missing')))
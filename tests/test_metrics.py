@@ -0,0 +1,101 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+from scrapy import http
+from scrapy import statscollectors
+
+from ketohub import metrics
+
+
+class TimedTest(unittest.TestCase):
+
+    def test_adds_call_and_seconds_to_stage(self):
+        stats = statscollectors.MemoryStatsCollector(mock.Mock())
+
+        with metrics.timed(stats, 'callback'):
+            pass
+        with metrics.timed(stats, 'callback'):
+            pass
+
+        self.assertEqual(2, stats.get_value('timing/callback/calls'))
+        self.assertGreaterEqual(stats.get_value('timing/callback/seconds'), 0)
+
+    def test_enables_profiler_only_inside_block(self):
+        stats = statscollectors.MemoryStatsCollector(mock.Mock())
+        profiler = mock.Mock()
+
+        with metrics.timed(stats, 'callback', profiler):
+            profiler.enable.assert_called_once_with()
+            profiler.disable.assert_not_called()
+
+        profiler.disable.assert_called_once_with()
+
+
+class CrawlMetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir)
+        self.stats = statscollectors.MemoryStatsCollector(mock.Mock())
+        self.extension = metrics.CrawlMetrics(self.stats,
+                                              self.output_dir,
+                                              profile=False)
+        self.spider = mock.Mock()
+        self.spider.name = 'mock-site'
+
+    def _receive(self, url, body, rule=None):
+        meta = {'download_latency': 0.5}
+        if rule is not None:
+            meta['rule'] = rule
+        request = http.Request(url, meta=meta)
+        response = http.Response(url, body=body, request=request)
+        self.extension.response_received(response, request, self.spider)
+        return response
+
+    def test_writes_json_summary_at_close(self):
+        self.extension.spider_opened(self.spider)
+        self._receive('https://mock.com/recipes/', b'listing')
+        response = self._receive('https://mock.com/kiev/', b'kiev', rule=1)
+        self.extension.item_scraped({}, response, self.spider)
+        self.stats.set_value('item_scraped_count', 1)
+
+        self.extension.spider_closed(self.spider, 'finished')
+
+        with open(os.path.join(self.output_dir, 'metrics-mock-site.json')) as f:
+            summary = json.load(f)
+        self.assertEqual(1, summary['items'])
+        self.assertEqual({
+            'calls': 2,
+            'seconds': 1.0
+        }, summary['stages']['download'])
+        self.assertEqual(
+            {
+                'start': {
+                    'pages': 1,
+                    'bytes': 7
+                },
+                'rule-1': {
+                    'pages': 1,
+                    'bytes': 4,
+                    'items': 1
+                },
+            }, summary['rules'])
+
+    def test_writes_prometheus_summary_at_close(self):
+        self.extension.spider_opened(self.spider)
+        self._receive('https://mock.com/kiev/', b'kiev', rule=1)
+
+        self.extension.spider_closed(self.spider, 'finished')
+
+        with open(os.path.join(self.output_dir, 'metrics-mock-site.prom')) as f:
+            lines = f.read().splitlines()
+        self.assertIn(
+            'ketohub_stage_seconds_total{spider="mock-site",stage="download"} '
+            '0.5', lines)
+        self.assertIn(
+            'ketohub_rule_pages_total{rule="rule-1",spider="mock-site"} 1',
+            lines)
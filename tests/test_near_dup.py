@@ -0,0 +1,44 @@
+import unittest
+
+from ketohub import near_dup
+
+_RECIPE = (b'<html><body><nav>Home Recipes About</nav><article>'
+           b'<h1>Keto Chicken Kiev</h1><p>Pound the chicken breasts thin, '
+           b'spread them with garlic butter and parsley, roll them up tightly '
+           b'and coat them in crushed pork rinds before baking until golden '
+           b'and cooked through. Serve with a green salad.</p></article>'
+           b'<footer>Copyright %s</footer></body></html>')
+
+
+class SimhashTest(unittest.TestCase):
+
+    def test_ignores_boilerplate_outside_main_content(self):
+        self.assertEqual(near_dup.simhash(_RECIPE % b'2018'),
+                         near_dup.simhash(_RECIPE % b'2019 Print View'))
+
+    def test_returns_none_for_page_without_text(self):
+        self.assertIsNone(near_dup.simhash(b'<html><body></body></html>'))
+
+    def test_differs_for_different_recipes(self):
+        other = (b'<html><body><article><h1>Cauliflower Mash</h1><p>Steam the '
+                 b'cauliflower and blend it with cream cheese.</p></article>'
+                 b'</body></html>')
+
+        self.assertGreater(
+            near_dup.hamming_distance(near_dup.simhash(_RECIPE % b''),
+                                      near_dup.simhash(other)), 3)
+
+
+class NearDuplicateIndexTest(unittest.TestCase):
+
+    def test_finds_fingerprint_within_max_distance(self):
+        index = near_dup.NearDuplicateIndex(max_distance=3)
+        index.add('original', 0xffff0000ffff0000)
+
+        self.assertEqual('original', index.find(0xffff0000ffff0007))
+
+    def test_ignores_fingerprint_beyond_max_distance(self):
+        index = near_dup.NearDuplicateIndex(max_distance=3)
+        index.add('original', 0xffff0000ffff0000)
+
+        self.assertIsNone(index.find(0xffff0000ffff000f))
@@ -0,0 +1,114 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import mock
+
+from ketohub import object_store
+from ketohub import persist
+
+
+class FakeObjectStoreClient(object):
+    """In-memory stand-in for an S3 client."""
+
+    def __init__(self, failures=0):
+        self.objects = {}
+        self.content_types = {}
+        self._failures = failures
+        self._lock = threading.Lock()
+
+    def upload_fileobj(self, fileobj, bucket, key, ExtraArgs=None, Config=None):
+        with self._lock:
+            if self._failures:
+                self._failures -= 1
+                fileobj.read(1)
+                raise IOError('Connection reset')
+            self.objects[(bucket, key)] = fileobj.read()
+            self.content_types[(bucket, key)] = ExtraArgs['ContentType']
+
+
+class ObjectStoreWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeObjectStoreClient()
+        self.sleep = mock.Mock()
+        self.root = os.path.join('download_output', '2019-03-01T000000+0000',
+                                 '')
+        self.writer = object_store.ObjectStoreWriter(self.client,
+                                                     'ketohub',
+                                                     self.root,
+                                                     prefix='raw/',
+                                                     sleep_fn=self.sleep)
+
+    def test_content_saver_uploads_recipes_under_snapshot_prefix(self):
+        saver = persist.ContentSaver(self.root,
+                                     write_file_fn=self.writer.write_file,
+                                     link_file_fn=self.writer.link_file)
+
+        saver.save_metadata('foo', {'url': 'https://mock.com/foo/'})
+        saver.save_recipe_html('foo', u'<html>Café</html>')
+
+        html_key = ('ketohub', 'raw/2019-03-01T000000+0000/foo/index.html')
+        self.assertEqual(u'<html>Café</html>'.encode('utf8'),
+                         self.client.objects[html_key])
+        self.assertEqual('text/html; charset=utf-8',
+                         self.client.content_types[html_key])
+        self.assertIn(
+            ('ketohub', 'raw/2019-03-01T000000+0000/foo/metadata.json'),
+            self.client.objects)
+
+    def test_object_key_without_prefix(self):
+        writer = object_store.ObjectStoreWriter(self.client, 'ketohub',
+                                                self.root)
+
+        self.assertEqual(
+            '2019-03-01T000000+0000/foo/index.html',
+            writer.object_key(os.path.join(self.root, 'foo', 'index.html')))
+
+    def test_link_file_uploads_previous_snapshot_file(self):
+        previous_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, previous_root)
+        source_path = os.path.join(previous_root, 'index.html')
+        with open(source_path, 'wb') as f:
+            f.write(b'<html>Foo</html>')
+
+        self.writer.link_file(source_path,
+                              os.path.join(self.root, 'foo', 'index.html'))
+
+        self.assertEqual(
+            b'<html>Foo</html>',
+            self.client.objects[('ketohub',
+                                 'raw/2019-03-01T000000+0000/foo/index.html')])
+
+    def test_retries_failed_uploads_with_backoff(self):
+        self.client = FakeObjectStoreClient(failures=2)
+        writer = object_store.ObjectStoreWriter(self.client,
+                                                'ketohub',
+                                                self.root,
+                                                retry_delay=0.5,
+                                                sleep_fn=self.sleep)
+
+        writer.write_file(os.path.join(self.root, 'foo', 'index.html'),
+                          b'<html>Foo</html>')
+
+        self.assertEqual(
+            b'<html>Foo</html>',
+            self.client.objects[('ketohub',
+                                 '2019-03-01T000000+0000/foo/index.html')])
+        self.assertEqual([mock.call(0.5), mock.call(1.0)],
+                         self.sleep.call_args_list)
+
+    def test_raises_after_max_retries(self):
+        self.client = FakeObjectStoreClient(failures=3)
+        writer = object_store.ObjectStoreWriter(self.client,
+                                                'ketohub',
+                                                self.root,
+                                                max_retries=2,
+                                                sleep_fn=self.sleep)
+
+        with self.assertRaises(IOError):
+            writer.write_file(os.path.join(self.root, 'foo', 'index.html'),
+                              b'<html>Foo</html>')
+        self.assertEqual({}, self.client.objects)
@@ -0,0 +1,75 @@
+import unittest
+
+from ketohub import pagination
+
+
+def _crawl(paginator, page_count):
+    """Simulates a crawl of a site with page_count full pages."""
+    requested = []
+    pending = paginator.start()
+    while pending:
+        requested.extend(pending)
+        next_pending = []
+        for page in pending:
+            next_pending.extend(
+                paginator.page_done(page, empty=page > page_count))
+        pending = next_pending
+    return requested
+
+
+class PaginatorTest(unittest.TestCase):
+
+    def test_requests_every_page_once(self):
+        for page_count in (0, 1, 2, 3, 8, 39, 100):
+            requested = _crawl(pagination.Paginator(max_pages=1000), page_count)
+
+            self.assertEqual(len(requested), len(set(requested)))
+            self.assertTrue(set(range(1, page_count + 1)).issubset(requested))
+
+    def test_wastes_logarithmic_requests_on_empty_pages(self):
+        requested = _crawl(pagination.Paginator(max_pages=1000), 500)
+
+        self.assertLessEqual(len([page for page in requested if page > 500]),
+                             10)
+
+    def test_probes_exponentially_and_fills_known_pages(self):
+        paginator = pagination.Paginator(max_pages=1000)
+
+        self.assertEqual([1], paginator.start())
+        self.assertEqual([2], paginator.page_done(1, empty=False))
+        self.assertEqual([4], paginator.page_done(2, empty=False))
+        self.assertEqual([3, 8], paginator.page_done(4, empty=False))
+        self.assertEqual([], paginator.page_done(3, empty=False))
+        self.assertEqual([6], paginator.page_done(8, empty=True))
+        self.assertEqual([5, 7], paginator.page_done(6, empty=False))
+
+    def test_stops_at_max_pages(self):
+        requested = _crawl(pagination.Paginator(max_pages=10), 50)
+
+        self.assertEqual(list(range(1, 11)), sorted(requested))
+
+    def test_requests_failed_page_again(self):
+        paginator = pagination.Paginator(max_pages=1000, max_attempts=3)
+        paginator.start()
+
+        self.assertEqual([1], paginator.page_failed(1))
+        self.assertEqual([1], paginator.page_failed(1))
+        self.assertEqual([2], paginator.page_done(1, empty=False))
+
+    def test_failed_page_does_not_end_listing(self):
+        paginator = pagination.Paginator(max_pages=1000, max_attempts=2)
+        paginator.start()
+        paginator.page_done(1, empty=False)
+
+        self.assertEqual([2], paginator.page_failed(2))
+        self.assertEqual([4], paginator.page_done(2, empty=False))
+
+    def test_searches_below_page_that_keeps_failing(self):
+        paginator = pagination.Paginator(max_pages=1000, max_attempts=2)
+        paginator.start()
+        paginator.page_done(1, empty=False)
+        paginator.page_done(2, empty=False)
+
+        self.assertEqual([4], paginator.page_failed(4))
+        self.assertEqual([3], paginator.page_failed(4))
+        self.assertEqual([], paginator.page_done(3, empty=False))
@@ -1,3 +1,6 @@
+import os
+import shutil
+import tempfile
 import unittest
 
 import mock
@@ -28,3 +31,115 @@ class PersistTest(unittest.TestCase):
     "dummy_key":"dummy value"
 }""".strip()),
         ])
+
+    def test_link_recipe_html_links_to_correct_file(self):
+        mock_link_file_fn = mock.Mock()
+        saver = persist.ContentSaver('downloads', self.mock_write_to_file_fn,
+                                     mock_link_file_fn)
+        saver.link_recipe_html('foo', 'previous/foo/index.html')
+
+        mock_link_file_fn.assert_called_once_with('previous/foo/index.html',
+                                                  'downloads/foo/index.html')
+        self.mock_write_to_file_fn.assert_not_called()
+
+
+class LocalFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.previous_saver = persist.ContentSaver(
+            os.path.join(self.temp_dir, 'snapshot-1'))
+        self.saver = persist.ContentSaver(
+            os.path.join(self.temp_dir, 'snapshot-2'))
+        self.previous_path = os.path.join(self.temp_dir, 'snapshot-1', 'foo',
+                                          'index.html')
+
+    def _read(self, snapshot):
+        with open(os.path.join(self.temp_dir, snapshot, 'foo', 'index.html'),
+                  'rb') as f:
+            return f.read()
+
+    def test_save_over_linked_page_leaves_previous_snapshot_alone(self):
+        self.previous_saver.save_recipe_html('foo', b'<html>Old</html>')
+        self.saver.link_recipe_html('foo', self.previous_path)
+
+        self.saver.save_recipe_html('foo', b'<html>New</html>')
+
+        self.assertEqual(b'<html>Old</html>', self._read('snapshot-1'))
+        self.assertEqual(b'<html>New</html>', self._read('snapshot-2'))
+        self.assertEqual(['index.html'],
+                         os.listdir(
+                             os.path.join(self.temp_dir, 'snapshot-2', 'foo')))
+
+    def test_link_over_existing_page_replaces_it(self):
+        self.previous_saver.save_recipe_html('foo', b'<html>Old</html>')
+        self.saver.save_recipe_html('foo', b'<html>New</html>')
+
+        self.saver.link_recipe_html('foo', self.previous_path)
+
+        self.assertEqual(b'<html>Old</html>', self._read('snapshot-2'))
+
+
+class BlobStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.store = persist.BlobStore(os.path.join(self.temp_dir, 'blobs'))
+
+    def _snapshot_path(self, snapshot, key, filename):
+        return os.path.join(self.temp_dir, snapshot, key, filename)
+
+    def _count_blobs(self):
+        return sum(
+            len(files)
+            for _, _, files in os.walk(os.path.join(self.temp_dir, 'blobs')))
+
+    def test_write_file_replaces_html_with_manifest(self):
+        html_path = self._snapshot_path('snapshot-1', 'foo', 'index.html')
+        self.store.write_file(html_path, b'<html>Mock HTML</html>')
+
+        self.assertFalse(os.path.exists(html_path))
+        self.assertTrue(os.path.exists(html_path + '.blob'))
+        self.assertEqual(b'<html>Mock HTML</html>',
+                         self.store.read_file(html_path))
+
+    def test_write_file_stores_identical_pages_once(self):
+        for snapshot in ('snapshot-1', 'snapshot-2'):
+            self.store.write_file(
+                self._snapshot_path(snapshot, 'foo', 'index.html'),
+                b'<html>Mock HTML</html>')
+
+        self.assertEqual(1, self._count_blobs())
+
+    def test_write_file_writes_other_files_directly(self):
+        metadata_path = self._snapshot_path('snapshot-1', 'foo',
+                                            'metadata.json')
+        self.store.write_file(metadata_path, b'{}')
+
+        with open(metadata_path, 'rb') as f:
+            self.assertEqual(b'{}', f.read())
+        self.assertEqual(0, self._count_blobs())
+
+    def test_link_file_points_to_previous_blob(self):
+        previous_path = self._snapshot_path('snapshot-1', 'foo', 'index.html')
+        html_path = self._snapshot_path('snapshot-2', 'foo', 'index.html')
+        self.store.write_file(previous_path, b'<html>Mock HTML</html>')
+
+        self.store.link_file(previous_path, html_path)
+
+        self.assertEqual(b'<html>Mock HTML</html>',
+                         self.store.read_file(html_path))
+
+    def test_write_file_over_linked_file_leaves_previous_snapshot_alone(self):
+        previous_path = self._snapshot_path('snapshot-1', 'foo', 'index.html')
+        html_path = self._snapshot_path('snapshot-2', 'foo', 'index.html')
+        self.store.write_file(previous_path, b'<html>Old</html>')
+        self.store.link_file(previous_path, html_path)
+
+        self.store.write_file(html_path, b'<html>New</html>')
+
+        self.assertEqual(b'<html>Old</html>',
+                         self.store.read_file(previous_path))
+        self.assertEqual(b'<html>New</html>', self.store.read_file(html_path))
@@ -0,0 +1,455 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+from twisted.internet import defer
+
+from ketohub import near_dup
+from ketohub import pipelines
+
+
+class PersistPipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_content_saver = mock.Mock()
+        self.pipeline = pipelines.PersistPipeline(self.mock_content_saver,
+                                                  max_threads=1,
+                                                  max_pending=1)
+        self.pending_writes = []
+
+        def fake_defer_to_thread_pool(_reactor, _pool, save_fn, item):
+            d = defer.Deferred()
+            d.addCallback(lambda _: save_fn(item))
+            self.pending_writes.append(d)
+            return d
+
+        defer_patch = mock.patch.object(pipelines.threads,
+                                        'deferToThreadPool',
+                                        side_effect=fake_defer_to_thread_pool)
+        self.addCleanup(defer_patch.stop)
+        defer_patch.start()
+        self.spider = mock.Mock()
+
+    def _results(self, d):
+        results = []
+        d.addCallback(results.append)
+        return results
+
+    def test_process_item_saves_metadata_and_html(self):
+        item = {
+            'key': 'foo',
+            'metadata': {
+                'url': 'https://mock.com/foo/'
+            },
+            'html': b'<html>Mock HTML</html>',
+        }
+
+        self.assertEqual([item],
+                         self._results(
+                             self.pipeline.process_item(item, self.spider)))
+        self.pending_writes[0].callback(None)
+
+        self.mock_content_saver.save_metadata.assert_called_once_with(
+            'foo', {'url': 'https://mock.com/foo/'})
+        self.mock_content_saver.save_recipe_html.assert_called_once_with(
+            'foo', b'<html>Mock HTML</html>')
+
+    def test_process_item_links_unchanged_html(self):
+        item = {
+            'key': 'foo',
+            'metadata': {},
+            'html': None,
+            'previous_html_path': 'previous/foo/index.html',
+        }
+
+        self.pipeline.process_item(item, self.spider)
+        self.pending_writes[0].callback(None)
+
+        self.mock_content_saver.link_recipe_html.assert_called_once_with(
+            'foo', 'previous/foo/index.html')
+        self.mock_content_saver.save_recipe_html.assert_not_called()
+
+    def test_process_item_filters_html_before_saving(self):
+        pipeline = pipelines.PersistPipeline(
+            self.mock_content_saver,
+            max_threads=1,
+            max_pending=1,
+            html_filter_fn=lambda html: html.replace(b'<script></script>', b''))
+
+        pipeline.process_item(
+            {
+                'key': 'foo',
+                'metadata': {},
+                'html': b'<html><script></script>Mock HTML</html>',
+            }, self.spider)
+        self.pending_writes[0].callback(None)
+
+        self.mock_content_saver.save_recipe_html.assert_called_once_with(
+            'foo', b'<html>Mock HTML</html>')
+
+    def test_process_item_records_write_time(self):
+        mock_stats = mock.Mock()
+        pipeline = pipelines.PersistPipeline(self.mock_content_saver,
+                                             max_threads=1,
+                                             max_pending=1,
+                                             stats=mock_stats)
+
+        pipeline.process_item({
+            'key': 'foo',
+            'metadata': {},
+            'html': b''
+        }, self.spider)
+        self.pending_writes[0].callback(None)
+
+        mock_stats.inc_value.assert_has_calls([
+            mock.call('timing/persist/seconds', mock.ANY),
+            mock.call('timing/persist/calls')
+        ])
+
+    def test_process_item_records_saved_html_in_manifest(self):
+        mock_manifest_writer = mock.Mock()
+        pipeline = pipelines.PersistPipeline(
+            self.mock_content_saver,
+            max_threads=1,
+            max_pending=1,
+            manifest_writer=mock_manifest_writer)
+
+        pipeline.process_item(
+            {
+                'key': 'foo',
+                'metadata': {},
+                'html': b'<html>Mock HTML</html>'
+            }, self.spider)
+        self.pending_writes[0].callback(None)
+
+        mock_manifest_writer.add.assert_called_once_with(
+            'foo', (hashlib.sha256(b'<html>Mock HTML</html>').hexdigest(), 22))
+
+    def test_process_item_records_previous_entry_of_unchanged_html(self):
+        mock_manifest_writer = mock.Mock()
+        mock_previous_snapshot = mock.Mock()
+        mock_previous_snapshot.content_entry.return_value = ('abc', 10)
+        pipeline = pipelines.PersistPipeline(
+            self.mock_content_saver,
+            max_threads=1,
+            max_pending=1,
+            manifest_writer=mock_manifest_writer,
+            previous_snapshot=mock_previous_snapshot)
+
+        pipeline.process_item(
+            {
+                'key': 'foo',
+                'metadata': {},
+                'html': None,
+                'previous_html_path': 'previous/foo/index.html',
+            }, self.spider)
+        self.pending_writes[0].callback(None)
+
+        mock_previous_snapshot.content_entry.assert_called_once_with('foo')
+        mock_manifest_writer.add.assert_called_once_with('foo', ('abc', 10))
+
+    def test_process_item_records_duplicate_in_manifest(self):
+        mock_manifest_writer = mock.Mock()
+        pipeline = pipelines.PersistPipeline(
+            self.mock_content_saver,
+            max_threads=1,
+            max_pending=1,
+            manifest_writer=mock_manifest_writer)
+
+        pipeline.process_item(
+            {
+                'key': 'foo-amp',
+                'metadata': {
+                    'duplicate_of': 'foo'
+                },
+                'html': None,
+            }, self.spider)
+        self.pending_writes[0].callback(None)
+
+        mock_manifest_writer.add.assert_called_once_with(
+            'foo-amp', ('duplicate_of:foo', 0))
+
+    def test_process_item_saves_only_metadata_for_duplicates(self):
+        item = {
+            'key': 'foo-amp',
+            'metadata': {
+                'duplicate_of': 'foo'
+            },
+            'html': None,
+        }
+
+        self.pipeline.process_item(item, self.spider)
+        self.pending_writes[0].callback(None)
+
+        self.mock_content_saver.save_metadata.assert_called_once_with(
+            'foo-amp', {'duplicate_of': 'foo'})
+        self.mock_content_saver.save_recipe_html.assert_not_called()
+        self.mock_content_saver.link_recipe_html.assert_not_called()
+
+    def test_process_item_waits_when_write_queue_is_full(self):
+        first = {'key': 'foo', 'metadata': {}, 'html': b''}
+        second = {'key': 'bar', 'metadata': {}, 'html': b''}
+
+        first_results = self._results(
+            self.pipeline.process_item(first, self.spider))
+        second_results = self._results(
+            self.pipeline.process_item(second, self.spider))
+
+        self.assertEqual([first], first_results)
+        self.assertEqual([], second_results)
+
+        self.pending_writes[0].callback(None)
+
+        self.assertEqual([second], second_results)
+
+
+class NearDuplicatePipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_stats = mock.Mock()
+        self.pipeline = pipelines.NearDuplicatePipeline(max_distance=3,
+                                                        stats=self.mock_stats)
+        defer_patch = mock.patch.object(pipelines.threads,
+                                        'deferToThreadPool',
+                                        side_effect=lambda _reactor, _pool, fn,
+                                        *args: defer.succeed(fn(*args)))
+        self.addCleanup(defer_patch.stop)
+        self.mock_defer_to_thread_pool = defer_patch.start()
+        self.spider = mock.Mock()
+        self.html = (b'<html><body><article><h1>Keto Chicken Kiev</h1><p>'
+                     b'Pound the chicken thin, spread it with garlic butter, '
+                     b'roll it up and bake until golden.</p></article>'
+                     b'</body></html>')
+
+    def _result(self, d):
+        results = []
+        d.addCallback(results.append)
+        return results[0]
+
+    def test_keeps_first_copy_of_page_with_its_fingerprint(self):
+        item = {'key': 'foo', 'metadata': {}, 'html': self.html}
+
+        self.assertEqual(
+            {
+                'key': 'foo',
+                'metadata': {
+                    'simhash': '%016x' % near_dup.simhash(self.html)
+                },
+                'html': self.html
+            }, self._result(self.pipeline.process_item(item, self.spider)))
+
+    def test_fingerprints_page_on_thread_pool(self):
+        self.pipeline.process_item(
+            {
+                'key': 'foo',
+                'metadata': {},
+                'html': self.html
+            }, self.spider)
+
+        self.mock_defer_to_thread_pool.assert_called_once_with(
+            mock.ANY, mock.ANY, pipelines._timed_simhash, self.html)
+        self.mock_stats.inc_value.assert_any_call('timing/near_duplicate/calls')
+
+    def test_replaces_later_copy_with_pointer_to_first(self):
+        self.pipeline.process_item(
+            {
+                'key': 'foo',
+                'metadata': {},
+                'html': self.html
+            }, self.spider)
+
+        item = self._result(
+            self.pipeline.process_item(
+                {
+                    'key': 'foo-amp',
+                    'metadata': {
+                        'url': 'https://mock.com/foo/amp/',
+                        'etag': '"abc123"',
+                    },
+                    'html': self.html.replace(b'<html>', b'<html amp>'),
+                }, self.spider))
+
+        self.assertEqual(
+            {
+                'key': 'foo-amp',
+                'metadata': {
+                    'url': 'https://mock.com/foo/amp/',
+                    'duplicate_of': 'foo',
+                    'simhash': mock.ANY,
+                },
+                'html': None,
+            }, item)
+        self.mock_stats.inc_value.assert_any_call('near_duplicate/duplicates',
+                                                  spider=self.spider)
+
+    def _unchanged_item(self, key, **metadata):
+        return {
+            'key': key,
+            'metadata': metadata,
+            'html': None,
+            'previous_html_path': 'previous/%s/index.html' % key,
+        }
+
+    def _assert_duplicate_of(self, original_key):
+        item = self._result(
+            self.pipeline.process_item(
+                {
+                    'key': 'foo-amp',
+                    'metadata': {},
+                    'html': self.html
+                }, self.spider))
+
+        self.assertEqual(original_key, item['metadata']['duplicate_of'])
+
+    def test_indexes_unchanged_page_by_saved_fingerprint(self):
+        item = self._unchanged_item('foo',
+                                    simhash='%016x' %
+                                    near_dup.simhash(self.html))
+
+        self.assertEqual(item, self.pipeline.process_item(item, self.spider))
+        self._assert_duplicate_of('foo')
+
+    def test_fingerprints_unchanged_page_without_saved_fingerprint(self):
+        previous_snapshot = mock.Mock()
+        previous_snapshot.read_html.return_value = self.html
+        self.pipeline = pipelines.NearDuplicatePipeline(
+            max_distance=3,
+            stats=self.mock_stats,
+            previous_snapshot=previous_snapshot)
+
+        item = self._result(
+            self.pipeline.process_item(self._unchanged_item('foo'),
+                                       self.spider))
+
+        previous_snapshot.read_html.assert_called_once_with('foo')
+        self.assertEqual('%016x' % near_dup.simhash(self.html),
+                         item['metadata']['simhash'])
+        self._assert_duplicate_of('foo')
+
+    def test_unchanged_duplicate_is_not_linked(self):
+        simhash = '%016x' % near_dup.simhash(self.html)
+        self.pipeline.process_item(self._unchanged_item('foo', simhash=simhash),
+                                   self.spider)
+
+        item = self.pipeline.process_item(
+            self._unchanged_item('foo-amp', simhash=simhash), self.spider)
+
+        self.assertEqual('foo', item['metadata']['duplicate_of'])
+        self.assertNotIn('previous_html_path', item)
+
+    def test_ignores_carried_over_duplicates(self):
+        item = {
+            'key': 'foo-amp',
+            'metadata': {
+                'duplicate_of': 'foo'
+            },
+            'html': None,
+            'previous_html_path': None,
+        }
+
+        self.assertEqual(item, self.pipeline.process_item(item, self.spider))
+
+
+class RecipeDatasetPipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.download_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.download_root)
+        self.pipeline = pipelines.RecipeDatasetPipeline(self.download_root)
+        self.spider = mock.Mock()
+        self.spider.name = 'mock-site'
+
+    def _rows(self):
+        with open(os.path.join(self.download_root,
+                               'recipes-mock-site.jsonl')) as f:
+            return [json.loads(line) for line in f]
+
+    def test_appends_one_row_per_recipe(self):
+        self.pipeline.open_spider(self.spider)
+        self.pipeline.process_item(
+            {
+                'key': 'mock-com_kiev',
+                'metadata': {
+                    'url': 'https://mock.com/kiev/'
+                },
+                'recipe': {
+                    'name': 'Chicken Kiev'
+                },
+            }, self.spider)
+        self.pipeline.process_item(
+            {
+                'key': 'mock-com_about',
+                'metadata': {},
+                'recipe': None
+            }, self.spider)
+        self.pipeline.close_spider(self.spider)
+
+        self.assertEqual([{
+            'key': 'mock-com_kiev',
+            'url': 'https://mock.com/kiev/',
+            'name': 'Chicken Kiev',
+        }], self._rows())
+
+    def test_skips_near_duplicates(self):
+        self.pipeline.open_spider(self.spider)
+        self.pipeline.process_item(
+            {
+                'key': 'mock-com_kiev-amp',
+                'metadata': {
+                    'duplicate_of': 'mock-com_kiev'
+                },
+                'recipe': {
+                    'name': 'Chicken Kiev'
+                },
+            }, self.spider)
+        self.pipeline.close_spider(self.spider)
+
+        self.assertEqual([], self._rows())
+
+
+class FromCrawlerTest(unittest.TestCase):
+
+    def test_from_crawler_requires_download_root(self):
+        crawler = mock.Mock()
+        crawler.settings = {'DOWNLOAD_ROOT': None}
+
+        with self.assertRaises(pipelines.MissingDownloadDirectory):
+            pipelines.PersistPipeline.from_crawler(crawler)
+
+    def test_from_crawler_requires_blob_root_for_content_addressed(self):
+        crawler = mock.Mock()
+        crawler.settings = {
+            'DOWNLOAD_ROOT': 'downloads',
+            'STORAGE_BACKEND': 'content-addressed',
+            'BLOB_ROOT': None,
+        }
+
+        with self.assertRaises(pipelines.MissingBlobDirectory):
+            pipelines.PersistPipeline.from_crawler(crawler)
+
+    def test_from_crawler_requires_bucket_for_object_store(self):
+        crawler = mock.Mock()
+        crawler.settings = {
+            'DOWNLOAD_ROOT': 'downloads',
+            'STORAGE_BACKEND': 'object-store',
+            'OBJECT_STORE_BUCKET': None,
+        }
+
+        with self.assertRaises(pipelines.MissingObjectStoreBucket):
+            pipelines.PersistPipeline.from_crawler(crawler)
+
+    @mock.patch.object(pipelines.object_store, 'available', return_value=False)
+    def test_from_crawler_requires_object_store_library(self, _):
+        crawler = mock.Mock()
+        crawler.settings = {
+            'DOWNLOAD_ROOT': 'downloads',
+            'STORAGE_BACKEND': 'object-store',
+            'OBJECT_STORE_BUCKET': 'ketohub',
+        }
+
+        with self.assertRaises(pipelines.MissingObjectStoreLibrary):
+            pipelines.PersistPipeline.from_crawler(crawler)
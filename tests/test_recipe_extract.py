@@ -0,0 +1,118 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from ketohub import recipe_extract
+
+
+class ExtractRecipeTest(unittest.TestCase):
+
+    def test_extracts_recipe_properties(self):
+        self.assertEqual(
+            {
+                'name': 'Keto Chicken Kiev',
+                'description': 'Crispy chicken with garlic butter.',
+                'image': 'https://mock.com/kiev.jpg',
+                'ingredients': ['2 chicken breasts', '50g butter'],
+                'recipe_yield': '2 servings',
+                'nutrition': {
+                    'calories': '520 kcal',
+                    'carbohydrateContent': '3 g',
+                },
+                'prep_time': 'PT15M',
+                'cook_time': 'PT30M',
+                'total_time': None,
+            },
+            recipe_extract.extract_recipe([
+                """{
+                    "@context": "https://schema.org",
+                    "@type": "Recipe",
+                    "name": "Keto Chicken Kiev",
+                    "description": "Crispy chicken with garlic butter.",
+                    "image": [{"@type": "ImageObject",
+                               "url": "https://mock.com/kiev.jpg"}],
+                    "recipeIngredient": ["2 chicken breasts", "50g butter"],
+                    "recipeYield": ["2 servings"],
+                    "nutrition": {"@type": "NutritionInformation",
+                                  "calories": "520 kcal",
+                                  "carbohydrateContent": "3 g"},
+                    "prepTime": "PT15M",
+                    "cookTime": "PT30M"
+                }"""
+            ]))
+
+    def test_finds_recipe_in_graph(self):
+        recipe = recipe_extract.extract_recipe([
+            '{"@type": "WebSite", "name": "Mock"}',
+            """{"@graph": [{"@type": "WebPage"},
+                           {"@type": ["Recipe", "NewsArticle"],
+                            "name": "Cauliflower Mash",
+                            "image": "https://mock.com/mash.jpg"}]}"""
+        ])
+
+        self.assertEqual('Cauliflower Mash', recipe['name'])
+        self.assertEqual('https://mock.com/mash.jpg', recipe['image'])
+        self.assertEqual([], recipe['ingredients'])
+
+    def test_tolerates_raw_newlines_in_strings(self):
+        recipe = recipe_extract.extract_recipe(
+            ['{"@type": "Recipe", "name": "Chicken\nKiev"}'])
+
+        self.assertEqual('Chicken\nKiev', recipe['name'])
+
+    def test_returns_none_without_recipe(self):
+        self.assertIsNone(
+            recipe_extract.extract_recipe(
+                ['not json', '{"@type": "Organization"}']))
+
+
+class JsonLdBlocksTest(unittest.TestCase):
+
+    def test_returns_text_of_json_ld_scripts(self):
+        self.assertEqual(['{"name": "Caf\xe9"}'],
+                         recipe_extract.json_ld_blocks(
+                             b'<html><script>var x;</script>'
+                             b'<script type="application/ld+json">'
+                             b'{"name": "Caf\xc3\xa9"}</script></html>'))
+
+
+class ReadDatasetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.snapshot_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.snapshot_root)
+
+    def _write_dataset(self, spider_name, lines):
+        with open(recipe_extract.dataset_path(self.snapshot_root, spider_name),
+                  'w') as f:
+            f.write(''.join(line + '\n' for line in lines))
+
+    def test_reads_rows_of_every_spider(self):
+        self._write_dataset('a', [json.dumps({'key': 'foo', 'name': 'Foo'})])
+        self._write_dataset('b', [
+            'not json',
+            json.dumps({'name': 'No key'}),
+            json.dumps({
+                'key': 'bar',
+                'name': 'Bar'
+            })
+        ])
+
+        self.assertEqual(
+            {
+                'foo': {
+                    'key': 'foo',
+                    'name': 'Foo'
+                },
+                'bar': {
+                    'key': 'bar',
+                    'name': 'Bar'
+                },
+            }, recipe_extract.read_dataset(self.snapshot_root))
+
+    def test_is_empty_without_dataset(self):
+        self.assertEqual({},
+                         recipe_extract.read_dataset(
+                             os.path.join(self.snapshot_root, 'missing')))
@@ -19,3 +19,34 @@ class RawContentSpiderTest(unittest.TestCase):
         self.assertEqual(
             recipe_key.from_url('http://www.mock.com/Mikes_Chicken_Kiev/'),
             'mock-com_mikes-chicken-kiev')
+
+    def test_from_url_ignores_fragment_and_tracking_params(self):
+        self.assertEqual(
+            recipe_key.from_url('https://www.mock.com/Mikes_Chicken_Kiev/'
+                                '?utm_source=feed&fbclid=abc#comments'),
+            'mock-com_mikes-chicken-kiev')
+
+    def test_from_url_keeps_other_query_params(self):
+        self.assertEqual(
+            recipe_key.from_url(
+                'https://www.mock.com/recipes/?page=2&utm_medium=email'),
+            'mock-com_recipes_-page-2')
+
+
+class CanonicalUrlTest(unittest.TestCase):
+
+    def test_canonical_url_lowercases_scheme_and_host_only(self):
+        self.assertEqual(
+            recipe_key.canonical_url('HTTPS://WWW.Mock.com/Chicken_Kiev/'),
+            'https://www.mock.com/Chicken_Kiev/')
+
+    def test_canonical_url_strips_fragment_and_tracking_params(self):
+        self.assertEqual(
+            recipe_key.canonical_url('https://mock.com/recipes/?gclid=1&'
+                                     'page=2&UTM_Campaign=keto#top'),
+            'https://mock.com/recipes/?page=2')
+
+    def test_canonical_url_drops_empty_query(self):
+        self.assertEqual(
+            recipe_key.canonical_url('https://mock.com/kiev/?utm_source=x'),
+            'https://mock.com/kiev/')
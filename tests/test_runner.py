@@ -0,0 +1,195 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from ketohub import runner
+
+
+class RunnerTest(unittest.TestCase):
+
+    def setUp(self):
+        crawler_process_patch = mock.patch.object(runner.crawler,
+                                                  'CrawlerProcess')
+        self.addCleanup(crawler_process_patch.stop)
+        self.mock_crawler_process = crawler_process_patch.start()
+        self.mock_process = self.mock_crawler_process.return_value
+
+    def test_crawl_schedules_every_spider_in_one_process(self):
+        self.mock_process.spider_loader.list.return_value = [
+            'ruled-me', 'diet-doctor'
+        ]
+
+        runner.crawl({'DOWNLOAD_ROOT': 'downloads'})
+
+        self.mock_crawler_process.assert_called_once_with(
+            {'DOWNLOAD_ROOT': 'downloads'})
+        self.mock_process.crawl.assert_has_calls(
+            [mock.call('diet-doctor'),
+             mock.call('ruled-me')])
+        self.mock_process.start.assert_called_once_with()
+
+    def test_crawl_schedules_only_requested_spiders(self):
+        runner.crawl({'DOWNLOAD_ROOT': 'downloads'}, ['ketovale'])
+
+        self.mock_process.spider_loader.list.assert_not_called()
+        self.mock_process.crawl.assert_called_once_with('ketovale')
+        self.mock_process.start.assert_called_once_with()
+
+    def test_crawl_gives_each_spider_its_own_job_dir(self):
+        settings = mock.Mock()
+        spider_settings = settings.copy.return_value
+        self.mock_process.spider_loader.load.return_value = 'mock-spider-cls'
+
+        with mock.patch.object(runner.crawler, 'Crawler') as mock_crawler:
+            runner.crawl(settings, ['ketovale'], job_root='jobs')
+
+        spider_settings.set.assert_called_once_with('JOBDIR',
+                                                    'jobs/ketovale',
+                                                    priority='cmdline')
+        mock_crawler.assert_called_once_with('mock-spider-cls', spider_settings)
+        self.mock_process.crawl.assert_called_once_with(
+            mock_crawler.return_value)
+
+    def test_crawl_passes_spider_args(self):
+        runner.crawl({'DOWNLOAD_ROOT': 'downloads'}, ['ketovale'],
+                     spider_args={'ketovale': {
+                         'recrawl_urls': 'urls.txt'
+                     }})
+
+        self.mock_process.crawl.assert_called_once_with('ketovale',
+                                                        recrawl_urls='urls.txt')
+
+
+class MainTest(unittest.TestCase):
+
+    def setUp(self):
+        crawl_patch = mock.patch.object(runner, 'crawl')
+        self.addCleanup(crawl_patch.stop)
+        self.mock_crawl = crawl_patch.start()
+
+    def _settings(self, argv):
+        with mock.patch('sys.argv', ['ketohub-runner'] + argv):
+            runner.main()
+        return self.mock_crawl.call_args[0][0]
+
+    def test_cache_enables_http_cache(self):
+        settings = self._settings(
+            ['--download-root', 'downloads', '--cache', '/tmp/cache'])
+
+        self.assertTrue(settings.getbool('HTTPCACHE_ENABLED'))
+        self.assertEqual('/tmp/cache', settings.get('HTTPCACHE_DIR'))
+        self.assertFalse(settings.getbool('HTTPCACHE_IGNORE_MISSING'))
+
+    def test_job_dir_records_download_root(self):
+        job_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, job_dir)
+        self._settings(
+            ['--download-root', '/tmp/downloads', '--job-dir', job_dir])
+
+        settings = self._settings(['--job-dir', job_dir])
+
+        self.assertEqual('/tmp/downloads', settings.get('DOWNLOAD_ROOT'))
+        self.assertEqual(job_dir, self.mock_crawl.call_args[0][2])
+
+    def test_job_dir_records_default_download_root(self):
+        job_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, job_dir)
+        first_root = self._settings(['--job-dir', job_dir]).get('DOWNLOAD_ROOT')
+
+        with mock.patch.object(runner, '_timestamp', return_value='later'):
+            settings = self._settings(['--job-dir', job_dir])
+
+        self.assertEqual(os.path.abspath(first_root),
+                         settings.get('DOWNLOAD_ROOT'))
+
+    def test_job_dir_rejects_other_download_root(self):
+        job_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, job_dir)
+        self._settings(
+            ['--download-root', '/tmp/downloads', '--job-dir', job_dir])
+
+        with mock.patch('sys.stderr'):
+            with self.assertRaises(SystemExit):
+                self._settings(
+                    ['--download-root', '/tmp/other', '--job-dir', job_dir])
+
+    def test_replay_ignores_pages_missing_from_cache(self):
+        settings = self._settings([
+            '--download-root', 'downloads', '--cache', '/tmp/cache', '--replay'
+        ])
+
+        self.assertTrue(settings.getbool('HTTPCACHE_IGNORE_MISSING'))
+
+    def test_replay_never_expires_cached_pages(self):
+        settings = self._settings([
+            '--download-root', 'downloads', '--cache', '/tmp/cache', '--replay'
+        ])
+
+        self.assertEqual(0, settings.getint('HTTPCACHE_EXPIRATION_SECS'))
+
+    def test_cache_without_replay_keeps_expiration(self):
+        settings = self._settings(
+            ['--download-root', 'downloads', '--cache', '/tmp/cache'])
+
+        self.assertEqual(7 * 24 * 60 * 60,
+                         settings.getint('HTTPCACHE_EXPIRATION_SECS'))
+
+    def test_max_rss_mb_sets_memory_limit(self):
+        settings = self._settings(
+            ['--download-root', 'downloads', '--max-rss-mb', '512'])
+
+        self.assertEqual(512, settings.getint('MEMORY_BACKPRESSURE_LIMIT_MB'))
+
+    def test_recrawl_dir_crawls_spiders_with_recrawl_lists(self):
+        recrawl_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, recrawl_dir)
+        for spider_name in ('ketovale', 'ruled-me'):
+            with open(os.path.join(recrawl_dir, 'recrawl-%s.txt' % spider_name),
+                      'w') as f:
+                f.write('https://mock.com/kiev/\n')
+
+        self._settings(
+            ['--download-root', 'downloads', '--recrawl-dir', recrawl_dir])
+
+        _, spider_names, _, spider_args = self.mock_crawl.call_args[0]
+        self.assertEqual(['ketovale', 'ruled-me'], spider_names)
+        self.assertEqual(
+            {'recrawl_urls': os.path.join(recrawl_dir, 'recrawl-ketovale.txt')},
+            spider_args['ketovale'])
+
+    def test_shared_queue_sets_scheduler(self):
+        settings = self._settings(
+            ['--download-root', 'downloads', '--shared-queue', '/tmp/q.sqlite'])
+
+        self.assertEqual('ketohub.shared_queue.SharedQueueScheduler',
+                         settings.get('SCHEDULER'))
+        self.assertEqual('/tmp/q.sqlite', settings.get('SHARED_QUEUE_PATH'))
+
+    def test_shared_queue_rejects_archive_storage(self):
+        settings = runner.project.get_project_settings()
+        settings.set('STORAGE_BACKEND', 'archive')
+        with mock.patch.object(runner.project,
+                               'get_project_settings',
+                               return_value=settings):
+            for argv in (['--shared-queue',
+                          '/tmp/q.sqlite'], ['--workers', '2']):
+                with mock.patch('sys.stderr'):
+                    with self.assertRaises(SystemExit):
+                        self._settings(['--download-root', 'downloads'] + argv)
+
+    @mock.patch.object(runner, 'crawl_workers', return_value=True)
+    def test_workers_share_queue_in_download_root(self, mock_crawl_workers):
+        with mock.patch('sys.argv', [
+                'ketohub-runner', '--download-root', '/tmp/downloads',
+                '--workers', '3'
+        ]):
+            runner.main()
+
+        self.mock_crawl.assert_not_called()
+        settings, worker_count, _, _ = mock_crawl_workers.call_args[0]
+        self.assertEqual(3, worker_count)
+        self.assertEqual('/tmp/downloads/shared-queue.sqlite',
+                         settings.get('SHARED_QUEUE_PATH'))
@@ -0,0 +1,52 @@
+import os
+import unittest
+
+from scrapy import http
+from scrapy import spiders
+from scrapy.utils import test
+
+from ketohub import scheduler
+
+
+class _Spider(spiders.Spider):
+    name = 'mock'
+
+    def parse(self, response):
+        pass
+
+
+class SpillingSchedulerTest(unittest.TestCase):
+
+    def _scheduler(self, settings):
+        crawler = test.get_crawler(_Spider, settings)
+        return scheduler.SpillingScheduler.from_crawler(crawler), crawler
+
+    def test_queues_requests_on_disk_without_job_dir(self):
+        queue, crawler = self._scheduler({'SCHEDULER_SPILL_TO_DISK': True})
+        spider = _Spider()
+        crawler.spider = spider
+        queue.open(spider)
+        spill_dir = queue._spill_dir
+
+        queue.enqueue_request(
+            http.Request('https://mock.com/kiev/', callback=spider.parse))
+
+        self.assertEqual(
+            1, crawler.stats.get_value('scheduler/enqueued/disk',
+                                       spider=spider))
+        self.assertEqual('https://mock.com/kiev/', queue.next_request().url)
+        queue.close('finished')
+        self.assertFalse(os.path.exists(spill_dir))
+
+    def test_keeps_requests_in_memory_when_spilling_is_off(self):
+        queue, crawler = self._scheduler({'SCHEDULER_SPILL_TO_DISK': False})
+        spider = _Spider()
+        queue.open(spider)
+
+        queue.enqueue_request(http.Request('https://mock.com/kiev/'))
+
+        self.assertIsNone(queue._spill_dir)
+        self.assertEqual(
+            1,
+            crawler.stats.get_value('scheduler/enqueued/memory', spider=spider))
+        queue.close('finished')
@@ -0,0 +1,346 @@
+import collections
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from scrapy import http
+from scrapy import spiders
+from scrapy.utils import test
+
+from ketohub import shared_queue
+
+
+class _Spider(spiders.Spider):
+    name = 'mock'
+
+    def parse(self, response):
+        pass
+
+    def parse_recipe(self, response):
+        pass
+
+
+class SqliteRequestQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.path = os.path.join(self.root, 'queue.sqlite')
+        self.queue = self._open()
+
+    def _open(self):
+        queue = shared_queue.SqliteRequestQueue(self.path)
+        self.addCleanup(queue.close)
+        return queue
+
+    def test_push_ignores_seen_keys(self):
+        other_queue = self._open()
+
+        self.assertTrue(self.queue.push('mock', 'kiev', b'kiev'))
+        self.assertFalse(other_queue.push('mock', 'kiev', b'kiev-again'))
+        self.assertTrue(other_queue.push('other', 'kiev', b'kiev'))
+        self.assertEqual(1, self.queue.unfinished_count('mock'))
+
+    def test_lease_takes_highest_priority_first(self):
+        self.queue.push('mock', 'listing', b'listing', priority=0)
+        self.queue.push('mock', 'sitemap', b'sitemap', priority=10)
+        self.queue.push('mock', 'kiev', b'kiev', priority=0)
+
+        rows = self.queue.lease('mock', 'worker-1', 2, lease_seconds=60)
+
+        self.assertEqual([b'sitemap', b'listing'], [data for _, data in rows])
+
+    def test_leased_requests_go_to_one_worker(self):
+        other_queue = self._open()
+        self.queue.push('mock', 'kiev', b'kiev')
+        self.queue.push('mock', 'pie', b'pie')
+
+        first = self.queue.lease('mock', 'worker-1', 1, lease_seconds=60)
+        second = other_queue.lease('mock', 'worker-2', 5, lease_seconds=60)
+
+        self.assertEqual([b'kiev'], [data for _, data in first])
+        self.assertEqual([b'pie'], [data for _, data in second])
+        self.assertEqual([], other_queue.lease('mock', 'worker-2', 5, 60))
+
+    def test_expired_leases_are_taken_again(self):
+        self.queue.push('mock', 'kiev', b'kiev')
+        self.queue.lease('mock', 'worker-1', 1, lease_seconds=60, now=1000)
+
+        self.assertEqual([],
+                         self.queue.lease('mock', 'worker-2', 1, 60, now=1030))
+        self.assertEqual([b'kiev'], [
+            data
+            for _, data in self.queue.lease('mock', 'worker-2', 1, 60, now=1061)
+        ])
+
+    def test_ack_finishes_and_release_requeues(self):
+        self.queue.push('mock', 'kiev', b'kiev')
+        self.queue.push('mock', 'pie', b'pie')
+        (kiev_id, _), (pie_id, _) = self.queue.lease('mock', 'worker-1', 2, 60)
+
+        self.queue.ack([kiev_id])
+        self.queue.release([pie_id])
+
+        self.assertEqual(1, self.queue.unfinished_count('mock'))
+        self.assertEqual([(pie_id, b'pie')],
+                         self.queue.lease('mock', 'worker-2', 2, 60))
+        self.assertFalse(self.queue.push('mock', 'kiev', b'kiev'))
+
+    def test_discovery_goes_to_one_worker_until_its_lease_expires(self):
+        other_queue = self._open()
+
+        self.assertTrue(
+            self.queue.claim_discovery('mock', 'worker-1', 60, now=1000))
+        self.assertFalse(
+            other_queue.claim_discovery('mock', 'worker-2', 60, now=1030))
+        self.assertEqual(shared_queue.DISCOVERY_RUNNING,
+                         other_queue.discovery_state('mock', now=1030))
+        self.assertEqual(shared_queue.DISCOVERY_EXPIRED,
+                         other_queue.discovery_state('mock', now=1061))
+        self.assertTrue(
+            other_queue.claim_discovery('mock', 'worker-2', 60, now=1061))
+        self.assertTrue(
+            other_queue.claim_discovery('other', 'worker-2', 60, now=1061))
+
+    def test_finished_discovery_is_not_claimed_again(self):
+        self.queue.claim_discovery('mock', 'worker-1', 60, now=1000)
+        self.queue.finish_discovery('mock', 'worker-1')
+
+        self.assertEqual(shared_queue.DISCOVERY_DONE,
+                         self.queue.discovery_state('mock', now=2000))
+        self.assertFalse(
+            self.queue.claim_discovery('mock', 'worker-2', 60, now=2000))
+
+    def test_released_discovery_can_be_claimed_at_once(self):
+        self.queue.claim_discovery('mock', 'worker-1', 60, now=1000)
+        self.queue.release_discovery('mock', 'worker-1')
+
+        self.assertTrue(
+            self.queue.claim_discovery('mock', 'worker-2', 60, now=1001))
+
+
+class SharedQueueSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.settings = {
+            'SHARED_QUEUE_PATH': os.path.join(self.root, 'queue.sqlite'),
+            'SHARED_QUEUE_BATCH_SIZE': 2,
+            'SHARED_QUEUE_LEASE_SECONDS': 60,
+        }
+
+    def _scheduler(self, worker):
+        crawler = test.get_crawler(
+            _Spider, dict(self.settings, SHARED_QUEUE_WORKER=worker))
+        crawler.spider = _Spider()
+        crawler.engine = mock.Mock()
+        crawler.engine.downloader.active = set()
+        crawler.engine.scraper.slot.active = set()
+        crawler.engine.scraper.slot.queue = collections.deque()
+        crawler.engine.slot.start_requests = None
+        scheduler = shared_queue.SharedQueueScheduler.from_crawler(crawler)
+        scheduler.open(crawler.spider)
+        return scheduler, crawler
+
+    def _request(self, crawler, path, **kwargs):
+        return http.Request('https://mock.com/%s/' % path,
+                            callback=crawler.spider.parse_recipe,
+                            **kwargs)
+
+    def test_workers_split_requests_without_duplicates(self):
+        first, first_crawler = self._scheduler('worker-1')
+        second, second_crawler = self._scheduler('worker-2')
+        self.addCleanup(first.close, 'finished')
+        self.addCleanup(second.close, 'finished')
+
+        self.assertTrue(
+            first.enqueue_request(self._request(first_crawler, 'kiev')))
+        self.assertFalse(
+            second.enqueue_request(self._request(second_crawler, 'kiev')))
+        for path in ('pie', 'tart'):
+            second.enqueue_request(self._request(second_crawler, path))
+
+        urls = [first.next_request().url, first.next_request().url]
+        request = second.next_request()
+
+        self.assertEqual(['https://mock.com/kiev/', 'https://mock.com/pie/'],
+                         urls)
+        self.assertEqual('https://mock.com/tart/', request.url)
+        self.assertEqual(second_crawler.spider.parse_recipe, request.callback)
+        self.assertIsNone(second.next_request())
+
+    def test_one_worker_discovers_requests(self):
+        first, first_crawler = self._scheduler('worker-1')
+        second, second_crawler = self._scheduler('worker-2')
+        self.addCleanup(first.close, 'finished')
+        self.addCleanup(second.close, 'finished')
+
+        self.assertTrue(
+            first.enqueue_request(
+                self._request(first_crawler,
+                              'sitemap',
+                              meta={'discovery': True})))
+        self.assertFalse(
+            second.enqueue_request(
+                self._request(second_crawler,
+                              'sitemap',
+                              meta={'discovery': True})))
+        self.assertFalse(
+            first.enqueue_request(
+                self._request(first_crawler,
+                              'sitemap',
+                              meta={'discovery': True})))
+
+        request = first.next_request()
+        self.assertEqual('https://mock.com/sitemap/', request.url)
+        self.assertEqual(first_crawler.spider.parse_recipe, request.callback)
+        self.assertIsNone(second.next_request())
+        first_crawler.engine.downloader.active.add(request)
+        self.assertTrue(second.has_pending_requests())
+
+        first.enqueue_request(self._request(first_crawler, 'kiev'))
+        first_crawler.engine.downloader.active.clear()
+        self.assertTrue(first.has_pending_requests())
+        request = second.next_request()
+        self.assertEqual('https://mock.com/kiev/', request.url)
+        second_crawler.engine.downloader.active.add(request)
+        self.assertTrue(first.has_pending_requests())
+        self.assertTrue(second.has_pending_requests())
+        second_crawler.engine.downloader.active.clear()
+        self.assertFalse(second.has_pending_requests())
+        self.assertFalse(first.has_pending_requests())
+
+    def test_discovery_waits_for_start_requests(self):
+        first, first_crawler = self._scheduler('worker-1')
+        self.addCleanup(first.close, 'finished')
+        first_crawler.engine.slot.start_requests = iter([])
+
+        first.enqueue_request(
+            self._request(first_crawler, 'sitemap', meta={'discovery': True}))
+        first.next_request()
+
+        self.assertTrue(first.has_pending_requests())
+        first_crawler.engine.slot.start_requests = None
+        self.assertFalse(first.has_pending_requests())
+
+    def test_takes_over_discovery_from_closed_worker(self):
+        first, first_crawler = self._scheduler('worker-1')
+        second, second_crawler = self._scheduler('worker-2')
+        self.addCleanup(second.close, 'finished')
+        second_crawler.spider.start_requests = mock.Mock(return_value=[
+            self._request(second_crawler, 'sitemap', meta={'discovery': True})
+        ])
+
+        first.enqueue_request(
+            self._request(first_crawler, 'sitemap', meta={'discovery': True}))
+        second.enqueue_request(
+            self._request(second_crawler, 'sitemap', meta={'discovery': True}))
+        first.close('shutdown')
+
+        self.assertTrue(second.has_pending_requests())
+        request = second.next_request()
+        self.assertEqual('https://mock.com/sitemap/', request.url)
+        self.assertEqual(second_crawler.spider.parse_recipe, request.callback)
+
+    def test_retries_are_queued_again(self):
+        scheduler, crawler = self._scheduler('worker-1')
+        self.addCleanup(scheduler.close, 'finished')
+        request = self._request(crawler, 'kiev')
+        scheduler.enqueue_request(request)
+
+        retry = request.replace(dont_filter=True)
+        retry.meta['retry_times'] = 1
+
+        self.assertTrue(scheduler.enqueue_request(retry))
+
+    def test_redirects_to_same_recipe_are_queued(self):
+        scheduler, crawler = self._scheduler('worker-1')
+        self.addCleanup(scheduler.close, 'finished')
+        request = self._request(crawler, 'kiev', dont_filter=True)
+        scheduler.enqueue_request(request)
+
+        redirect = request.replace(url='https://www.mock.com/kiev/')
+        redirect.meta['redirect_times'] = 1
+
+        self.assertTrue(scheduler.enqueue_request(redirect))
+
+    def test_waits_for_requests_until_downloaded(self):
+        first, first_crawler = self._scheduler('worker-1')
+        second, _ = self._scheduler('worker-2')
+        self.addCleanup(first.close, 'finished')
+        self.addCleanup(second.close, 'finished')
+        first.enqueue_request(self._request(first_crawler, 'kiev'))
+
+        request = first.next_request()
+        first_crawler.engine.downloader.active.add(request)
+
+        self.assertTrue(second.has_pending_requests())
+        self.assertTrue(first.has_pending_requests())
+
+        first_crawler.engine.downloader.active.clear()
+
+        self.assertFalse(first.has_pending_requests())
+        self.assertFalse(second.has_pending_requests())
+
+    def test_waits_for_requests_until_their_responses_are_handled(self):
+        first, first_crawler = self._scheduler('worker-1')
+        self.addCleanup(first.close, 'finished')
+        first.enqueue_request(self._request(first_crawler, 'kiev'))
+        request = first.next_request()
+        slot = first_crawler.engine.scraper.slot
+
+        slot.queue.append((mock.Mock(), request, mock.Mock()))
+        self.assertTrue(first.has_pending_requests())
+
+        slot.queue.clear()
+        slot.active.add(request)
+        self.assertTrue(first.has_pending_requests())
+
+        slot.active.clear()
+        self.assertFalse(first.has_pending_requests())
+
+    def test_requests_of_stopped_worker_are_taken_again(self):
+        first, first_crawler = self._scheduler('worker-1')
+        first.enqueue_request(self._request(first_crawler, 'kiev'))
+        request = first.next_request()
+        first_crawler.engine.scraper.slot.active.add(request)
+
+        first.close('shutdown')
+        second, _ = self._scheduler('worker-2')
+        self.addCleanup(second.close, 'finished')
+
+        self.assertEqual('https://mock.com/kiev/', second.next_request().url)
+
+    def test_close_releases_unfinished_requests(self):
+        first, first_crawler = self._scheduler('worker-1')
+        for path in ('kiev', 'pie'):
+            first.enqueue_request(self._request(first_crawler, path))
+        request = first.next_request()
+        first_crawler.engine.downloader.active.add(request)
+
+        first.close('shutdown')
+        second, _ = self._scheduler('worker-2')
+        self.addCleanup(second.close, 'finished')
+
+        self.assertEqual(
+            ['https://mock.com/kiev/', 'https://mock.com/pie/'],
+            sorted([second.next_request().url,
+                    second.next_request().url]))
+
+
+class OutputSuffixTest(unittest.TestCase):
+
+    def test_no_suffix_without_shared_queue(self):
+        self.assertEqual('', shared_queue.output_suffix({}))
+
+    def test_suffix_names_worker(self):
+        self.assertEqual(
+            '.worker-1',
+            shared_queue.output_suffix({
+                'SHARED_QUEUE_PATH': 'queue.sqlite',
+                'SHARED_QUEUE_WORKER': 'worker-1',
+            }))
@@ -0,0 +1,52 @@
+import unittest
+
+from ketohub import manifest
+from ketohub import snapshot_diff
+
+
+class DiffManifestsTest(unittest.TestCase):
+
+    def test_reports_added_removed_and_changed_recipes(self):
+        self.assertEqual(
+            {
+                'added': ['mock-com_mash'],
+                'removed': ['mock-com_stew'],
+                'changed': ['mock-com_kiev'],
+            },
+            snapshot_diff.diff_manifests(
+                {
+                    'mock-com_kiev': ('abc', 10),
+                    'mock-com_stew': ('def', 20),
+                    'mock-com_salad': ('123', 5),
+                }, {
+                    'mock-com_kiev': ('abd', 10),
+                    'mock-com_mash': ('456', 30),
+                    'mock-com_salad': ('123', 5),
+                }))
+
+    def test_reports_swapped_duplicates_as_changed(self):
+        self.assertEqual(
+            {
+                'added': [],
+                'removed': [],
+                'changed': ['mock-com_kiev', 'mock-com_kiev-amp'],
+            },
+            snapshot_diff.diff_manifests(
+                {
+                    'mock-com_kiev': ('abc', 10),
+                    'mock-com_kiev-amp':
+                        manifest.duplicate_entry('mock-com_kiev'),
+                }, {
+                    'mock-com_kiev':
+                        manifest.duplicate_entry('mock-com_kiev-amp'),
+                    'mock-com_kiev-amp': ('abd', 12),
+                }))
+
+    def test_reports_nothing_for_identical_manifests(self):
+        entries = {'mock-com_kiev': ('abc', 10)}
+
+        self.assertEqual({
+            'added': [],
+            'removed': [],
+            'changed': []
+        }, snapshot_diff.diff_manifests(entries, dict(entries)))
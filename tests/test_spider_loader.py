@@ -0,0 +1,28 @@
+import unittest
+
+from scrapy import http
+
+from ketohub import sites
+from ketohub import spider_loader
+
+
+class SiteSpiderLoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loader = spider_loader.SiteSpiderLoader.from_settings({})
+
+    def test_list_returns_all_site_names(self):
+        self.assertEqual(sites.names(), self.loader.list())
+        self.assertIn('ruled-me', self.loader.list())
+
+    def test_load_builds_spider_for_site(self):
+        self.assertEqual('ruled-me', self.loader.load('ruled-me').name)
+
+    def test_load_raises_for_unknown_spider(self):
+        with self.assertRaises(KeyError):
+            self.loader.load('not-a-site')
+
+    def test_find_by_request_matches_allowed_domains(self):
+        self.assertEqual(['ruled-me'],
+                         self.loader.find_by_request(
+                             http.Request('https://www.ruled.me/keto-pie/')))
@@ -0,0 +1,305 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from scrapy import http
+from scrapy.spidermiddlewares import httperror
+from scrapy.utils import test
+from twisted.internet import error
+from twisted.python import failure
+
+from ketohub import sites
+from ketohub import spiders
+
+_SITEMAP = b"""<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <url>
+    <loc>https://mock.com/recipe/new-kiev/</loc>
+    <lastmod>2019-02-01T10:00:00+00:00</lastmod>
+  </url>
+  <url>
+    <loc>https://mock.com/recipe/old-kiev/</loc>
+    <lastmod>2018-02-01T10:00:00+00:00</lastmod>
+  </url>
+  <url>
+    <loc>https://mock.com/about/</loc>
+  </url>
+</urlset>"""
+
+_SITEMAP_INDEX = b"""<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap>
+    <loc>https://mock.com/post-sitemap.xml</loc>
+    <lastmod>2018-06-01T10:00:00+00:00</lastmod>
+  </sitemap>
+</sitemapindex>"""
+
+
+def _make_spider(site, settings=None, **kwargs):
+    crawler = test.get_crawler(spiders.spider_class(site), settings)
+    return crawler.spidercls.from_crawler(crawler, **kwargs)
+
+
+class SpiderClassTest(unittest.TestCase):
+
+    def test_builds_spider_from_site(self):
+        cls = spiders.spider_class(sites.get('ruled-me'))
+
+        self.assertTrue(issubclass(cls, spiders.RecipeSpider))
+        self.assertEqual('RuledMeSpider', cls.__name__)
+        self.assertEqual('ruled-me', cls.name)
+        self.assertEqual(['ruled.me'], cls.allowed_domains)
+        self.assertEqual(3, len(cls.rules))
+        self.assertEqual('parse_recipe', cls.rules[-1].callback)
+
+    def test_reuses_spider_class(self):
+        self.assertIs(spiders.spider_class(sites.get('ketovale')),
+                      spiders.spider_class(sites.get('ketovale')))
+
+
+class RecipeSpiderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.site = sites.Site(name='mock-site',
+                               allowed_domains=['mock.com'],
+                               start_urls=['https://mock.com/recipes/'],
+                               sitemap_urls=['https://mock.com/sitemap.xml'],
+                               sitemap_recipe_patterns=[r'mock\.com/recipe/'])
+
+    def _parse_sitemap(self, spider, body):
+        request = list(spider.start_requests())[0]
+        response = http.XmlResponse(request.url, body=body, request=request)
+        return list(request.callback(response))
+
+    def test_starts_from_sitemaps(self):
+        spider = _make_spider(self.site)
+
+        self.assertEqual(['https://mock.com/sitemap.xml'],
+                         [r.url for r in spider.start_requests()])
+
+    def test_marks_sitemaps_for_discovery(self):
+        spider = _make_spider(self.site)
+
+        self.assertTrue(list(spider.start_requests())[0].meta['discovery'])
+
+    def test_requests_recipes_listed_in_sitemap(self):
+        spider = _make_spider(self.site)
+
+        self.assertEqual([
+            'https://mock.com/recipe/new-kiev/',
+            'https://mock.com/recipe/old-kiev/'
+        ], [r.url for r in self._parse_sitemap(spider, _SITEMAP)])
+
+    def test_skips_recipes_not_modified_since_last_crawl(self):
+        spider = _make_spider(self.site,
+                              {'SITEMAP_LASTMOD_SINCE': '2019-01-01'})
+
+        self.assertEqual(['https://mock.com/recipe/new-kiev/'],
+                         [r.url for r in self._parse_sitemap(spider, _SITEMAP)])
+
+    def test_carries_over_unmodified_recipes_with_their_dataset_row(self):
+        previous_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, previous_root)
+        os.makedirs(os.path.join(previous_root, 'mock-com_recipe_old-kiev'))
+        with open(
+                os.path.join(previous_root, 'mock-com_recipe_old-kiev',
+                             'metadata.json'), 'w') as f:
+            json.dump({'url': 'https://mock.com/recipe/old-kiev/'}, f)
+        with open(os.path.join(previous_root, 'recipes-mock-site.jsonl'),
+                  'w') as f:
+            f.write(
+                json.dumps({
+                    'key': 'mock-com_recipe_old-kiev',
+                    'name': 'Chicken Kiev'
+                }) + '\n')
+        spider = _make_spider(
+            self.site, {
+                'SITEMAP_LASTMOD_SINCE': '2019-01-01',
+                'PREVIOUS_DOWNLOAD_ROOT': previous_root
+            })
+
+        item = self._parse_sitemap(spider, _SITEMAP)[1]
+
+        self.assertEqual('mock-com_recipe_old-kiev', item['key'])
+        self.assertEqual(
+            os.path.join(previous_root, 'mock-com_recipe_old-kiev',
+                         'index.html'), item['previous_html_path'])
+        self.assertEqual('Chicken Kiev', item['recipe']['name'])
+
+    def test_skips_unmodified_sitemaps_without_falling_back(self):
+        spider = _make_spider(self.site,
+                              {'SITEMAP_LASTMOD_SINCE': '2019-01-01'})
+
+        self.assertEqual([], self._parse_sitemap(spider, _SITEMAP_INDEX))
+
+    def test_reads_unmodified_sitemaps_to_carry_over_recipes(self):
+        previous_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, previous_root)
+        spider = _make_spider(
+            self.site, {
+                'SITEMAP_LASTMOD_SINCE': '2019-01-01',
+                'PREVIOUS_DOWNLOAD_ROOT': previous_root
+            })
+
+        self.assertEqual(
+            ['https://mock.com/post-sitemap.xml'],
+            [r.url for r in self._parse_sitemap(spider, _SITEMAP_INDEX)])
+
+    def test_falls_back_to_start_urls_when_sitemap_has_no_recipes(self):
+        spider = _make_spider(self.site)
+
+        self.assertEqual(['https://mock.com/recipes/'], [
+            r.url for r in self._parse_sitemap(
+                spider, b"""<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <url><loc>https://mock.com/about/</loc></url>
+</urlset>""")
+        ])
+
+    def test_recrawls_only_listed_recipes(self):
+        recrawl_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, recrawl_dir)
+        recrawl_path = os.path.join(recrawl_dir, 'recrawl-mock-site.txt')
+        with open(recrawl_path, 'w') as f:
+            f.write('https://mock.com/recipe/kiev/\n\n'
+                    'https://mock.com/recipe/pie/\n')
+        spider = _make_spider(self.site, recrawl_urls=recrawl_path)
+
+        requests = list(spider.start_requests())
+
+        self.assertEqual(
+            ['https://mock.com/recipe/kiev/', 'https://mock.com/recipe/pie/'],
+            [r.url for r in requests])
+        self.assertEqual(spider.parse_recipe, requests[0].callback)
+        self.assertTrue(requests[0].dont_filter)
+
+
+class PaginationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.spider = _make_spider(
+            sites.Site(
+                name='mock-paginated-site',
+                allowed_domains=['mock.com'],
+                rules=[sites.LinkRule(allow=r'mock\.com/recipe/', recipe=True)],
+                pagination_url='https://mock.com/recipes?page={page}'))
+
+    def _listing_page(self, request, recipe_paths):
+        links = ''.join('<a href="/recipe/%s/">%s</a>' % (path, path)
+                        for path in recipe_paths)
+        response = http.HtmlResponse(request.url,
+                                     body=('<html>%s</html>' %
+                                           links).encode('utf8'),
+                                     request=request)
+        return list(request.callback(response))
+
+    def test_requests_next_pages_and_recipes_from_full_page(self):
+        first_page = list(self.spider.start_requests())
+
+        self.assertEqual(['https://mock.com/recipes?page=1'],
+                         [r.url for r in first_page])
+        self.assertEqual([
+            'https://mock.com/recipes?page=2',
+            'https://mock.com/recipe/kiev/',
+        ], [r.url for r in self._listing_page(first_page[0], ['kiev'])])
+
+    def test_stops_at_page_repeating_earlier_recipes(self):
+        first_page = list(self.spider.start_requests())[0]
+        second_page = self._listing_page(first_page, ['kiev'])[0]
+
+        self.assertEqual(
+            ['https://mock.com/recipe/kiev/'],
+            [r.url for r in self._listing_page(second_page, ['kiev'])])
+
+    def _failed_listing_page(self, request, failure):
+        failure.request = request
+        return [r.url for r in request.errback(failure)]
+
+    def test_reprobes_listing_pages_on_resume(self):
+        first_page = list(self.spider.start_requests())[0]
+
+        self.assertTrue(first_page.dont_filter)
+
+    def test_marks_listing_pages_for_discovery(self):
+        first_page = list(self.spider.start_requests())[0]
+
+        self.assertTrue(first_page.meta['discovery'])
+
+    def test_missing_page_ends_listing(self):
+        first_page = list(self.spider.start_requests())[0]
+        second_page = self._listing_page(first_page, ['kiev'])[0]
+        response = http.Response(second_page.url,
+                                 status=404,
+                                 request=second_page)
+
+        self.assertEqual([],
+                         self._failed_listing_page(
+                             second_page,
+                             failure.Failure(httperror.HttpError(response))))
+
+    def test_requests_page_again_after_download_error(self):
+        first_page = list(self.spider.start_requests())[0]
+
+        self.assertEqual(['https://mock.com/recipes?page=1'],
+                         self._failed_listing_page(
+                             first_page, failure.Failure(error.TimeoutError())))
+
+
+class CallbackHandlerTest(unittest.TestCase):
+
+    def test_process_callback_returns_recipe_item(self):
+        request = http.Request('https://www.mock.com/Mikes_Chicken_Kiev/',
+                               headers={'Referer': 'https://www.mock.com/'})
+        response = http.HtmlResponse(request.url,
+                                     headers={'ETag': '"abc123"'},
+                                     body=b'<html>Mock HTML</html>',
+                                     request=request)
+
+        item = spiders.CallbackHandler().process_callback(response)
+
+        self.assertEqual('mock-com_mikes-chicken-kiev', item['key'])
+        self.assertEqual(b'<html>Mock HTML</html>', item['html'])
+        self.assertEqual('https://www.mock.com/Mikes_Chicken_Kiev/',
+                         item['metadata']['url'])
+        self.assertEqual('"abc123"', item['metadata']['etag'])
+        self.assertIsNone(item['recipe'])
+
+    def test_process_callback_extracts_recipe(self):
+        request = http.Request('https://www.mock.com/kiev/')
+        response = http.HtmlResponse(
+            request.url,
+            body=b'<html><script type="application/ld+json">'
+            b'{"@type": "Recipe", "name": "Chicken Kiev"}</script></html>',
+            request=request)
+
+        item = spiders.CallbackHandler().process_callback(response)
+
+        self.assertEqual('Chicken Kiev', item['recipe']['name'])
+
+    def test_process_callback_keeps_fingerprint_of_unchanged_page(self):
+        request = http.Request('https://www.mock.com/kiev/',
+                               meta={
+                                   'previous_html_path': 'previous/index.html',
+                                   'previous_simhash': '00000000000000ff',
+                               })
+        response = http.HtmlResponse(request.url,
+                                     body=b'<html>Old</html>',
+                                     request=request)
+
+        item = spiders.CallbackHandler().process_callback(response)
+
+        self.assertIsNone(item['html'])
+        self.assertEqual('00000000000000ff', item['metadata']['simhash'])
+
+    def test_process_callback_reencodes_non_utf8_html_as_utf8(self):
+        request = http.Request('https://www.mock.com/cafe/')
+        response = http.HtmlResponse(request.url,
+                                     encoding='latin-1',
+                                     body=b'<html>Caf\xe9</html>',
+                                     request=request)
+
+        item = spiders.CallbackHandler().process_callback(response)
+
+        self.assertEqual(b'<html>Caf\xc3\xa9</html>', item['html'])
@@ -0,0 +1,105 @@
+import unittest
+
+import mock
+from scrapy import http
+from scrapy.settings import Settings
+
+from ketohub import throttle
+
+
+class AdaptiveThrottleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.crawler = mock.Mock()
+        self.crawler.settings = Settings({
+            'ADAPTIVE_THROTTLE_ENABLED': True,
+            'DOWNLOAD_DELAY': 1.0,
+            'ADAPTIVE_THROTTLE_MIN_DELAY': 0.5,
+            'ADAPTIVE_THROTTLE_MAX_DELAY': 60.0,
+            'ADAPTIVE_THROTTLE_MAX_CONCURRENCY': 2,
+            'ADAPTIVE_THROTTLE_TARGET_LATENCY': 2.0,
+            'ADAPTIVE_THROTTLE_REPORT_INTERVAL': 0,
+        })
+        self.slot = mock.Mock()
+        self.crawler.engine.downloader.slots = {'mock.com': self.slot}
+        self.spider = mock.Mock(min_download_delay=0.1, max_concurrency=4)
+        self.throttle = throttle.AdaptiveThrottle.from_crawler(self.crawler)
+        self.throttle._spider_opened(self.spider)
+
+    def _download(self, status=200, latency=0.1, headers=None):
+        request = http.Request('https://mock.com/kiev/',
+                               meta={
+                                   'download_slot': 'mock.com',
+                                   'download_latency': latency,
+                               })
+        response = http.Response(request.url,
+                                 status=status,
+                                 headers=headers,
+                                 request=request)
+        self.throttle._response_downloaded(response, request, self.spider)
+
+    def test_speeds_up_within_site_bounds(self):
+        for _ in range(50):
+            self._download()
+
+        self.assertEqual(4, self.slot.concurrency)
+        self.assertEqual(0.1, self.slot.delay)
+
+    def test_keeps_default_rate_for_site_without_bounds(self):
+        self.crawler.settings = Settings()
+        self.crawler.settings.setmodule('ketohub.settings')
+        self.throttle = throttle.AdaptiveThrottle.from_crawler(self.crawler)
+        self.throttle._spider_opened(
+            mock.Mock(min_download_delay=None, max_concurrency=None))
+
+        for _ in range(50):
+            self._download()
+
+        self.assertEqual(1, self.slot.concurrency)
+        self.assertEqual(1.0, self.slot.delay)
+
+    def test_adds_concurrency_once_per_round_of_successes(self):
+        self._download()
+        self.assertEqual(2, self.slot.concurrency)
+        self.assertEqual(0.75, self.slot.delay)
+
+        self._download()
+        self.assertEqual(2, self.slot.concurrency)
+
+        self._download()
+        self.assertEqual(3, self.slot.concurrency)
+
+    def test_backs_off_on_too_many_requests(self):
+        for _ in range(50):
+            self._download()
+
+        self._download(status=429)
+
+        self.assertEqual(2, self.slot.concurrency)
+        self.assertEqual(1.0, self.slot.delay)
+        self.crawler.stats.inc_value.assert_called_once_with(
+            'throttle/backoffs')
+
+    def test_honors_retry_after(self):
+        self._download(status=503, headers={'Retry-After': '30'})
+
+        self.assertEqual(1, self.slot.concurrency)
+        self.assertEqual(30.0, self.slot.delay)
+
+    def test_slows_down_on_high_latency(self):
+        self._download()
+        self._download(latency=5.0)
+
+        self.assertEqual(1, self.slot.concurrency)
+        self.assertAlmostEqual(1.125, self.slot.delay)
+
+    def test_records_effective_rate_on_close(self):
+        self._download()
+
+        self.throttle._spider_closed(self.spider, 'finished')
+
+        self.crawler.stats.set_value.assert_any_call('throttle/mock.com/rate',
+                                                     mock.ANY,
+                                                     spider=self.spider)
+        self.crawler.stats.set_value.assert_any_call(
+            'throttle/mock.com/concurrency', 2, spider=self.spider)
@@ -0,0 +1,191 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from ketohub import persist
+from ketohub import sites
+from ketohub import validate
+
+_RECIPE_JSON_LD = json.dumps({
+    '@context': 'https://schema.org',
+    '@type': 'Recipe',
+    'name': 'Chicken Kiev',
+})
+
+_RECIPE_HTML = ("""<!DOCTYPE html>
+<html><head><title>Chicken Kiev</title>
+<link rel="canonical" href="https://www.ruled.me/kiev/">
+<script type="application/ld+json">%s</script></head>
+<body><div class="recipe-card">%s</div></body></html>
+""" % (_RECIPE_JSON_LD, 'Butter. ' * 500)).encode('utf8')
+
+
+class CheckHtmlTest(unittest.TestCase):
+
+    def test_valid_recipe_page(self):
+        self.assertEqual([], validate.check_html(_RECIPE_HTML))
+
+    def test_small_page(self):
+        self.assertIn(validate.TOO_SMALL,
+                      validate.check_html(_RECIPE_HTML, min_size=100000))
+
+    def test_truncated_page(self):
+        self.assertIn(validate.TRUNCATED,
+                      validate.check_html(_RECIPE_HTML[:-20]))
+
+    def test_soft_404_page(self):
+        html = _RECIPE_HTML.replace(b'<title>Chicken Kiev</title>',
+                                    b'<title>Page Not Found - Mock</title>')
+
+        self.assertIn(validate.ERROR_PAGE, validate.check_html(html))
+
+    def test_challenge_page(self):
+        html = (b'<html><head><title>Just a moment...</title></head>'
+                b'<body>' + b'x' * 5000 + b'</body></html>')
+
+        self.assertEqual([validate.CHALLENGE_PAGE], validate.check_html(html))
+
+    def test_challenge_form_page(self):
+        html = (b'<html><head><title>mock.com</title></head><body>'
+                b'<form id="challenge-form" action="/kiev/">' + b'x' * 5000 +
+                b'</form></body></html>')
+
+        self.assertEqual([validate.CHALLENGE_PAGE], validate.check_html(html))
+
+    def test_page_with_cloudflare_detection_script(self):
+        html = _RECIPE_HTML.replace(
+            b'</body>', b'<script src="/cdn-cgi/challenge-platform/scripts/'
+            b'jsd/main.js"></script></body>')
+
+        self.assertEqual([], validate.check_html(html))
+
+    def test_page_without_recipe_json_ld(self):
+        html = _RECIPE_HTML.replace(b'"Recipe"', b'"WebPage"')
+
+        self.assertEqual([validate.NO_RECIPE_JSON_LD],
+                         validate.check_html(html))
+
+    def test_page_without_site_marker(self):
+        self.assertEqual([],
+                         validate.check_html(_RECIPE_HTML,
+                                             recipe_markers=['recipe-card']))
+        self.assertEqual([validate.MISSING_MARKER],
+                         validate.check_html(_RECIPE_HTML,
+                                             recipe_markers=['wprm-recipe']))
+
+
+class ValidateSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.snapshot_root = os.path.join(self.root, 'snapshot')
+        self.saver = persist.ContentSaver(self.snapshot_root)
+
+    def _save(self, key, url, html=None, **metadata):
+        self.saver.save_metadata(key, dict(metadata, url=url))
+        if html is not None:
+            self.saver.save_recipe_html(key, html)
+
+    def test_reports_failed_recipes(self):
+        self._save('ruled-me_kiev', 'https://www.ruled.me/kiev/', _RECIPE_HTML)
+        self._save('ruled-me_pie', 'https://www.ruled.me/pie/',
+                   _RECIPE_HTML[:1000])
+        self._save('ruled-me_kiev-amp',
+                   'https://www.ruled.me/kiev/amp/',
+                   duplicate_of='ruled-me_kiev')
+        self._save('ketovale-com_tart', 'https://www.ketovale.com/tart/')
+
+        report = validate.validate_snapshot(self.snapshot_root, processes=2)
+
+        self.assertEqual(4, report['checked'])
+        self.assertEqual(2, report['failed'])
+        self.assertEqual(
+            {
+                'url': 'https://www.ruled.me/pie/',
+                'reasons': [validate.TOO_SMALL, validate.TRUNCATED],
+            }, report['failures']['ruled-me_pie'])
+        self.assertEqual([validate.MISSING_HTML],
+                         report['failures']['ketovale-com_tart']['reasons'])
+        self.assertEqual(
+            {
+                validate.MISSING_HTML: 1,
+                validate.TOO_SMALL: 1,
+                validate.TRUNCATED: 1,
+            }, report['reasons'])
+
+    def test_reads_content_addressed_snapshot(self):
+        blob_root = os.path.join(self.root, 'blobs')
+        blob_store = persist.BlobStore(blob_root)
+        self.saver = persist.ContentSaver(self.snapshot_root,
+                                          write_file_fn=blob_store.write_file)
+        self._save('ruled-me_kiev', 'https://www.ruled.me/kiev/', _RECIPE_HTML)
+
+        self.assertEqual(('ruled-me_kiev', 'https://www.ruled.me/kiev/', []),
+                         validate.check_recipe(self.snapshot_root,
+                                               'ruled-me_kiev',
+                                               blob_root=blob_root))
+
+    def test_checks_site_recipe_markers(self):
+        self._save('ruled-me_kiev', 'https://www.ruled.me/kiev/', _RECIPE_HTML)
+        site = sites.Site(name='ruled-me',
+                          allowed_domains=['ruled.me'],
+                          recipe_markers=['wprm-recipe'])
+
+        with mock.patch.object(validate.sites, 'SITES', [site]):
+            _, _, reasons = validate.check_recipe(self.snapshot_root,
+                                                  'ruled-me_kiev')
+
+        self.assertEqual([validate.MISSING_MARKER], reasons)
+
+    def test_reports_page_from_another_site(self):
+        self._save('ruled-me_kiev', 'https://www.ruled.me/kiev/',
+                   _RECIPE_HTML.replace(b'ruled.me', b'example.com'))
+
+        _, _, reasons = validate.check_recipe(self.snapshot_root,
+                                              'ruled-me_kiev')
+
+        self.assertEqual([validate.MISSING_MARKER], reasons)
+
+
+class RecrawlListTest(unittest.TestCase):
+
+    def setUp(self):
+        self.recrawl_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.recrawl_dir)
+
+    def test_writes_failed_urls_per_spider(self):
+        report = {
+            'failures': {
+                'ruled-me_pie': {
+                    'url': 'https://www.ruled.me/pie/',
+                    'reasons': [validate.TRUNCATED],
+                },
+                'ruled-me_kiev': {
+                    'url': 'https://www.ruled.me/kiev/',
+                    'reasons': [validate.ERROR_PAGE],
+                },
+                'ketovale-com_tart': {
+                    'url': 'https://www.ketovale.com/tart/',
+                    'reasons': [validate.MISSING_HTML],
+                },
+                'unknown': {
+                    'url': None,
+                    'reasons': [validate.MISSING_METADATA],
+                },
+            }
+        }
+
+        counts = validate.write_recrawl_lists(report, self.recrawl_dir)
+
+        self.assertEqual({'ruled-me': 2, 'ketovale': 1}, counts)
+        recrawl_lists = validate.read_recrawl_lists(self.recrawl_dir)
+        self.assertEqual(['ketovale', 'ruled-me'], sorted(recrawl_lists))
+        with open(recrawl_lists['ruled-me']) as f:
+            self.assertEqual(
+                'https://www.ruled.me/kiev/\nhttps://www.ruled.me/pie/\n',
+                f.read())